@@ -0,0 +1,87 @@
+"""
+Agrupador de predicciones - CHOCOBREW
+Junta las filas que llegan casi al mismo tiempo en una sola llamada al modelo
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+AGRUPADOR_MAX_LOTE = int(os.environ.get('PREDICT_BATCH_MAX', 64))
+AGRUPADOR_ESPERA_MS = float(os.environ.get('PREDICT_BATCH_WAIT_MS', 5))
+
+
+class AgrupadorPredicciones:
+    """Cola de filas atendida por un hilo que predice en lotes de hasta max_lote.
+    funcion_prediccion recibe una matriz (n, 8) y devuelve un resultado por fila."""
+
+    def __init__(self, funcion_prediccion, max_lote=AGRUPADOR_MAX_LOTE,
+                 espera_max=AGRUPADOR_ESPERA_MS / 1000.0):
+        self.funcion_prediccion = funcion_prediccion
+        self.max_lote = max_lote
+        self.espera_max = espera_max
+        self.lotes_procesados = 0
+        self.filas_procesadas = 0
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def activo(self):
+        return self.max_lote > 1 and self.espera_max > 0
+
+    def _asegurar_hilo(self):
+        """Arranca el hilo en el proceso actual (los hilos no sobreviven al fork)"""
+        if self._hilo is not None and self._pid == os.getpid() and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._hilo is None or self._pid != os.getpid() or not self._hilo.is_alive():
+                self._cola = queue.Queue()
+                self._pid = os.getpid()
+                self._hilo = threading.Thread(target=self._bucle, name='agrupador-predicciones', daemon=True)
+                self._hilo.start()
+
+    def predecir(self, fila, timeout=None):
+        """Encola una fila de features y espera su predicción"""
+        if not self.activo:
+            return self.funcion_prediccion(np.asarray([fila], dtype=float))[0]
+
+        self._asegurar_hilo()
+        futuro = Future()
+        self._cola.put((fila, futuro))
+        return futuro.result(timeout)
+
+    def _bucle(self):
+        while True:
+            pendientes = [self._cola.get()]
+            limite = time.monotonic() + self.espera_max
+            while len(pendientes) < self.max_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    pendientes.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+
+            filas = np.asarray([fila for fila, _ in pendientes], dtype=float)
+            try:
+                resultados = self.funcion_prediccion(filas)
+            except Exception as e:
+                logger.error(f"Error en predicción agrupada: {e}")
+                for _, futuro in pendientes:
+                    futuro.set_exception(e)
+                continue
+
+            self.lotes_procesados += 1
+            self.filas_procesadas += len(pendientes)
+            for (_, futuro), resultado in zip(pendientes, resultados):
+                futuro.set_result(resultado)
@@ -1,43 +1,30 @@
-from flask import Flask, render_template, request, flash, redirect, url_for, session
+from flask import Flask, render_template, request, flash, redirect, url_for, session, jsonify, make_response, abort, Response, g
 import os
+import math
 import logging
 from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 import numpy as np
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone
 import io
-import base64
 import socket
+import csv
+import threading
+import time
+import hmac
+import hashlib
 
-try:
-    import psycopg2
-    from psycopg2.extras import RealDictCursor
-    from psycopg2 import Error
-    # psycopg2-binary ES psycopg2, solo el nombre del paquete es diferente
-    POSTGRES_AVAILABLE = True
-    print("✅ PostgreSQL disponible")
-except ImportError as e:
-    POSTGRES_AVAILABLE = False
-    print(f"⚠️ PostgreSQL no disponible: {e}")
-
-def get_db_connection():
-    if not POSTGRES_AVAILABLE:
-        print("🔄 Modo desarrollo - Sin base de datos")
-        return None
-    
-    try:
-        database_url = os.environ.get('DATABASE_URL')
-        if database_url:
-            connection = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
-            print("✅ Conectado a PostgreSQL")
-            return connection
-        else:
-            print("❌ DATABASE_URL no configurado")
-            return None
-    except Exception as e:
-        print(f"❌ Error conectando a PostgreSQL: {e}")
-        return None
+from db import conexion_bd, cursor_servidor, execute_values, Error
+from exportacion import FORMATOS_EXPORTACION, PARQUET_DISPONIBLE, columnas_sql, csv_por_bloques, parquet_por_bloques
+from agrupador_predicciones import AgrupadorPredicciones
+from bosque_compilado import BosqueCompilado, RUTA_BOSQUE
+from registro_modelos import version_actual, firma_version, cargar_version, activar_version, listar_versiones
+from cache_lru import CacheLRU
+from nutricion import calcular_tabla_nutricional, calcular_tabla_nutricional_columnas
+from trabajos_fondo import ColaTrabajos
+from bitacora import configurar_logging
+from metricas import REGISTRO, CUBETAS_FILAS
 
 # Función para obtener IP local automáticamente
 def obtener_ip_local():
@@ -56,48 +43,19 @@ app.secret_key = os.environ.get('SECRET_KEY', 'dev-key-change-in-production')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging (JSON, id de petición y duración; ver bitacora.py)
+configurar_logging(app)
 logger = logging.getLogger(__name__)
 
 # Importar QR Code
 try:
     import qrcode
+    import qrcode.image.svg
     QR_AVAILABLE = True
 except ImportError:
     QR_AVAILABLE = False
     logger.warning("qrcode no disponible. Instala: pip install qrcode[pil]")
 
-# Configuración PostgreSQL para Neon.tech
-try:
-    import psycopg2
-    from psycopg2.extras import RealDictCursor
-    from psycopg2 import Error
-    POSTGRES_AVAILABLE = True
-    print("🎯 psycopg2-binary instalado correctamente")
-except ImportError as e:
-    POSTGRES_AVAILABLE = False
-    print(f"❌ Error importando psycopg2: {e}")
-
-def get_db_connection():
-    if not POSTGRES_AVAILABLE:
-        print("🔧 Modo desarrollo - PostgreSQL no disponible")
-        return None
-    
-    try:
-        database_url = os.environ.get('DATABASE_URL')
-        if database_url:
-            print(f"🎯 Intentando conectar a: {database_url[:50]}...")
-            connection = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
-            print("✅ ¡CONEXIÓN EXITOSA a PostgreSQL!")
-            return connection
-        else:
-            print("❌ DATABASE_URL no configurado")
-            return None
-    except Exception as e:
-        print(f"❌ Error conectando a PostgreSQL: {e}")
-        return None
-
 # Decorador login
 def login_required(f):
     @wraps(f)
@@ -118,54 +76,366 @@ PROJECT_INFO = {
     'vida_util_dias': 120,
 }
 
-# Cargar modelo
-model = None
-scaler = None
-try:
-    import joblib
-    model = joblib.load('model/beer_model.pkl')
-    scaler = joblib.load('model/scaler.pkl')
-    logger.info("Modelo cargado exitosamente")
-except Exception as e:
-    logger.warning(f"Modelo no encontrado: {e}. Usando predicción simulada")
+# Lotes por página en /mis-lotes
+LOTES_POR_PAGINA = int(os.environ.get('LOTES_POR_PAGINA', 24))
+
+# Filas por viaje a PostgreSQL al exportar (cursor del lado del servidor)
+EXPORTACION_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', 2000))
+
+# Límite de filas por importación masiva
+MAX_LOTES_IMPORTACION = int(os.environ.get('MAX_LOTES_IMPORTACION', 5000))
+
+# Caché de páginas públicas de lotes (memoria y, opcionalmente, disco)
+PAGINA_PUBLICA_MAX_AGE = int(os.environ.get('PUBLIC_PAGE_MAX_AGE', 86400))
+PAGINA_PUBLICA_DIR = os.environ.get('PUBLIC_PAGE_CACHE_DIR', '')
+# El TTL acota cuánto tarda en verse un recálculo (python nutricion.py recalcular)
+cache_paginas_publicas = CacheLRU(max_entradas=int(os.environ.get('PUBLIC_PAGE_CACHE_SIZE', 2048)),
+                                  ttl=float(os.environ.get('PUBLIC_PAGE_CACHE_TTL', 3600)))
+# El HTML en disco se invalida solo si cambia la plantilla
+with open(os.path.join(app.root_path, 'templates', 'lote_publico.html'), 'rb') as _plantilla:
+    VERSION_PLANTILLA_PUBLICA = hashlib.sha1(_plantilla.read()).hexdigest()[:12]
+
+# Códigos QR: se generan bajo demanda en /qr/<id>.png|svg (la BD no guarda imágenes)
+QR_FORMATOS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+QR_MAX_AGE = int(os.environ.get('QR_MAX_AGE', 86400))
+QR_CACHE_DIR = os.environ.get('QR_CACHE_DIR', '')
+cache_qr = CacheLRU(max_entradas=int(os.environ.get('QR_CACHE_SIZE', 1024)))
+# Hilos que generan el QR de cada lote nuevo mientras se responde el formulario (0 desactiva)
+QR_ESPERA_MAXIMA = float(os.environ.get('QR_WAIT_TIMEOUT', 10))
+trabajos_qr = ColaTrabajos(max_hilos=int(os.environ.get('QR_WORKERS', 2)), nombre='qr')
+
+# Métricas (ver /metrics)
+ETAPAS_LOTE = REGISTRO.histograma(
+    'chocobrew_procesar_lote_etapa_segundos', 'Duración de cada etapa de procesar_lote', ('etapa',))
+INFERENCIA_SEGUNDOS = REGISTRO.histograma(
+    'chocobrew_inferencia_segundos', 'Duración de cada llamada al modelo', ('motor',))
+INFERENCIA_FILAS = REGISTRO.histograma(
+    'chocobrew_inferencia_filas', 'Filas por llamada al modelo', ('motor',), cubetas=CUBETAS_FILAS)
+GENERACION_QR = REGISTRO.histograma(
+    'chocobrew_qr_generacion_segundos', 'Duración de la generación de un QR', ('formato',))
+PETICIONES_SEGUNDOS = REGISTRO.histograma(
+    'chocobrew_peticion_segundos', 'Duración de las peticiones por endpoint', ('endpoint', 'metodo'))
+PETICIONES_TOTAL = REGISTRO.contador(
+    'chocobrew_peticiones_total', 'Peticiones por endpoint y estado HTTP', ('endpoint', 'estado'))
+
+# Modelo: se carga en la primera predicción para que los workers arranquen rápido
+# y se recarga en caliente cuando cambia la versión activa (model/ACTUAL) o su
+# contenido (sustituto o tabla agregados después de publicarla)
+MODELO_INTERVALO_RECARGA = float(os.environ.get('MODEL_RELOAD_INTERVAL', 30))
+# Con 'bosque' (por defecto) se predice siempre con el bosque compilado. Con 'sustituto',
+# con el modelo destilado de la versión si alcanza MODEL_SURROGATE_MIN_AGREEMENT; con
+# 'tabla', leyendo la celda de la rejilla precalculada (python tabla_prediccion.py construir)
+# si su error máximo no pasa de MODEL_TABLE_MAX_ERROR. En ambos casos el bosque se usa si
+# se pide (modelo=completo en la API) o si la versión no trae uno que cumpla
+MODO_SERVICIO = os.environ.get('MODEL_SERVING', 'bosque').lower()
+modelo_actual = None
+_modelo_lock = threading.Lock()
+_ultima_verificacion = 0.0
+
+def cargar_modelo_sin_registro():
+    """Artefactos sueltos de model/: bosque compilado (mmap) o, si no existe, los .pkl"""
+    try:
+        bosque = BosqueCompilado.desde_archivo(RUTA_BOSQUE)
+        logger.info(f"Bosque compilado cargado ({bosque.n_arboles} árboles)")
+        return {'version': 'legacy', 'bosque': bosque, 'sustituto': None, 'tabla': None, 'model': None, 'scaler': None, 'metadata': {}}
+    except Exception as e:
+        logger.info(f"Bosque compilado no disponible ({e}), se usa scikit-learn")
+    
+    try:
+        import joblib
+        model = joblib.load('model/beer_model.pkl', mmap_mode='r')
+        scaler = joblib.load('model/scaler.pkl')
+        logger.info("Modelo cargado exitosamente")
+        return {'version': 'legacy', 'bosque': None, 'sustituto': None, 'tabla': None, 'model': model, 'scaler': scaler, 'metadata': {}}
+    except Exception as e:
+        logger.warning(f"Modelo no encontrado: {e}. Usando predicción simulada")
+        return {'version': None, 'bosque': None, 'sustituto': None, 'tabla': None, 'model': None, 'scaler': None, 'metadata': {}}
+
+def cargar_modelo(version):
+    if version:
+        modelo = cargar_version(version)
+        logger.info(f"Modelo {version} cargado ({modelo['bosque'].n_arboles} árboles)")
+        return modelo
+    return cargar_modelo_sin_registro()
+
+def recargar_modelo(forzar=False):
+    """Carga la versión activa y la intercambia de forma atómica.
+    Mientras carga, las peticiones siguen usando el modelo anterior."""
+    global modelo_actual, _ultima_verificacion
+    if not _modelo_lock.acquire(blocking=forzar or modelo_actual is None):
+        return modelo_actual
+    try:
+        _ultima_verificacion = time.monotonic()
+        version = version_actual()
+        firma = firma_version(version) if version else None
+        if (not forzar and modelo_actual is not None
+                and (modelo_actual['version'], modelo_actual.get('firma')) == (version, firma)):
+            return modelo_actual
+        try:
+            modelo_actual = cargar_modelo(version)
+        except Exception as e:
+            logger.error(f"No se pudo cargar el modelo {version}: {e}")
+            if modelo_actual is None:
+                modelo_actual = cargar_modelo_sin_registro()
+        return modelo_actual
+    finally:
+        _modelo_lock.release()
+
+def obtener_modelo():
+    modelo = modelo_actual
+    if modelo is None:
+        return recargar_modelo()
+    if MODELO_INTERVALO_RECARGA > 0 and time.monotonic() - _ultima_verificacion > MODELO_INTERVALO_RECARGA:
+        return recargar_modelo()
+    return modelo
     
 # =====================================================
 # FUNCIONES AUXILIARES
 # =====================================================
 
-def calcular_tabla_nutricional(abv, porcentaje_cacao, og):
-    """Calcula valores nutricionales aproximados por 100ml"""
-    calorias = (og - 1) * 1000 * 4 + (abv * 7)
-    carbohidratos = (og - 1) * 1000 * 0.8
-    proteinas = 0.3 + (porcentaje_cacao * 0.1)
-    grasas = porcentaje_cacao * 0.15
-    azucares = carbohidratos * 0.6
+# Orden de las variables con el que se entrenó el modelo
+FEATURES_MODELO = [
+    'abv', 'ibu', 'srm', 'og', 'fg',
+    'porcentaje_cacao', 'dias_fermentacion', 'dias_maduracion'
+]
+
+# Límites de las columnas de lotes_chocobrew (migraciones 0001 y 0003): (precisión, escala)
+# de NUMERIC o None para INTEGER. Un valor fuera de rango abortaría el INSERT de todo el lote.
+LARGO_CODIGO_LOTE = 50
+LIMITES_COLUMNAS = {
+    'abv': (4, 2), 'og': (5, 3), 'fg': (5, 3), 'porcentaje_cacao': (4, 2),
+    'ibu': None, 'srm': None, 'dias_fermentacion': None, 'dias_maduracion': None,
+    'calorias': None, 'carbohidratos': (5, 1), 'proteinas': (5, 1), 'grasas': (5, 1), 'azucares': (5, 1),
+}
+
+class DatosLoteInvalidos(ValueError):
+    """Los datos de un lote no pasan las validaciones del formulario"""
+
+def leer_numero(fuente, campo, tipo=float):
+    """Convierte un campo numérico y rechaza NaN e infinitos"""
+    try:
+        valor = tipo(fuente.get(campo, 0))
+    except OverflowError:
+        valor = math.inf
+    if not math.isfinite(valor):
+        raise DatosLoteInvalidos(f'{campo} debe ser un número finito')
+    return valor
+
+def validar_columnas(valores):
+    """Verifica que cada valor quepa en su columna de lotes_chocobrew"""
+    for columna, valor in valores.items():
+        if columna not in LIMITES_COLUMNAS:
+            continue
+        limite = LIMITES_COLUMNAS[columna]
+        if limite is None:
+            if not -2**31 <= valor < 2**31:
+                raise DatosLoteInvalidos(f'{columna} fuera del rango que admite la base de datos (INTEGER)')
+        elif abs(round(valor, limite[1])) >= 10 ** (limite[0] - limite[1]):
+            raise DatosLoteInvalidos(f'{columna} fuera del rango que admite la base de datos '
+                                     f'(menor que {10 ** (limite[0] - limite[1])})')
+
+def leer_features_lote(fuente):
+    """Convierte y valida las 8 variables del modelo"""
+    features = {
+        'abv': leer_numero(fuente, 'abv'),
+        'ibu': leer_numero(fuente, 'ibu'),
+        'srm': leer_numero(fuente, 'srm'),
+        'og': leer_numero(fuente, 'og'),
+        'fg': leer_numero(fuente, 'fg'),
+        'porcentaje_cacao': leer_numero(fuente, 'porcentaje_cacao'),
+        'dias_fermentacion': leer_numero(fuente, 'dias_fermentacion', int),
+        'dias_maduracion': leer_numero(fuente, 'dias_maduracion', int),
+    }
     
-    return {
-        'calorias': round(calorias),
-        'carbohidratos': round(carbohidratos, 1),
-        'proteinas': round(proteinas, 1),
-        'grasas': round(grasas, 1),
-        'azucares': round(azucares, 1),
-        'alcohol': round(abv, 1)
+    if features['fg'] >= features['og']:
+        raise DatosLoteInvalidos('Error: La densidad final (FG) debe ser menor que la inicial (OG)')
+    
+    return features
+
+def leer_datos_lote(fuente):
+    """Convierte y valida los campos de un lote (formulario, fila CSV o JSON)"""
+    datos = {
+        'codigo_lote': str(fuente.get('codigo_lote') or '').strip(),
+        'fecha_elaboracion': str(fuente.get('fecha_elaboracion') or '').strip(),
     }
+    
+    if not datos['codigo_lote'] or not datos['fecha_elaboracion']:
+        raise DatosLoteInvalidos('Código de lote y fecha son obligatorios')
+    if len(datos['codigo_lote']) > LARGO_CODIGO_LOTE:
+        raise DatosLoteInvalidos(f'El código de lote admite hasta {LARGO_CODIGO_LOTE} caracteres')
+    
+    datos.update(leer_features_lote(fuente))
+    # También la tabla nutricional que se guardará con el lote
+    validar_columnas(dict(datos, **calcular_tabla_nutricional(datos['abv'], datos['porcentaje_cacao'], datos['og'])))
+    
+    # Calcular fecha de vencimiento
+    fecha_elab = datetime.strptime(datos['fecha_elaboracion'], '%Y-%m-%d')
+    fecha_venc = fecha_elab + timedelta(days=PROJECT_INFO['vida_util_dias'])
+    datos['fecha_vencimiento'] = fecha_venc.strftime('%Y-%m-%d')
+    
+    return datos
 
-def generar_codigo_qr(lote_id):
-    """Genera código QR con URL accesible desde red local"""
-    if not QR_AVAILABLE:
+def prediccion_formula(features):
+    """Fórmula basada en cacao usada cuando el modelo no está disponible"""
+    abv, ibu = features[:, 0], features[:, 1]
+    porcentaje_cacao, dias_maduracion = features[:, 5], features[:, 7]
+    prediccion = 2.5 + (abv * 0.08) + (porcentaje_cacao * 0.15) - (ibu * 0.008) + (dias_maduracion * 0.02)
+    return np.clip(prediccion, 0, 5)
+
+def predictor_rapido(modelo, completo=False):
+    """'sustituto' o 'tabla' si el modo de servicio lo pide y la versión lo tiene; si no, None"""
+    if completo or MODO_SERVICIO not in ('sustituto', 'tabla') or modelo.get(MODO_SERVICIO) is None:
         return None
+    return MODO_SERVICIO
+
+def version_servida(modelo, completo=False):
+    """Versión con la que se registran las predicciones (sustituto y tabla llevan sufijo)"""
+    motor = predictor_rapido(modelo, completo)
+    if motor:
+        return f"{modelo['version']}-{motor}"
+    return modelo['version']
+
+def predecir_puntuaciones(features, completo=False):
+    """Predice la puntuación (0-5) de una matriz de lotes (n, 8) en una sola llamada.
+    Con completo=True usa el bosque aunque la versión tenga sustituto o tabla.
+    Devuelve (predicciones, versión del modelo que las produjo)."""
+    features = np.asarray(features, dtype=float)
+    modelo = obtener_modelo()
+    inicio = time.perf_counter()
+    predicciones, version, motor = None, 'formula', 'formula'
     
-    # En producción, usar la URL real de Render
-    if os.environ.get('RENDER'):
+    rapido = predictor_rapido(modelo, completo)
+    if rapido:
+        try:
+            predicciones, version, motor = modelo[rapido].predecir(features), version_servida(modelo), rapido
+        except Exception as e:
+            logger.error(f"Error en predicción ({rapido}): {e}")
+    
+    if predicciones is None and modelo['bosque'] is not None:
+        try:
+            predicciones, version, motor = modelo['bosque'].predecir(features), modelo['version'], 'bosque'
+        except Exception as e:
+            logger.error(f"Error en predicción del bosque compilado: {e}")
+    elif predicciones is None and modelo['model'] and modelo['scaler']:
+        try:
+            predicciones = modelo['model'].predict(modelo['scaler'].transform(features)).astype(float)
+            version, motor = modelo['version'], 'sklearn'
+        except Exception as e:
+            logger.error(f"Error en predicción ML: {e}")
+    elif predicciones is None:
+        logger.warning("Modelo no disponible, usando fórmula basada en cacao")
+    
+    if predicciones is None:
+        predicciones = prediccion_formula(features)
+    
+    INFERENCIA_SEGUNDOS.observar(time.perf_counter() - inicio, motor=motor)
+    INFERENCIA_FILAS.observar(len(features), motor=motor)
+    return predicciones, version
+
+def predecir_filas(features):
+    """(predicción, versión) por fila con el bosque, para el agrupador"""
+    predicciones, version = predecir_puntuaciones(features, completo=True)
+    return [(float(prediccion), version) for prediccion in predicciones]
+
+# Peticiones concurrentes que van al bosque comparten una sola llamada al modelo
+agrupador = AgrupadorPredicciones(predecir_filas)
+
+# Recetas repetidas no vuelven a pasar por el modelo
+cache_predicciones = CacheLRU(
+    max_entradas=int(os.environ.get('PREDICT_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('PREDICT_CACHE_TTL', 3600))
+)
+
+# Decimales con los que se cuantiza cada variable (resolución del formulario)
+DECIMALES_FEATURES = {
+    'abv': 2, 'ibu': 1, 'srm': 1, 'og': 4, 'fg': 4,
+    'porcentaje_cacao': 2, 'dias_fermentacion': 0, 'dias_maduracion': 0
+}
+
+def predecir_puntuacion(features, completo=False):
+    """Predicción de un solo lote: caché por receta y, si falla, el agrupador cuando
+    predice el bosque (completo=True o sin sustituto/tabla en servicio); sustituto y
+    tabla tardan menos que la espera del agrupador y predicen directo.
+    Devuelve (predicción, versión)."""
+    fila = tuple(round(float(features[campo]), DECIMALES_FEATURES[campo]) for campo in FEATURES_MODELO)
+    modelo = obtener_modelo()
+    clave = (version_servida(modelo, completo), fila)
+    
+    resultado = cache_predicciones.obtener(clave)
+    if resultado is None:
+        if predictor_rapido(modelo, completo):
+            predicciones, version = predecir_puntuaciones([fila])
+            resultado = (float(predicciones[0]), version)
+        else:
+            resultado = agrupador.predecir(list(fila))
+        cache_predicciones.guardar((resultado[1], fila), resultado)
+    return resultado
+
+def clasificar_calidad(prediccion):
+    """Categoría comercial según la puntuación predicha"""
+    if prediccion >= 4.5:
+        return "Premium"
+    elif prediccion >= 4.0:
+        return "Excelente"
+    elif prediccion >= 3.5:
+        return "Muy Buena"
+    elif prediccion >= 3.0:
+        return "Buena"
+    return "Regular"
+
+def armar_datos_lote(datos, prediccion, nutricional, version_modelo=None):
+    """Estructura del lote usada por las plantillas y guardar_lote_en_bd"""
+    return {
+        'codigo_lote': datos['codigo_lote'],
+        'fecha_elaboracion': datos['fecha_elaboracion'],
+        'fecha_vencimiento': datos['fecha_vencimiento'],
+        'abv': float(datos['abv']),
+        'ibu': int(datos['ibu']),
+        'srm': int(datos['srm']),
+        'og': float(datos['og']),
+        'fg': float(datos['fg']),
+        'porcentaje_cacao': float(datos['porcentaje_cacao']),
+        'dias_fermentacion': int(datos['dias_fermentacion']),
+        'dias_maduracion': int(datos['dias_maduracion']),
+        'puntuacion': float(round(prediccion, 2)),
+        'categoria': clasificar_calidad(prediccion),
+        'nutricional': nutricional,
+        'version_modelo': version_modelo,
+        'id': None,
+        'qr_url': None
+    }
+
+def resolver_url_base():
+    """URL pública de la app: PUBLIC_BASE_URL, la de Render o la IP local (red WiFi)"""
+    base_url = os.environ.get('PUBLIC_BASE_URL')
+    if not base_url and os.environ.get('RENDER'):
         # En Render, usar la URL del deploy
-        base_url = os.environ.get('RENDER_EXTERNAL_URL', f"http://{obtener_ip_local()}:5000")
-    else:
+        base_url = os.environ.get('RENDER_EXTERNAL_URL')
+    if not base_url:
         # En desarrollo local
         base_url = f"http://{obtener_ip_local()}:5000"
-    
-    url_lote = f"{base_url}/lote-publico/{lote_id}"
-    
-    logger.info(f"Generando QR con URL: {url_lote}")
+    return base_url.rstrip('/')
+
+_prefijo_url_lote = None
+
+def refrescar_url_base():
+    """Vuelve a resolver la URL base (p. ej. tras cambiar de red)"""
+    global _prefijo_url_lote
+    _prefijo_url_lote = f"{resolver_url_base()}/lote-publico/"
+    logger.info(f"URL pública de los lotes: {_prefijo_url_lote}<id>")
+    return _prefijo_url_lote
+
+def url_publica_lote(lote_id):
+    """URL que codifica el QR; el prefijo se resuelve una vez y se reutiliza"""
+    return f"{_prefijo_url_lote}{lote_id}"
+
+# Resolver la URL al arrancar: generar un QR no abre sockets
+refrescar_url_base()
+
+def generar_codigo_qr(url, formato='png'):
+    """Imagen QR (bytes PNG o SVG); la misma URL produce siempre los mismos bytes"""
+    logger.debug("Generando QR (%s) con URL: %s", formato, url)
+    inicio = time.perf_counter()
     
     qr = qrcode.QRCode(
         version=1,
@@ -173,79 +443,277 @@ def generar_codigo_qr(lote_id):
         box_size=10,
         border=4
     )
-    qr.add_data(url_lote)
+    qr.add_data(url)
     qr.make(fit=True)
     
-    img = qr.make_image(fill_color="black", back_color="white")
+    if formato == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
     
     buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    img_base64 = base64.b64encode(buffer.getvalue()).decode()
-    
-    return img_base64
+    img.save(buffer)
+    GENERACION_QR.observar(time.perf_counter() - inicio, formato=formato)
+    return buffer.getvalue()
 
-def guardar_lote_en_bd(datos_lote, user_id):
-    """Guarda el lote completo en PostgreSQL"""
-    connection = get_db_connection()
-    if not connection:
-        logger.warning("No se pudo conectar a la base de datos")
+def renderizar_qr(url, formato):
+    """Genera el QR y lo deja en la caché de memoria y de disco"""
+    entrada = crear_entrada_cache(generar_codigo_qr(url, formato))
+    guardar_cache_en_disco(ruta_qr_en_disco(url, formato), entrada)
+    cache_qr.guardar((url, formato), entrada)
+    return entrada
+
+def encolar_qr(lote_id, formato='png'):
+    """Genera el QR de un lote recién guardado en segundo plano"""
+    if QR_AVAILABLE and trabajos_qr.activa:
+        url = url_publica_lote(lote_id)
+        trabajos_qr.encolar((url, formato), renderizar_qr, url, formato)
+
+def url_qr_lote(lote_id, formato='png'):
+    """Ruta de la imagen QR de un lote (None si qrcode no está instalado)"""
+    if not QR_AVAILABLE:
         return None
-    
-    try:
-        cursor = connection.cursor()
-        
-        query = """
-        INSERT INTO lotes_chocobrew (
-            user_id, codigo_lote, fecha_elaboracion, fecha_vencimiento,
-            abv, ibu, srm, og, fg, porcentaje_cacao,
-            dias_fermentacion, dias_maduracion, puntuacion, categoria,
-            calorias, carbohidratos, proteinas, grasas, azucares,
-            qr_code_base64
-        ) VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-        ) RETURNING id
-        """
-        
-        valores = (
-            int(user_id),
-            str(datos_lote['codigo_lote']),
-            str(datos_lote['fecha_elaboracion']),
-            str(datos_lote['fecha_vencimiento']),
-            float(datos_lote['abv']),
-            int(datos_lote['ibu']),
-            int(datos_lote['srm']),
-            float(datos_lote['og']),
-            float(datos_lote['fg']),
-            float(datos_lote['porcentaje_cacao']),
-            int(datos_lote['dias_fermentacion']),
-            int(datos_lote['dias_maduracion']),
-            float(datos_lote['puntuacion']),
-            str(datos_lote['categoria']),
-            int(datos_lote['nutricional']['calorias']),
-            float(datos_lote['nutricional']['carbohidratos']),
-            float(datos_lote['nutricional']['proteinas']),
-            float(datos_lote['nutricional']['grasas']),
-            float(datos_lote['nutricional']['azucares']),
-            datos_lote.get('qr_code')
-        )
-        
-        cursor.execute(query, valores)
-        connection.commit()
-        
-        lote_id = cursor.fetchone()['id']
-        logger.info(f"Lote guardado en BD con ID: {lote_id}")
+    return url_for('qr_lote', lote_id=lote_id, formato=formato)
+
+def lote_existe(lote_id):
+    """True/False según la BD; None si no hay conexión"""
+    with conexion_bd() as connection:
+        if not connection:
+            return None
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1 FROM lotes_chocobrew WHERE id = %s", (lote_id,))
+            return cursor.fetchone() is not None
+        except Error as e:
+            logger.error(f"Error verificando lote: {e}")
+            return None
+        finally:
+            cursor.close()
+
+class LoteDuplicado(Exception):
+    """El código de lote ya existe en lotes_chocobrew"""
+
+# Suma los lotes recién insertados a resumen_lotes (migración 0005)
+SQL_ACTUALIZAR_RESUMEN = """
+INSERT INTO resumen_lotes (user_id, mes, categoria, tramo_cacao, lotes, suma_puntuacion)
+SELECT user_id,
+       date_trunc('month', fecha_elaboracion)::date,
+       COALESCE(categoria, ''),
+       COALESCE(floor(porcentaje_cacao), 0)::smallint,
+       COUNT(*),
+       COALESCE(SUM(puntuacion), 0)
+FROM lotes_chocobrew
+WHERE id = ANY(%s)
+GROUP BY 1, 2, 3, 4
+ON CONFLICT (user_id, mes, categoria, tramo_cacao) DO UPDATE
+SET lotes = resumen_lotes.lotes + EXCLUDED.lotes,
+    suma_puntuacion = resumen_lotes.suma_puntuacion + EXCLUDED.suma_puntuacion
+"""
+
+def guardar_lote_en_bd(datos_lote, user_id):
+    """Guarda el lote completo en una sola sentencia; devuelve su ID"""
+    with conexion_bd() as connection:
+        if not connection:
+            logger.warning("No se pudo conectar a la base de datos")
+            return None
         
-        return lote_id
+        try:
+            cursor = connection.cursor()
+            
+            query = """
+            INSERT INTO lotes_chocobrew (
+                user_id, codigo_lote, fecha_elaboracion, fecha_vencimiento,
+                abv, ibu, srm, og, fg, porcentaje_cacao,
+                dias_fermentacion, dias_maduracion, puntuacion, categoria,
+                calorias, carbohidratos, proteinas, grasas, azucares,
+                version_modelo
+            ) VALUES (
+                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+            )
+            ON CONFLICT (codigo_lote) DO NOTHING
+            RETURNING id
+            """
+            
+            valores = (
+                int(user_id),
+                str(datos_lote['codigo_lote']),
+                str(datos_lote['fecha_elaboracion']),
+                str(datos_lote['fecha_vencimiento']),
+                float(datos_lote['abv']),
+                int(datos_lote['ibu']),
+                int(datos_lote['srm']),
+                float(datos_lote['og']),
+                float(datos_lote['fg']),
+                float(datos_lote['porcentaje_cacao']),
+                int(datos_lote['dias_fermentacion']),
+                int(datos_lote['dias_maduracion']),
+                float(datos_lote['puntuacion']),
+                str(datos_lote['categoria']),
+                int(datos_lote['nutricional']['calorias']),
+                float(datos_lote['nutricional']['carbohidratos']),
+                float(datos_lote['nutricional']['proteinas']),
+                float(datos_lote['nutricional']['grasas']),
+                float(datos_lote['nutricional']['azucares']),
+                datos_lote.get('version_modelo')
+            )
+            
+            cursor.execute(query, valores)
+            insertado = cursor.fetchone()
+            if insertado:
+                cursor.execute(SQL_ACTUALIZAR_RESUMEN, ([insertado['id']],))
+            connection.commit()
+            
+            if not insertado:
+                raise LoteDuplicado(datos_lote['codigo_lote'])
+            
+            lote_id = insertado['id']
+            logger.info(f"Lote guardado en BD con ID: {lote_id}")
+            
+            return lote_id
+            
+        except Error as e:
+            logger.error(f"Error guardando lote en BD: {e}")
+            connection.rollback()
+            return None
+        finally:
+            cursor.close()
+
+def guardar_lotes_en_bd(lotes, user_id):
+    """Guarda varios lotes con un único INSERT multi-fila; devuelve {codigo_lote: id}"""
+    with conexion_bd() as connection:
+        if not connection:
+            logger.warning("No se pudo conectar a la base de datos")
+            return None
         
-    except Error as e:
-        logger.error(f"Error guardando lote en BD: {e}")
-        connection.rollback()
+        try:
+            cursor = connection.cursor()
+            
+            valores = []
+            for datos_lote in lotes:
+                nutricional = datos_lote['nutricional']
+                valores.append((
+                    int(user_id),
+                    datos_lote['codigo_lote'],
+                    datos_lote['fecha_elaboracion'],
+                    datos_lote['fecha_vencimiento'],
+                    datos_lote['abv'],
+                    datos_lote['ibu'],
+                    datos_lote['srm'],
+                    datos_lote['og'],
+                    datos_lote['fg'],
+                    datos_lote['porcentaje_cacao'],
+                    datos_lote['dias_fermentacion'],
+                    datos_lote['dias_maduracion'],
+                    datos_lote['puntuacion'],
+                    datos_lote['categoria'],
+                    nutricional['calorias'],
+                    nutricional['carbohidratos'],
+                    nutricional['proteinas'],
+                    nutricional['grasas'],
+                    nutricional['azucares'],
+                    datos_lote['version_modelo']
+                ))
+            
+            query = """
+            INSERT INTO lotes_chocobrew (
+                user_id, codigo_lote, fecha_elaboracion, fecha_vencimiento,
+                abv, ibu, srm, og, fg, porcentaje_cacao,
+                dias_fermentacion, dias_maduracion, puntuacion, categoria,
+                calorias, carbohidratos, proteinas, grasas, azucares,
+                version_modelo
+            ) VALUES %s
+            ON CONFLICT (codigo_lote) DO NOTHING
+            RETURNING id, codigo_lote
+            """
+            
+            insertados = execute_values(cursor, query, valores, page_size=len(valores), fetch=True)
+            if insertados:
+                cursor.execute(SQL_ACTUALIZAR_RESUMEN, ([fila['id'] for fila in insertados],))
+            connection.commit()
+            
+            logger.info(f"Importación: {len(insertados)} de {len(lotes)} lotes guardados")
+            return {fila['codigo_lote']: fila['id'] for fila in insertados}
+            
+        except Error as e:
+            logger.error(f"Error guardando lotes en BD: {e}")
+            connection.rollback()
+            return None
+        finally:
+            cursor.close()
+
+def leer_filas_importacion():
+    """Filas a importar desde un JSON (lista o {"lotes": [...]}) o un CSV subido"""
+    if request.is_json:
+        cuerpo = request.get_json(silent=True)
+        if isinstance(cuerpo, dict):
+            cuerpo = cuerpo.get('lotes')
+        if not isinstance(cuerpo, list):
+            raise ValueError('El JSON debe ser una lista de lotes o {"lotes": [...]}')
+        return cuerpo
+    
+    archivo = request.files.get('archivo')
+    if not archivo or not archivo.filename:
+        raise ValueError('Adjunta un archivo CSV en el campo "archivo"')
+    
+    texto = archivo.stream.read().decode('utf-8-sig')
+    lector = csv.DictReader(io.StringIO(texto))
+    return [{(clave or '').strip().lower(): valor for clave, valor in fila.items()} for fila in lector]
+
+def crear_entrada_cache(contenido, modificado=None):
+    """(bytes, etag, última modificación) de una respuesta cacheable"""
+    modificado = (modificado or datetime.now(timezone.utc)).replace(microsecond=0)
+    if modificado.tzinfo is None:
+        modificado = modificado.replace(tzinfo=timezone.utc)
+    return contenido, hashlib.sha1(contenido).hexdigest(), modificado
+
+def leer_cache_en_disco(ruta):
+    if not ruta:
         return None
-    finally:
-        cursor.close()
-        connection.close()
+    try:
+        with open(ruta, 'rb') as archivo:
+            contenido = archivo.read()
+        modificado = datetime.fromtimestamp(os.path.getmtime(ruta), timezone.utc)
+    except OSError:
+        return None
+    return contenido, hashlib.sha1(contenido).hexdigest(), modificado
+
+def guardar_cache_en_disco(ruta, entrada):
+    """Escritura atómica; la fecha del archivo guarda el Last-Modified"""
+    if not ruta:
+        return
+    contenido, _, modificado = entrada
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, 'wb') as archivo:
+            archivo.write(contenido)
+        os.utime(temporal, (modificado.timestamp(), modificado.timestamp()))
+        os.replace(temporal, ruta)
+    except OSError as e:
+        logger.warning(f"No se pudo guardar {ruta} en caché de disco: {e}")
+
+def ruta_pagina_publica(lote_id):
+    if not PAGINA_PUBLICA_DIR:
+        return None
+    return os.path.join(PAGINA_PUBLICA_DIR, VERSION_PLANTILLA_PUBLICA, f"lote-{lote_id}.html")
+
+def ruta_qr_en_disco(url, formato):
+    if not QR_CACHE_DIR:
+        return None
+    return os.path.join(QR_CACHE_DIR, f"qr-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.{formato}")
+
+def respuesta_cacheable(entrada, max_age, mimetype=None):
+    """Respuesta con ETag, Last-Modified y Cache-Control largo (304 si el cliente ya la tiene)"""
+    contenido, etag, modificado = entrada
+    response = make_response(contenido)
+    if mimetype:
+        response.mimetype = mimetype
+    response.set_etag(etag)
+    response.last_modified = modificado
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
 
 # =====================================================
 # MANEJADORES DE ERRORES
@@ -284,33 +752,32 @@ def login():
             flash('Completa todos los campos', 'danger')
             return render_template('login.html')
         
-        connection = get_db_connection()
-        if connection:
-            try:
-                cursor = connection.cursor()
-                cursor.execute("SELECT * FROM usuarios WHERE email = %s", (email,))
-                user = cursor.fetchone()
-                
-                if user and check_password_hash(user['password'], password):
-                    session['user_id'] = user['id']
-                    session['user_name'] = user['nombre']
-                    session['user_email'] = user['email']
-                    
-                    if remember:
-                        session.permanent = True
+        with conexion_bd() as connection:
+            if connection:
+                try:
+                    cursor = connection.cursor()
+                    cursor.execute("SELECT * FROM usuarios WHERE email = %s", (email,))
+                    user = cursor.fetchone()
                     
-                    flash(f'¡Bienvenido {user["nombre"]}!', 'success')
-                    return redirect(url_for('index'))
-                else:
-                    flash('Correo o contraseña incorrectos', 'danger')
-            except Error as e:
-                logger.error(f"Error login: {e}")
-                flash('Error al iniciar sesión', 'danger')
-            finally:
-                cursor.close()
-                connection.close()
-        else:
-            flash('Error de conexión a la base de datos', 'danger')
+                    if user and check_password_hash(user['password'], password):
+                        session['user_id'] = user['id']
+                        session['user_name'] = user['nombre']
+                        session['user_email'] = user['email']
+                        
+                        if remember:
+                            session.permanent = True
+                        
+                        flash(f'¡Bienvenido {user["nombre"]}!', 'success')
+                        return redirect(url_for('index'))
+                    else:
+                        flash('Correo o contraseña incorrectos', 'danger')
+                except Error as e:
+                    logger.error(f"Error login: {e}")
+                    flash('Error al iniciar sesión', 'danger')
+                finally:
+                    cursor.close()
+            else:
+                flash('Error de conexión a la base de datos', 'danger')
     
     return render_template('login.html')
 
@@ -337,31 +804,30 @@ def register():
             flash('La contraseña debe tener mínimo 6 caracteres', 'danger')
             return render_template('register.html')
         
-        connection = get_db_connection()
-        if connection:
-            try:
-                cursor = connection.cursor()
-                cursor.execute("SELECT id FROM usuarios WHERE email = %s", (email,))
-                if cursor.fetchone():
-                    flash('Este correo ya está registrado', 'warning')
-                    return render_template('register.html')
-                
-                hashed_password = generate_password_hash(password)
-                cursor.execute(
-                    "INSERT INTO usuarios (nombre, email, password) VALUES (%s, %s, %s) RETURNING id",
-                    (nombre, email, hashed_password)
-                )
-                connection.commit()
-                flash('¡Registro exitoso! Ahora puedes iniciar sesión', 'success')
-                return redirect(url_for('login'))
-            except Error as e:
-                logger.error(f"Error en registro: {e}")
-                flash('Error al registrar usuario', 'danger')
-            finally:
-                cursor.close()
-                connection.close()
-        else:
-            flash('Error de conexión a la base de datos', 'danger')
+        with conexion_bd() as connection:
+            if connection:
+                try:
+                    cursor = connection.cursor()
+                    cursor.execute("SELECT id FROM usuarios WHERE email = %s", (email,))
+                    if cursor.fetchone():
+                        flash('Este correo ya está registrado', 'warning')
+                        return render_template('register.html')
+                    
+                    hashed_password = generate_password_hash(password)
+                    cursor.execute(
+                        "INSERT INTO usuarios (nombre, email, password) VALUES (%s, %s, %s) RETURNING id",
+                        (nombre, email, hashed_password)
+                    )
+                    connection.commit()
+                    flash('¡Registro exitoso! Ahora puedes iniciar sesión', 'success')
+                    return redirect(url_for('login'))
+                except Error as e:
+                    logger.error(f"Error en registro: {e}")
+                    flash('Error al registrar usuario', 'danger')
+                finally:
+                    cursor.close()
+            else:
+                flash('Error de conexión a la base de datos', 'danger')
     
     return render_template('register.html')
 
@@ -382,61 +848,319 @@ def index():
 
 @app.route('/lote-publico/<int:lote_id>')
 def lote_publico(lote_id):
-    """Página pública para ver información del lote al escanear QR"""
-    connection = get_db_connection()
-    
-    if not connection:
-        return render_template('error.html',
-                             error_title="Error de conexión",
-                             error_message="No se pudo conectar a la base de datos",
-                             error_code=500), 500
+    """Página pública para ver información del lote al escanear QR.
+    El HTML se sirve desde caché; un lote solo cambia con nutricion.py recalcular,
+    que actualiza actualizado_en (el Last-Modified de la página) y borra la copia en disco."""
+    pagina = cache_paginas_publicas.obtener(lote_id)
+    if pagina:
+        return respuesta_cacheable(pagina, PAGINA_PUBLICA_MAX_AGE)
+    # Solo lo que viene de disco entra a memoria: volver a guardar un acierto
+    # renovaría el TTL y una página muy escaneada nunca expiraría
+    pagina = leer_cache_en_disco(ruta_pagina_publica(lote_id))
+    if pagina:
+        cache_paginas_publicas.guardar(lote_id, pagina)
+        return respuesta_cacheable(pagina, PAGINA_PUBLICA_MAX_AGE)
     
-    try:
-        cursor = connection.cursor()
-        cursor.execute("""
-            SELECT * FROM lotes_chocobrew 
-            WHERE id = %s
-        """, (lote_id,))
-        lote = cursor.fetchone()
-        
-        if not lote:
+    with conexion_bd() as connection:
+        if not connection:
             return render_template('error.html',
-                                 error_title="Lote no encontrado",
-                                 error_message="Este código QR no es válido o el lote no existe",
-                                 error_code=404), 404
+                                 error_title="Error de conexión",
+                                 error_message="No se pudo conectar a la base de datos",
+                                 error_code=500), 500
         
-        datos_lote = {
-            'id': lote['id'],
-            'codigo_lote': lote['codigo_lote'],
-            'fecha_elaboracion': lote['fecha_elaboracion'].strftime('%d/%m/%Y'),
-            'fecha_vencimiento': lote['fecha_vencimiento'].strftime('%d/%m/%Y'),
-            'abv': float(lote['abv']),
-            'ibu': lote['ibu'],
-            'srm': lote['srm'],
-            'porcentaje_cacao': float(lote['porcentaje_cacao']),
-            'puntuacion': float(lote['puntuacion']),
-            'categoria': lote['categoria'],
-            'nutricional': {
-                'calorias': lote['calorias'],
-                'carbohidratos': float(lote['carbohidratos']),
-                'proteinas': float(lote['proteinas']),
-                'grasas': float(lote['grasas']),
-                'azucares': float(lote['azucares']),
-                'alcohol': float(lote['abv'])
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT id, codigo_lote, fecha_elaboracion, fecha_vencimiento,
+                       abv, ibu, srm, porcentaje_cacao, puntuacion, categoria,
+                       calorias, carbohidratos, proteinas, grasas, azucares, actualizado_en
+                FROM lotes_chocobrew 
+                WHERE id = %s
+            """, (lote_id,))
+            lote = cursor.fetchone()
+            
+            if not lote:
+                return render_template('error.html',
+                                     error_title="Lote no encontrado",
+                                     error_message="Este código QR no es válido o el lote no existe",
+                                     error_code=404), 404
+            
+            datos_lote = {
+                'id': lote['id'],
+                'codigo_lote': lote['codigo_lote'],
+                'fecha_elaboracion': lote['fecha_elaboracion'].strftime('%d/%m/%Y'),
+                'fecha_vencimiento': lote['fecha_vencimiento'].strftime('%d/%m/%Y'),
+                'abv': float(lote['abv']),
+                'ibu': lote['ibu'],
+                'srm': lote['srm'],
+                'porcentaje_cacao': float(lote['porcentaje_cacao']),
+                'puntuacion': float(lote['puntuacion']),
+                'categoria': lote['categoria'],
+                'nutricional': {
+                    'calorias': lote['calorias'],
+                    'carbohidratos': float(lote['carbohidratos']),
+                    'proteinas': float(lote['proteinas']),
+                    'grasas': float(lote['grasas']),
+                    'azucares': float(lote['azucares']),
+                    'alcohol': float(lote['abv'])
+                }
             }
-        }
+            
+            html = render_template('lote_publico.html', lote=datos_lote)
+            
+        except Error as e:
+            logger.error(f"Error obteniendo lote público: {e}")
+            return render_template('error.html',
+                                 error_title="Error del servidor",
+                                 error_message="No se pudo cargar la información del lote",
+                                 error_code=500), 500
+        finally:
+            cursor.close()
+    
+    pagina = crear_entrada_cache(html.encode('utf-8'), lote['actualizado_en'])
+    cache_paginas_publicas.guardar(lote_id, pagina)
+    guardar_cache_en_disco(ruta_pagina_publica(lote_id), pagina)
+    return respuesta_cacheable(pagina, PAGINA_PUBLICA_MAX_AGE)
+
+@app.route('/qr/<int:lote_id>.<formato>')
+def qr_lote(lote_id, formato):
+    """Código QR del lote como imagen, generado bajo demanda y cacheado"""
+    if formato not in QR_FORMATOS or not QR_AVAILABLE:
+        abort(404)
+    
+    url = url_publica_lote(lote_id)
+    clave = (url, formato)
+    entrada = cache_qr.obtener(clave)
+    
+    # Si el QR se está generando en segundo plano, esperar ese trabajo
+    if not entrada:
+        pendiente = trabajos_qr.pendiente(clave)
+        if pendiente is not None:
+            try:
+                entrada = pendiente.result(QR_ESPERA_MAXIMA)
+            except Exception as e:
+                logger.warning(f"QR en segundo plano no disponible para el lote {lote_id}: {e}")
+    
+    if not entrada:
+        entrada = leer_cache_en_disco(ruta_qr_en_disco(url, formato))
+        if entrada:
+            cache_qr.guardar(clave, entrada)
+    
+    if not entrada:
+        existe = lote_existe(lote_id)
+        if existe is None:
+            abort(503)
+        if not existe:
+            abort(404)
+        entrada = renderizar_qr(url, formato)
+    
+    return respuesta_cacheable(entrada, QR_MAX_AGE, QR_FORMATOS[formato])
+
+# =====================================================
+# API JSON
+# =====================================================
+
+def resultado_prediccion(features, prediccion, version_modelo, nutricional=None):
+    return {
+        'version_modelo': version_modelo,
+        'puntuacion': float(round(prediccion, 2)),
+        'categoria': clasificar_calidad(prediccion),
+        'nutricional': nutricional or calcular_tabla_nutricional(features['abv'], features['porcentaje_cacao'], features['og'])
+    }
+
+@app.route('/api/v1/predict', methods=['POST'])
+def api_predict():
+    """Predicción de calidad para un lote ({...}) o varios ({"lotes": [...]}).
+    Con "modelo": "completo" (o ?modelo=completo) predice con el bosque en vez del sustituto o la tabla."""
+    cuerpo = request.get_json(silent=True)
+    if not isinstance(cuerpo, dict):
+        return jsonify({'error': 'Se esperaba un objeto JSON'}), 400
+    completo = 'completo' in (request.args.get('modelo'), cuerpo.get('modelo'))
+    
+    try:
+        if 'lotes' not in cuerpo:
+            features = leer_features_lote(cuerpo)
+            return jsonify(resultado_prediccion(features, *predecir_puntuacion(features, completo)))
         
-        return render_template('lote_publico.html', lote=datos_lote)
+        if not isinstance(cuerpo['lotes'], list) or not cuerpo['lotes']:
+            return jsonify({'error': '"lotes" debe ser una lista no vacía'}), 400
+        if len(cuerpo['lotes']) > MAX_LOTES_IMPORTACION:
+            return jsonify({'error': f'Máximo {MAX_LOTES_IMPORTACION} lotes por petición'}), 413
         
-    except Error as e:
-        logger.error(f"Error obteniendo lote público: {e}")
-        return render_template('error.html',
-                             error_title="Error del servidor",
-                             error_message="No se pudo cargar la información del lote",
-                             error_code=500), 500
-    finally:
-        cursor.close()
-        connection.close()
+        lista = [leer_features_lote(lote) for lote in cuerpo['lotes']]
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'error': f'Datos no válidos: {e}'}), 400
+    
+    # Una lista ya viene agrupada: va directo al modelo y a la tabla nutricional vectorizada
+    features = np.array([[f[campo] for campo in FEATURES_MODELO] for f in lista])
+    predicciones, version = predecir_puntuaciones(features, completo)
+    tabla = calcular_tabla_nutricional_columnas(features[:, 0], features[:, 5], features[:, 3])
+    return jsonify({'predicciones': [
+        resultado_prediccion(f, p, version, {clave: valores[i].item() for clave, valores in tabla.items()})
+        for i, (f, p) in enumerate(zip(lista, predicciones))
+    ]})
+
+@app.route('/api/v1/analitica')
+@login_required
+def api_analitica():
+    """Tendencias de los lotes del usuario en columnas listas para graficar"""
+    with conexion_bd() as connection:
+        if not connection:
+            return jsonify({'error': 'No se pudo conectar a la base de datos'}), 503
+        
+        try:
+            cursor = connection.cursor()
+            # Un solo recorrido de resumen_lotes para los tres agrupamientos y el total
+            cursor.execute("""
+                SELECT GROUPING(mes) AS sin_mes,
+                       GROUPING(categoria) AS sin_categoria,
+                       GROUPING(tramo_cacao) AS sin_tramo,
+                       to_char(mes, 'YYYY-MM') AS mes, categoria, tramo_cacao,
+                       SUM(lotes)::int AS lotes,
+                       ROUND(SUM(suma_puntuacion) / NULLIF(SUM(lotes), 0), 2)::float8 AS puntuacion
+                FROM resumen_lotes
+                WHERE user_id = %s
+                GROUP BY GROUPING SETS ((mes), (categoria), (tramo_cacao), ())
+                ORDER BY mes, tramo_cacao, categoria
+            """, (session['user_id'],))
+            grupos = cursor.fetchall()
+        except Error as e:
+            logger.error(f"Error calculando analítica: {e}")
+            return jsonify({'error': 'No se pudo calcular la analítica'}), 500
+        finally:
+            cursor.close()
+    
+    analitica = {
+        'total': 0,
+        'puntuacion_promedio': None,
+        'por_mes': {'mes': [], 'lotes': [], 'puntuacion': []},
+        'categorias': {},
+        'cacao': {'porcentaje': [], 'lotes': [], 'puntuacion': []},
+    }
+    for grupo in grupos:
+        if not grupo['sin_mes']:
+            serie, eje, clave = analitica['por_mes'], 'mes', grupo['mes']
+        elif not grupo['sin_tramo']:
+            serie, eje, clave = analitica['cacao'], 'porcentaje', grupo['tramo_cacao']
+        elif not grupo['sin_categoria']:
+            analitica['categorias'][grupo['categoria']] = grupo['lotes']
+            continue
+        else:
+            analitica['total'] = grupo['lotes'] or 0
+            analitica['puntuacion_promedio'] = grupo['puntuacion']
+            continue
+        serie[eje].append(clave)
+        serie['lotes'].append(grupo['lotes'])
+        serie['puntuacion'].append(grupo['puntuacion'])
+    
+    return jsonify(analitica)
+
+# =====================================================
+# ADMINISTRACIÓN DEL MODELO
+# =====================================================
+
+def token_admin_valido():
+    token = os.environ.get('ADMIN_TOKEN')
+    return bool(token) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+
+@app.route('/admin/modelo', methods=['GET', 'POST'])
+def admin_modelo():
+    """Consulta o cambia la versión activa (cabecera X-Admin-Token = ADMIN_TOKEN).
+    POST {"version": "..."} activa esa versión y la recarga en este worker;
+    los demás workers la toman en su próxima verificación."""
+    if not token_admin_valido():
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    if request.method == 'POST':
+        cuerpo = request.get_json(silent=True) or {}
+        if cuerpo.get('version'):
+            try:
+                activar_version(str(cuerpo['version']))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 404
+        recargar_modelo(forzar=True)
+    
+    modelo = obtener_modelo()
+    return jsonify({
+        'version': modelo['version'],
+        'version_servida': version_servida(modelo),
+        'modo_servicio': MODO_SERVICIO,
+        'sustituto': modelo['sustituto'].fidelidad if modelo['sustituto'] is not None else None,
+        'tabla': modelo['tabla'].fidelidad if modelo['tabla'] is not None else None,
+        'metadata': modelo['metadata'],
+        'versiones': listar_versiones(),
+        'cache_predicciones': cache_predicciones.estadisticas(),
+        'cache_paginas_publicas': cache_paginas_publicas.estadisticas(),
+        'cache_qr': cache_qr.estadisticas(),
+        'pid': os.getpid()
+    })
+
+@app.route('/admin/url-base', methods=['GET', 'POST'])
+def admin_url_base():
+    """Consulta o vuelve a resolver (POST) la URL que codifican los QR en este worker"""
+    if not token_admin_valido():
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    if request.method == 'POST':
+        refrescar_url_base()
+    
+    return jsonify({'url_lote': url_publica_lote('<id>'), 'pid': os.getpid()})
+
+# =====================================================
+# MÉTRICAS (PROMETHEUS)
+# =====================================================
+
+CACHES = {
+    'predicciones': cache_predicciones,
+    'paginas_publicas': cache_paginas_publicas,
+    'qr': cache_qr,
+}
+
+def valores_caches(clave):
+    return {nombre: cache.estadisticas()[clave] for nombre, cache in CACHES.items()}
+
+REGISTRO.medidor('chocobrew_cache_aciertos_total', 'Aciertos por caché',
+                 lambda: valores_caches('aciertos'), ('cache',), tipo='counter')
+REGISTRO.medidor('chocobrew_cache_fallos_total', 'Fallos por caché',
+                 lambda: valores_caches('fallos'), ('cache',), tipo='counter')
+REGISTRO.medidor('chocobrew_cache_tasa_aciertos', 'Aciertos / consultas desde el arranque',
+                 lambda: valores_caches('tasa_aciertos'), ('cache',))
+REGISTRO.medidor('chocobrew_cache_entradas', 'Entradas guardadas por caché',
+                 lambda: valores_caches('entradas'), ('cache',))
+REGISTRO.medidor('chocobrew_agrupador_lotes_total', 'Llamadas agrupadas al modelo',
+                 lambda: agrupador.lotes_procesados, tipo='counter')
+REGISTRO.medidor('chocobrew_agrupador_filas_total', 'Filas predichas por el agrupador',
+                 lambda: agrupador.filas_procesadas, tipo='counter')
+REGISTRO.medidor('chocobrew_qr_trabajos_pendientes', 'QR en cola o generándose en segundo plano',
+                 lambda: trabajos_qr.estadisticas()['pendientes'])
+REGISTRO.medidor('chocobrew_qr_trabajos_total', 'QR encolados y fallidos en segundo plano',
+                 lambda: {estado: trabajos_qr.estadisticas()[estado] for estado in ('encolados', 'fallidos')},
+                 ('estado',), tipo='counter')
+REGISTRO.medidor('chocobrew_modelo_info', 'Versión del modelo cargada en este worker',
+                 lambda: {version_servida(modelo_actual) or 'legacy': 1} if modelo_actual else {}, ('version',))
+
+@app.before_request
+def iniciar_medicion():
+    g.inicio_medicion = time.perf_counter()
+
+@app.after_request
+def registrar_medicion(response):
+    inicio = g.pop('inicio_medicion', None)
+    if inicio is not None:
+        endpoint = request.endpoint or 'desconocido'
+        PETICIONES_SEGUNDOS.observar(time.perf_counter() - inicio, endpoint=endpoint, metodo=request.method)
+        PETICIONES_TOTAL.incrementar(endpoint=endpoint, estado=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Métricas de este worker en formato de texto de Prometheus.
+    Con METRICS_TOKEN definido exige Authorization: Bearer <token>."""
+    token = os.environ.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    return Response(REGISTRO.exponer(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # =====================================================
 # RUTAS PROTEGIDAS - ANÁLISIS DE LOTES
@@ -451,131 +1175,46 @@ def analisis():
 @login_required
 def procesar_lote():
     try:
-        # Obtener datos del formulario
-        codigo_lote = request.form.get('codigo_lote', '').strip()
-        fecha_elaboracion = request.form.get('fecha_elaboracion', '')
-        abv = float(request.form.get('abv', 0))
-        ibu = float(request.form.get('ibu', 0))
-        srm = float(request.form.get('srm', 0))
-        og = float(request.form.get('og', 0))
-        fg = float(request.form.get('fg', 0))
-        porcentaje_cacao = float(request.form.get('porcentaje_cacao', 0))
-        dias_fermentacion = int(request.form.get('dias_fermentacion', 0))
-        dias_maduracion = int(request.form.get('dias_maduracion', 0))
-        
-        # Validaciones
-        if not codigo_lote or not fecha_elaboracion:
-            flash('Código de lote y fecha son obligatorios', 'danger')
-            return redirect(url_for('analisis'))
-        
-        if fg >= og:
-            flash('Error: La densidad final (FG) debe ser menor que la inicial (OG)', 'danger')
+        # Obtener y validar datos del formulario
+        try:
+            with ETAPAS_LOTE.medir(etapa='validacion'):
+                datos = leer_datos_lote(request.form)
+        except DatosLoteInvalidos as e:
+            flash(str(e), 'danger')
             return redirect(url_for('analisis'))
-        
-        # Verificar código duplicado
-        connection = get_db_connection()
-        if connection:
-            try:
-                cursor = connection.cursor()
-                cursor.execute(
-                    "SELECT id FROM lotes_chocobrew WHERE codigo_lote = %s",
-                    (codigo_lote,)
-                )
-                if cursor.fetchone():
-                    flash(f'El código de lote "{codigo_lote}" ya existe. Usa otro código.', 'warning')
-                    cursor.close()
-                    connection.close()
-                    return redirect(url_for('analisis'))
-                cursor.close()
-                connection.close()
-            except Error as e:
-                logger.error(f"Error verificando código: {e}")
-        
-        # Calcular fecha de vencimiento
-        fecha_elab = datetime.strptime(fecha_elaboracion, '%Y-%m-%d')
-        fecha_venc = fecha_elab + timedelta(days=PROJECT_INFO['vida_util_dias'])
+        codigo_lote = datos['codigo_lote']
         
         # Predicción de calidad
-        features = np.array([[abv, ibu, srm, og, fg, porcentaje_cacao, dias_fermentacion, dias_maduracion]])
-        
-        if model and scaler:
-            try:
-                features_scaled = scaler.transform(features)
-                prediccion = float(model.predict(features_scaled)[0])
-                logger.info(f"Predicción ML: {prediccion}")
-            except Exception as e:
-                logger.error(f"Error en predicción ML: {e}")
-                prediccion = 2.5 + (abv * 0.08) + (porcentaje_cacao * 0.15) - (ibu * 0.008) + (dias_maduracion * 0.02)
-                prediccion = float(np.clip(prediccion, 0, 5))
-        else:
-            logger.warning("Modelo no disponible, usando fórmula basada en cacao")
-            prediccion = 2.5 + (abv * 0.08) + (porcentaje_cacao * 0.15) - (ibu * 0.008) + (dias_maduracion * 0.02)
-            prediccion = float(np.clip(prediccion, 0, 5))
-        
-        # Clasificar calidad
-        if prediccion >= 4.5:
-            categoria = "Premium"
-        elif prediccion >= 4.0:
-            categoria = "Excelente"
-        elif prediccion >= 3.5:
-            categoria = "Muy Buena"
-        elif prediccion >= 3.0:
-            categoria = "Buena"
-        else:
-            categoria = "Regular"
+        with ETAPAS_LOTE.medir(etapa='prediccion'):
+            prediccion, version_modelo = predecir_puntuacion(datos)
+        logger.debug("Predicción: %s (modelo %s)", prediccion, version_modelo)
         
         # Calcular tabla nutricional
-        nutricional = calcular_tabla_nutricional(abv, porcentaje_cacao, og)
+        with ETAPAS_LOTE.medir(etapa='nutricional'):
+            nutricional = calcular_tabla_nutricional(datos['abv'], datos['porcentaje_cacao'], datos['og'])
         
-        # Datos del lote (SIN QR todavía)
-        datos_lote = {
-            'codigo_lote': codigo_lote,
-            'fecha_elaboracion': fecha_elaboracion,
-            'fecha_vencimiento': fecha_venc.strftime('%Y-%m-%d'),
-            'abv': float(abv),
-            'ibu': int(ibu),
-            'srm': int(srm),
-            'og': float(og),
-            'fg': float(fg),
-            'porcentaje_cacao': float(porcentaje_cacao),
-            'dias_fermentacion': int(dias_fermentacion),
-            'dias_maduracion': int(dias_maduracion),
-            'puntuacion': float(round(prediccion, 2)),
-            'categoria': categoria,
-            'nutricional': nutricional,
-            'qr_code': None
-        }
+        # Datos del lote
+        datos_lote = armar_datos_lote(datos, prediccion, nutricional, version_modelo)
         
-        # Guardar primero para obtener el ID
-        lote_id = guardar_lote_en_bd(datos_lote, session['user_id'])
+        # Guardar lote (conexión + INSERT con chequeo de duplicado; el QR se sirve
+        # después desde /qr/<id>.png)
+        try:
+            with ETAPAS_LOTE.medir(etapa='guardado'):
+                lote_id = guardar_lote_en_bd(datos_lote, session['user_id'])
+        except LoteDuplicado:
+            flash(f'El código de lote "{codigo_lote}" ya existe. Usa otro código.', 'warning')
+            return redirect(url_for('analisis'))
         
         if lote_id:
-            # Generar el QR con el ID
-            qr_code = generar_codigo_qr(lote_id)
-            datos_lote['qr_code'] = qr_code
-            
-            # Actualizar el registro con el QR
-            connection = get_db_connection()
-            if connection and qr_code:
-                try:
-                    cursor = connection.cursor()
-                    cursor.execute(
-                        "UPDATE lotes_chocobrew SET qr_code_base64 = %s WHERE id = %s",
-                        (qr_code, lote_id)
-                    )
-                    connection.commit()
-                    logger.info(f"QR actualizado para lote ID: {lote_id}")
-                except Error as e:
-                    logger.error(f"Error actualizando QR: {e}")
-                finally:
-                    cursor.close()
-                    connection.close()
-            
+            datos_lote['id'] = lote_id
+            datos_lote['qr_url'] = url_qr_lote(lote_id)
+            encolar_qr(lote_id)
             flash('¡Lote guardado exitosamente!', 'success')
         else:
             flash('Advertencia: No se pudo guardar en la base de datos', 'warning')
         
-        return render_template('resultado_lote.html', lote=datos_lote)
+        with ETAPAS_LOTE.medir(etapa='render'):
+            return render_template('resultado_lote.html', lote=datos_lote)
     
     except ValueError as e:
         logger.error(f"Error de validación: {e}")
@@ -586,98 +1225,237 @@ def procesar_lote():
         flash(f"Error al procesar el lote: {str(e)}", "danger")
         return redirect(url_for('analisis'))
 
+@app.route('/importar-lotes', methods=['POST'])
+@login_required
+def importar_lotes():
+    """Importación masiva de lotes (CSV o JSON) con predicción vectorizada"""
+    try:
+        filas = leer_filas_importacion()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not filas:
+        return jsonify({'error': 'No hay lotes para importar'}), 400
+    
+    if len(filas) > MAX_LOTES_IMPORTACION:
+        return jsonify({'error': f'Máximo {MAX_LOTES_IMPORTACION} lotes por importación'}), 413
+    
+    # Validar todas las filas antes de tocar el modelo
+    validos = []
+    errores = []
+    codigos_vistos = set()
+    for numero, fila in enumerate(filas, start=1):
+        try:
+            if not isinstance(fila, dict):
+                raise DatosLoteInvalidos('Formato de fila no válido')
+            datos = leer_datos_lote(fila)
+            if datos['codigo_lote'] in codigos_vistos:
+                raise DatosLoteInvalidos('Código de lote repetido en el archivo')
+        except (ValueError, TypeError) as e:
+            errores.append({'fila': numero, 'codigo_lote': fila.get('codigo_lote') if isinstance(fila, dict) else None, 'error': str(e)})
+            continue
+        codigos_vistos.add(datos['codigo_lote'])
+        validos.append((numero, datos))
+    
+    lotes = []
+    if validos:
+        # Una sola llamada al scaler y al modelo para todo el archivo
+        features = np.array([[datos[campo] for campo in FEATURES_MODELO] for _, datos in validos])
+        predicciones, version = predecir_puntuaciones(features)
+        tabla = calcular_tabla_nutricional_columnas(features[:, 0], features[:, 5], features[:, 3])
+        
+        for i, (_, datos) in enumerate(validos):
+            nutricional = {clave: valores[i].item() for clave, valores in tabla.items()}
+            lotes.append(armar_datos_lote(datos, float(predicciones[i]), nutricional, version))
+    
+    importados = []
+    if lotes:
+        ids = guardar_lotes_en_bd(lotes, session['user_id'])
+        if ids is None:
+            return jsonify({'error': 'No se pudo guardar en la base de datos', 'errores': errores}), 503
+        
+        for (numero, _), datos_lote in zip(validos, lotes):
+            lote_id = ids.get(datos_lote['codigo_lote'])
+            if lote_id is None:
+                errores.append({'fila': numero, 'codigo_lote': datos_lote['codigo_lote'], 'error': 'El código de lote ya existe'})
+            else:
+                importados.append({'fila': numero, 'id': lote_id, 'codigo_lote': datos_lote['codigo_lote'],
+                                   'puntuacion': datos_lote['puntuacion'], 'categoria': datos_lote['categoria']})
+    
+    errores.sort(key=lambda error: error['fila'])
+    return jsonify({
+        'total': len(filas),
+        'importados': len(importados),
+        'lotes': importados,
+        'errores': errores
+    }), 200 if importados else 400
+
 @app.route('/mis-lotes')
 @login_required
 def mis_lotes():
-    """Muestra todos los lotes del usuario actual"""
-    connection = get_db_connection()
+    """Lotes del usuario actual, paginados por (fecha_elaboracion, id)"""
     lotes = []
+    resumen = {'total': 0, 'promedio': 0.0, 'premium': 0, 'excelente': 0}
+    siguiente = None
     
-    if connection:
-        try:
-            cursor = connection.cursor()
-            cursor.execute("""
-                SELECT * FROM lotes_chocobrew 
-                WHERE user_id = %s 
-                ORDER BY fecha_elaboracion DESC
-            """, (session['user_id'],))
-            lotes_raw = cursor.fetchall()
-            
-            for lote in lotes_raw:
-                lote['puntuacion'] = float(lote['puntuacion'])
-                lote['abv'] = float(lote['abv'])
-                lote['og'] = float(lote['og'])
-                lote['fg'] = float(lote['fg'])
-                lote['porcentaje_cacao'] = float(lote['porcentaje_cacao'])
-                lote['carbohidratos'] = float(lote['carbohidratos'])
-                lote['proteinas'] = float(lote['proteinas'])
-                lote['grasas'] = float(lote['grasas'])
-                lote['azucares'] = float(lote['azucares'])
-                lotes.append(lote)
+    # Cursor de la página: "<fecha_elaboracion>_<id>" del último lote visto
+    desde = request.args.get('desde', '')
+    try:
+        fecha_desde, id_desde = desde.split('_')
+        desde = (datetime.strptime(fecha_desde, '%Y-%m-%d').date(), int(id_desde))
+    except ValueError:
+        desde = None
+    
+    with conexion_bd() as connection:
+        if connection:
+            try:
+                cursor = connection.cursor()
+                # Desde resumen_lotes (migración 0005): O(grupos) filas por vista, no todos los lotes
+                cursor.execute("""
+                    SELECT COALESCE(SUM(lotes), 0)::int AS total,
+                           COALESCE(SUM(suma_puntuacion) / NULLIF(SUM(lotes), 0), 0)::float8 AS promedio,
+                           COALESCE(SUM(lotes) FILTER (WHERE categoria = 'Premium'), 0)::int AS premium,
+                           COALESCE(SUM(lotes) FILTER (WHERE categoria = 'Excelente'), 0)::int AS excelente
+                    FROM resumen_lotes
+                    WHERE user_id = %s
+                """, (session['user_id'],))
+                resumen = cursor.fetchone()
                 
-        except Error as e:
-            logger.error(f"Error obteniendo lotes: {e}")
-            flash('Error al cargar los lotes', 'danger')
-        finally:
-            cursor.close()
-            connection.close()
+                # Usa ix_lotes_usuario_fecha: sin OFFSET, cada página cuesta lo mismo
+                cursor.execute("""
+                    SELECT id, codigo_lote, fecha_elaboracion, fecha_vencimiento,
+                           abv::float8 AS abv, ibu, srm,
+                           porcentaje_cacao::float8 AS porcentaje_cacao,
+                           puntuacion::float8 AS puntuacion, categoria
+                    FROM lotes_chocobrew
+                    WHERE user_id = %s
+                      AND (%s::date IS NULL OR (fecha_elaboracion, id) < (%s::date, %s))
+                    ORDER BY fecha_elaboracion DESC, id DESC
+                    LIMIT %s
+                """, (session['user_id'], desde and desde[0], desde and desde[0], desde and desde[1],
+                      LOTES_POR_PAGINA + 1))
+                lotes = cursor.fetchall()
+                
+                if len(lotes) > LOTES_POR_PAGINA:
+                    lotes = lotes[:LOTES_POR_PAGINA]
+                    ultimo = lotes[-1]
+                    siguiente = f"{ultimo['fecha_elaboracion']:%Y-%m-%d}_{ultimo['id']}"
+                    
+            except Error as e:
+                logger.error(f"Error obteniendo lotes: {e}")
+                flash('Error al cargar los lotes', 'danger')
+            finally:
+                cursor.close()
     
-    return render_template('mis_lotes.html', lotes=lotes)
+    return render_template('mis_lotes.html', lotes=lotes, resumen=resumen,
+                           siguiente=siguiente, primera_pagina=desde is None)
 
 @app.route('/ver-lote/<int:lote_id>')
 @login_required
 def ver_lote(lote_id):
     """Ver detalles de un lote específico"""
-    connection = get_db_connection()
+    with conexion_bd() as connection:
+        if connection:
+            try:
+                cursor = connection.cursor()
+                cursor.execute("""
+                    SELECT * FROM lotes_chocobrew 
+                    WHERE id = %s AND user_id = %s
+                """, (lote_id, session['user_id']))
+                lote = cursor.fetchone()
+                
+                if lote:
+                    datos_lote = {
+                        'id': lote['id'],
+                        'codigo_lote': lote['codigo_lote'],
+                        'fecha_elaboracion': lote['fecha_elaboracion'].strftime('%Y-%m-%d'),
+                        'fecha_vencimiento': lote['fecha_vencimiento'].strftime('%Y-%m-%d'),
+                        'abv': float(lote['abv']),
+                        'ibu': lote['ibu'],
+                        'srm': lote['srm'],
+                        'og': float(lote['og']),
+                        'fg': float(lote['fg']),
+                        'porcentaje_cacao': float(lote['porcentaje_cacao']),
+                        'dias_fermentacion': lote['dias_fermentacion'],
+                        'dias_maduracion': lote['dias_maduracion'],
+                        'puntuacion': float(lote['puntuacion']),
+                        'categoria': lote['categoria'],
+                        'nutricional': {
+                            'calorias': lote['calorias'],
+                            'carbohidratos': float(lote['carbohidratos']),
+                            'proteinas': float(lote['proteinas']),
+                            'grasas': float(lote['grasas']),
+                            'azucares': float(lote['azucares']),
+                            'alcohol': float(lote['abv'])
+                        },
+                        'qr_url': url_qr_lote(lote['id'])
+                    }
+                    
+                    return render_template('resultado_lote.html', lote=datos_lote)
+                else:
+                    flash('Lote no encontrado', 'warning')
+                    return redirect(url_for('mis_lotes'))
+                    
+            except Error as e:
+                logger.error(f"Error obteniendo lote: {e}")
+                flash('Error al cargar el lote', 'danger')
+            finally:
+                cursor.close()
     
-    if connection:
+    return redirect(url_for('mis_lotes'))
+
+def bloques_exportacion(user_id):
+    """Primero indica si hubo conexión; luego entrega las filas en bloques de EXPORTACION_ITERSIZE"""
+    with conexion_bd() as connection:
+        if not connection:
+            yield False
+            return
+        
+        cursor = cursor_servidor(connection, EXPORTACION_ITERSIZE)
         try:
-            cursor = connection.cursor()
-            cursor.execute("""
-                SELECT * FROM lotes_chocobrew 
-                WHERE id = %s AND user_id = %s
-            """, (lote_id, session['user_id']))
-            lote = cursor.fetchone()
+            cursor.execute(f"""
+                SELECT {columnas_sql()}
+                FROM lotes_chocobrew
+                WHERE user_id = %s
+                ORDER BY fecha_elaboracion DESC, id DESC
+            """, (user_id,))
+            yield True
             
-            if lote:
-                datos_lote = {
-                    'codigo_lote': lote['codigo_lote'],
-                    'fecha_elaboracion': lote['fecha_elaboracion'].strftime('%Y-%m-%d'),
-                    'fecha_vencimiento': lote['fecha_vencimiento'].strftime('%Y-%m-%d'),
-                    'abv': float(lote['abv']),
-                    'ibu': lote['ibu'],
-                    'srm': lote['srm'],
-                    'og': float(lote['og']),
-                    'fg': float(lote['fg']),
-                    'porcentaje_cacao': float(lote['porcentaje_cacao']),
-                    'dias_fermentacion': lote['dias_fermentacion'],
-                    'dias_maduracion': lote['dias_maduracion'],
-                    'puntuacion': float(lote['puntuacion']),
-                    'categoria': lote['categoria'],
-                    'nutricional': {
-                        'calorias': lote['calorias'],
-                        'carbohidratos': float(lote['carbohidratos']),
-                        'proteinas': float(lote['proteinas']),
-                        'grasas': float(lote['grasas']),
-                        'azucares': float(lote['azucares']),
-                        'alcohol': float(lote['abv'])
-                    },
-                    'qr_code': lote['qr_code_base64']
-                }
-                
-                return render_template('resultado_lote.html', lote=datos_lote)
-            else:
-                flash('Lote no encontrado', 'warning')
-                return redirect(url_for('mis_lotes'))
-                
-        except Error as e:
-            logger.error(f"Error obteniendo lote: {e}")
-            flash('Error al cargar el lote', 'danger')
+            while True:
+                filas = cursor.fetchmany(EXPORTACION_ITERSIZE)
+                if not filas:
+                    break
+                yield filas
         finally:
             cursor.close()
-            connection.close()
+
+@app.route('/exportar-lotes.<formato>')
+@login_required
+def exportar_lotes(formato):
+    """Historial completo del usuario en CSV o Parquet, enviado a medida que se lee"""
+    if formato not in FORMATOS_EXPORTACION:
+        abort(404)
+    if formato == 'parquet' and not PARQUET_DISPONIBLE:
+        flash('La exportación a Parquet requiere pyarrow (pip install pyarrow)', 'warning')
+        return redirect(url_for('mis_lotes'))
     
-    return redirect(url_for('mis_lotes'))
+    # Abrir la conexión y lanzar la consulta antes de responder, para poder avisar si falla
+    bloques = bloques_exportacion(session['user_id'])
+    try:
+        conectado = next(bloques)
+    except Error as e:
+        logger.error(f"Error exportando lotes: {e}")
+        conectado = False
+    if not conectado:
+        bloques.close()
+        flash('No se pudo conectar a la base de datos', 'danger')
+        return redirect(url_for('mis_lotes'))
+    
+    escritor = csv_por_bloques if formato == 'csv' else parquet_por_bloques
+    nombre = f"chocobrew_lotes_{datetime.now():%Y%m%d}.{formato}"
+    return Response(escritor(bloques),
+                    content_type=FORMATOS_EXPORTACION[formato],
+                    headers={'Content-Disposition': f'attachment; filename="{nombre}"'})
 
 # =====================================================
 # CONTEXT PROCESSOR (ESENCIAL PARA LOS BOTONES)
@@ -688,10 +1466,6 @@ def inject_globals():
     user_logged_in = 'user_id' in session
     user_name = session.get('user_name', '')
     
-    # Debug en consola
-    print(f"🎯 Context Processor - Usuario logueado: {user_logged_in}")
-    print(f"🎯 Context Processor - Nombre: {user_name}")
-    
     return {
         'current_year': 2025,
         'user_logged_in': user_logged_in,
@@ -706,12 +1480,11 @@ if __name__ == '__main__':
     for directory in ['templates', 'static/css', 'static/js', 'static/img', 'model', 'data']:
         os.makedirs(directory, exist_ok=True)
     
-    connection = get_db_connection()
-    if connection:
-        logger.info("✓ Conexión a PostgreSQL exitosa")
-        connection.close()
-    else:
-        logger.warning("⚠ No se pudo conectar a PostgreSQL. Verifica la configuración.")
+    with conexion_bd() as connection:
+        if connection:
+            logger.info("✓ Conexión a PostgreSQL exitosa")
+        else:
+            logger.warning("⚠ No se pudo conectar a PostgreSQL. Verifica la configuración.")
     
     # Configuración para Render
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,271 @@
+"""
+Benchmark de inferencia - CHOCOBREW
+Mide la ruta de predicción de un lote: la tabla precalculada, el sustituto destilado, el bosque
+compilado y scaler.transform + model.predict de la versión activa, predecir_puntuaciones
+de la app, la fórmula de respaldo, la tabla nutricional y el QR. Por caso
+reporta filas/s, latencia p50/p99 y el pico de memoria asignada por
+llamada (tracemalloc, en una pasada aparte para no inflar los tiempos).
+
+Los resultados se guardan como línea base en benchmarks/<nombre>.json y se
+comparan contra ella: un p50 que empeora más que --umbral es una regresión
+y el comando sale con código 1.
+
+Uso:
+    python benchmark_inferencia.py                       # solo medir
+    python benchmark_inferencia.py --guardar base        # medir y guardar línea base
+    python benchmark_inferencia.py --comparar base       # medir y comparar
+    python benchmark_inferencia.py --casos bosque,formula --tamanos 1,100,10000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import warnings
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+# La app no necesita resolver su IP para generar QRs de prueba
+os.environ.setdefault('PUBLIC_BASE_URL', 'http://localhost:5000')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('MODEL_RELOAD_INTERVAL', '0')
+
+# El scaler se ajustó con un DataFrame y la app le pasa arrays, igual que aquí
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+import app as aplicacion
+from bosque_compilado import BosqueCompilado, RUTA_BOSQUE, features_de_prueba
+from registro_modelos import version_actual, ruta_version
+from sustituto import Sustituto
+from tabla_prediccion import TablaPrediccion, hay_tabla, muestras_formulario
+from nutricion import calcular_tabla_nutricional, calcular_tabla_nutricional_columnas
+
+RUTA_BENCHMARKS = 'benchmarks'
+TAMANOS = [1, 10, 100, 1000, 10000]
+CASOS = ['app', 'tabla', 'sustituto', 'bosque', 'sklearn', 'formula', 'nutricion', 'nutricion_columnas', 'qr_png', 'qr_svg']
+
+# ==============================
+# MEDICIÓN
+# ==============================
+def medir(funcion, filas, tiempo_minimo=0.5, repeticiones_minimas=20):
+    """Repite funcion() hasta cubrir tiempo_minimo; devuelve las métricas del caso"""
+    for _ in range(3):
+        funcion()
+
+    tiempos = []
+    inicio = time.perf_counter()
+    while len(tiempos) < repeticiones_minimas or time.perf_counter() - inicio < tiempo_minimo:
+        antes = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - antes)
+
+    # Pasada aparte con tracemalloc: el rastreo hace más lenta cada asignación
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    funcion()
+    pico = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    tiempos = np.array(tiempos)
+    p50, p99 = np.percentile(tiempos, [50, 99])
+    return {
+        'filas': filas,
+        'repeticiones': len(tiempos),
+        'p50_ms': round(float(p50) * 1000, 4),
+        'p99_ms': round(float(p99) * 1000, 4),
+        'filas_por_segundo': round(filas / float(tiempos.mean()), 1),
+        'pico_kb': round(pico / 1024, 1),
+    }
+
+
+def cargar_artefactos():
+    """Tabla, sustituto, bosque compilado y modelo/scaler de scikit-learn de la versión
+    activa (o de los artefactos sueltos de model/ si no hay registro)"""
+    import joblib
+
+    version = version_actual()
+    if version:
+        carpeta = ruta_version(version)
+        bosque = BosqueCompilado.desde_archivo(os.path.join(carpeta, 'bosque'))
+        ruta_sustituto = os.path.join(carpeta, 'sustituto')
+        sustituto = Sustituto.desde_archivo(ruta_sustituto) if os.path.isdir(ruta_sustituto) else None
+        ruta_tabla = os.path.join(carpeta, 'tabla')
+        tabla = TablaPrediccion.desde_archivo(ruta_tabla, respaldo=bosque.predecir) if hay_tabla(ruta_tabla) else None
+    else:
+        sustituto = tabla = None
+        carpeta = 'model'
+        bosque = BosqueCompilado.desde_archivo(RUTA_BOSQUE) if os.path.isdir(RUTA_BOSQUE) else None
+
+    try:
+        model = joblib.load(os.path.join(carpeta, 'beer_model.pkl'))
+        scaler = joblib.load(os.path.join(carpeta, 'scaler.pkl'))
+        # La app predice de a un lote por llamada: un solo hilo como en un worker
+        model.set_params(n_jobs=1)
+    except FileNotFoundError:
+        model = scaler = None
+    return version or 'legacy', tabla, sustituto, bosque, model, scaler
+
+
+def preparar_casos(nombres, tamanos):
+    """(caso, filas, función sin argumentos) para cada combinación a medir"""
+    version, tabla, sustituto, bosque, model, scaler = cargar_artefactos()
+    datos = features_de_prueba(max(tamanos), semilla=0)
+    # features_de_prueba sale de la rejilla en casi todas las filas: la tabla se mide con lotes del formulario
+    datos_formulario = muestras_formulario(max(tamanos), semilla=0)
+    casos = []
+
+    for caso in nombres:
+        if caso == 'tabla' and tabla is None:
+            print("⚠️ Se omite 'tabla': la versión no tiene (python tabla_prediccion.py construir)")
+            continue
+        if caso == 'sustituto' and sustituto is None:
+            print("⚠️ Se omite 'sustituto': la versión no tiene (python sustituto.py destilar)")
+            continue
+        if caso == 'bosque' and bosque is None or caso == 'sklearn' and model is None:
+            print(f"⚠️ Se omite '{caso}': no hay modelo entrenado (python train_chocobrew_model.py)")
+            continue
+        if caso.startswith('qr_'):
+            if not aplicacion.QR_AVAILABLE:
+                print(f"⚠️ Se omite '{caso}': qrcode no está instalado")
+                continue
+            url = aplicacion.url_publica_lote(123456)
+            casos.append((caso, 1, lambda formato=caso[3:]: aplicacion.generar_codigo_qr(url, formato)))
+            continue
+
+        for n in tamanos:
+            X = datos[:n]
+            if caso == 'app':
+                funcion = lambda X=X: aplicacion.predecir_puntuaciones(X)
+            elif caso == 'tabla':
+                funcion = lambda X=datos_formulario[:n]: tabla.predecir(X)
+            elif caso == 'sustituto':
+                funcion = lambda X=X: sustituto.predecir(X)
+            elif caso == 'bosque':
+                funcion = lambda X=X: bosque.predecir(X)
+            elif caso == 'sklearn':
+                funcion = lambda X=X: model.predict(scaler.transform(X))
+            elif caso == 'formula':
+                funcion = lambda X=X: aplicacion.prediccion_formula(X)
+            elif caso == 'nutricion':
+                # Una llamada escalar por lote, como antes de la versión por columnas
+                filas = [(fila[0], fila[5], fila[3]) for fila in X.tolist()]
+                funcion = lambda filas=filas: [calcular_tabla_nutricional(*fila) for fila in filas]
+            elif caso == 'nutricion_columnas':
+                funcion = lambda X=X: calcular_tabla_nutricional_columnas(X[:, 0], X[:, 5], X[:, 3])
+            else:
+                raise SystemExit(f"❌ Caso desconocido: {caso} (disponibles: {', '.join(CASOS)})")
+            casos.append((caso, n, funcion))
+
+    return version, casos
+
+
+def entorno():
+    import sklearn
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'sklearn': sklearn.__version__,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+# ==============================
+# LÍNEAS BASE Y COMPARACIÓN
+# ==============================
+def ruta_linea_base(nombre):
+    return nombre if nombre.endswith('.json') else os.path.join(RUTA_BENCHMARKS, f"{nombre}.json")
+
+
+def guardar_linea_base(nombre, resultado):
+    ruta = ruta_linea_base(nombre)
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    with open(ruta, 'w', encoding='utf-8') as archivo:
+        json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+    return ruta
+
+
+def comparar(base, actual, umbral):
+    """Filas (caso, filas, p50 base, p50 actual, cambio, regresión) de los casos en común"""
+    anteriores = {(r['caso'], r['filas']): r for r in base['resultados']}
+    filas = []
+    for resultado in actual['resultados']:
+        anterior = anteriores.get((resultado['caso'], resultado['filas']))
+        if anterior is None:
+            continue
+        cambio = resultado['p50_ms'] / anterior['p50_ms'] - 1 if anterior['p50_ms'] else 0.0
+        filas.append((resultado['caso'], resultado['filas'], anterior['p50_ms'], resultado['p50_ms'],
+                      cambio, cambio > umbral))
+    return filas
+
+
+def imprimir_resultados(resultados):
+    print(f"\n  {'Caso':<20}{'Filas':>7}{'Reps':>7}{'p50 ms':>11}{'p99 ms':>11}{'filas/s':>14}{'Pico KB':>10}")
+    for r in resultados:
+        print(f"  {r['caso']:<20}{r['filas']:>7}{r['repeticiones']:>7}{r['p50_ms']:>11.4f}{r['p99_ms']:>11.4f}"
+              f"{r['filas_por_segundo']:>14,.0f}{r['pico_kb']:>10.1f}")
+
+
+def imprimir_comparacion(nombre, base, filas, umbral):
+    print(f"\n🔁 Comparación con '{nombre}' ({base['fecha']}, modelo {base['version_modelo']}):")
+    print(f"  {'Caso':<20}{'Filas':>7}{'p50 base':>11}{'p50 ahora':>11}{'Cambio':>9}")
+    for caso, n, anterior, actual, cambio, regresion in filas:
+        marca = '  ❌ regresión' if regresion else ''
+        print(f"  {caso:<20}{n:>7}{anterior:>11.4f}{actual:>11.4f}{cambio:>+9.1%}{marca}")
+    regresiones = sum(1 for fila in filas if fila[-1])
+    if regresiones:
+        print(f"\n❌ {regresiones} casos más lentos que la línea base (umbral {umbral:.0%})")
+    else:
+        print(f"\n✓ Sin regresiones (umbral {umbral:.0%})")
+    return regresiones
+
+
+def leer_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de inferencia CHOCOBREW")
+    parser.add_argument('--casos', default=','.join(CASOS), help="casos separados por coma (por defecto todos)")
+    parser.add_argument('--tamanos', default=','.join(map(str, TAMANOS)), help="lotes por llamada")
+    parser.add_argument('--tiempo', type=float, default=0.5, help="segundos mínimos por caso")
+    parser.add_argument('--guardar', metavar='NOMBRE', help="guardar como línea base en benchmarks/NOMBRE.json")
+    parser.add_argument('--comparar', metavar='NOMBRE', help="comparar con una línea base guardada")
+    parser.add_argument('--umbral', type=float, default=0.10, help="empeoramiento de p50 tolerado (0.10 = 10%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = leer_argumentos(argv)
+    tamanos = [int(n) for n in args.tamanos.split(',')]
+    base = None
+    if args.comparar:
+        with open(ruta_linea_base(args.comparar), encoding='utf-8') as archivo:
+            base = json.load(archivo)
+
+    version, casos = preparar_casos([c.strip() for c in args.casos.split(',') if c.strip()], tamanos)
+    print(f"⏱️ Benchmark de inferencia: modelo {version}, {len(casos)} casos")
+
+    resultados = []
+    for caso, n, funcion in casos:
+        resultados.append(dict(caso=caso, **medir(funcion, n, args.tiempo)))
+    resultado = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'version_modelo': version,
+        'entorno': entorno(),
+        'resultados': resultados,
+    }
+    imprimir_resultados(resultados)
+
+    if args.guardar:
+        print(f"\n💾 Línea base guardada en {guardar_linea_base(args.guardar, resultado)}")
+
+    if base is not None:
+        if base['entorno'] != resultado['entorno']:
+            print("\n⚠️ La línea base se midió en otro entorno; los cambios pueden no ser comparables")
+        if imprimir_comparacion(args.comparar, base, comparar(base, resultado, args.umbral), args.umbral):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
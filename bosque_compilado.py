@@ -0,0 +1,244 @@
+"""
+Bosque compilado - CHOCOBREW
+Aplana el RandomForestRegressor en arrays NumPy contiguos y lo evalúa
+sin scikit-learn: todos los árboles avanzan un nivel por iteración, en
+bloques de filas que caben en la caché del procesador.
+Cada array se guarda como .npy y se abre con mmap, así los workers de
+gunicorn comparten la misma copia en la caché de páginas del sistema.
+
+Uso (exportar desde los .pkl existentes):
+    python bosque_compilado.py
+"""
+
+import os
+import shutil
+
+import numpy as np
+
+RUTA_BOSQUE = 'model/bosque'
+BLOQUE_FILAS = 256
+ARRAYS_BOSQUE = [
+    'feature', 'threshold', 'izquierdo', 'derecho', 'valor',
+    'raices', 'profundidad', 'media', 'escala'
+]
+
+
+def aplanar_bosque(model, scaler):
+    """Concatena los nodos de todos los árboles en arrays planos"""
+    feature, threshold, izquierdo, derecho, valor, raices = [], [], [], [], [], []
+    profundidad = 0
+    desplazamiento = 0
+
+    for estimador in model.estimators_:
+        arbol = estimador.tree_
+        n = arbol.node_count
+        hojas = arbol.children_left == -1
+        indices = np.arange(n) + desplazamiento
+
+        # Las hojas apuntan a sí mismas: el recorrido puede dar siempre
+        # profundidad_max pasos sin salirse del árbol
+        feature.append(np.where(hojas, 0, arbol.feature))
+        threshold.append(np.where(hojas, np.inf, arbol.threshold))
+        izquierdo.append(np.where(hojas, indices, arbol.children_left + desplazamiento))
+        derecho.append(np.where(hojas, indices, arbol.children_right + desplazamiento))
+        valor.append(arbol.value.reshape(n, -1)[:, 0])
+        raices.append(desplazamiento)
+
+        profundidad = max(profundidad, arbol.max_depth)
+        desplazamiento += n
+
+    return {
+        'feature': np.concatenate(feature).astype(np.int32),
+        'threshold': np.concatenate(threshold).astype(np.float64),
+        'izquierdo': np.concatenate(izquierdo).astype(np.int32),
+        'derecho': np.concatenate(derecho).astype(np.int32),
+        'valor': np.concatenate(valor).astype(np.float64),
+        'raices': np.asarray(raices, dtype=np.int32),
+        'profundidad': np.asarray([profundidad], dtype=np.int32),
+        'media': np.asarray(scaler.mean_, dtype=np.float64),
+        'escala': np.asarray(scaler.scale_, dtype=np.float64),
+    }
+
+
+def guardar_bosque(arrays, ruta=RUTA_BOSQUE):
+    """Escribe un .npy por array en un directorio temporal y luego lo renombra"""
+    temporal = f"{ruta}.tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+    for clave in ARRAYS_BOSQUE:
+        np.save(os.path.join(temporal, f"{clave}.npy"), np.ascontiguousarray(arrays[clave]))
+    shutil.rmtree(ruta, ignore_errors=True)
+    os.rename(temporal, ruta)
+
+
+def clave_orden(valores):
+    """float32 -> int64 con el mismo orden: los umbrales se comparan como enteros"""
+    bits = (np.asarray(valores, dtype=np.float32) + np.float32(0.0)).view(np.int32)    # -0.0 -> 0.0
+    return np.where(bits < 0, bits ^ np.int32(0x7fffffff), bits).astype(np.int64)
+
+
+def umbral_float32(threshold):
+    """Umbral float32 equivalente: scikit-learn compara x float32 <= umbral float64,
+    que es lo mismo que comparar contra el umbral redondeado hacia abajo a float32"""
+    umbral = np.asarray(threshold).astype(np.float32)
+    arriba = umbral.astype(np.float64) > threshold
+    umbral[arriba] = np.nextafter(umbral[arriba], np.float32(-np.inf))
+    return umbral
+
+
+class BosqueCompilado:
+    """Predictor NumPy equivalente a scaler.transform + model.predict"""
+
+    def __init__(self, arrays):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.izquierdo = arrays['izquierdo']
+        self.derecho = arrays['derecho']
+        self.valor = arrays['valor']
+        self.raices = arrays['raices']
+        self.profundidad = int(arrays['profundidad'][0])
+        self.media = arrays['media']
+        self.escala = arrays['escala']
+        self._preparar_recorrido()
+
+    def _preparar_recorrido(self):
+        """Empaqueta cada nodo en un int64 para leerlo con un solo acceso por nivel:
+        parte alta = umbral como clave_orden, parte baja = salto al hijo derecho * 8 + variable.
+        Ocupa ~1 MB por worker (fuera del mmap): variable, umbral e hijo salen de una sola lectura."""
+        n = len(self.feature)
+        indices = np.arange(n)
+        hojas = self.izquierdo == indices
+
+        umbral = umbral_float32(self.threshold)
+        # Las hojas siempre "van a la derecha" con salto -1, es decir, se quedan donde están
+        umbral[hojas] = -np.inf
+        # scikit-learn guarda los árboles en preorden: el hijo izquierdo es siempre nodo + 1
+        salto = np.where(hojas, -1, self.derecho - indices - 1)
+
+        # Relleno al inicio: el recorrido indexa con nodo - nivel + profundidad (ver _predecir_bloque)
+        relleno = self.profundidad
+        self._nodos = np.zeros(n + relleno, dtype=np.int64)
+        self._nodos[relleno:] = (clave_orden(umbral) << 32) | ((salto * 8 + self.feature) & 0xffffffff)
+        self._hojas = np.zeros(n + relleno, dtype=bool)
+        self._hojas[relleno:] = hojas
+        # Niveles en los que se descartan los pares (fila, árbol) que ya llegaron a una hoja
+        self._compactar = {round(self.profundidad * 0.6), round(self.profundidad * 0.8)}
+
+    @classmethod
+    def desde_archivo(cls, ruta=RUTA_BOSQUE, mmap=True):
+        """Abre los .npy en solo lectura; con mmap no se copian al heap del proceso"""
+        arrays = {}
+        for clave in ARRAYS_BOSQUE:
+            array = np.load(os.path.join(ruta, f"{clave}.npy"), mmap_mode='r' if mmap else None)
+            # Vista ndarray sobre el mapa: evita el costo de la subclase memmap al indexar
+            arrays[clave] = array.view(np.ndarray)
+        return cls(arrays)
+
+    @property
+    def n_arboles(self):
+        return len(self.raices)
+
+    def celdas(self, j, valores):
+        """Celda de cada valor de la variable j entre los umbrales del bosque que la miran:
+        dos valores en la misma celda toman el mismo camino en todos los árboles"""
+        internos = (self.feature == j) & (self.izquierdo != np.arange(len(self.feature)))
+        umbrales = np.unique(clave_orden(umbral_float32(self.threshold[internos])))
+        claves = clave_orden(((np.asarray(valores, dtype=np.float64) - self.media[j]) / self.escala[j]).astype(np.float32))
+        # Un valor va a la derecha si su clave es mayor que la del umbral
+        return np.searchsorted(umbrales, claves, side='left')
+
+    def predecir(self, features):
+        """Predice una matriz (n, 8) de features sin escalar"""
+        X = (np.asarray(features, dtype=np.float64) - self.media) / self.escala
+        # scikit-learn compara en float32
+        claves = clave_orden(X.astype(np.float32))
+        if not len(claves):
+            return np.empty(0)
+        return np.concatenate([
+            self._predecir_bloque(claves[inicio:inicio + BLOQUE_FILAS])
+            for inicio in range(0, len(claves), BLOQUE_FILAS)
+        ])
+
+    def _predecir_bloque(self, claves):
+        """Recorre todos los árboles a la vez para un bloque de filas (claves de clave_orden).
+        Los pares (fila, árbol) van árbol por árbol. En lugar del nodo se guarda
+        rel = nodo - nivel + profundidad y se lee self._nodos[nivel:][rel]: ir a la
+        izquierda (nodo + 1) deja rel igual e ir a la derecha le suma el salto."""
+        n, variables = claves.shape
+        # La parte baja de cada nodo está en [0, 2^32): nodo < clave << 32 <=> umbral < clave
+        claves = claves.reshape(-1) << 32
+        base = np.tile(np.arange(n) * variables, self.n_arboles)
+        rel = np.repeat(self.raices.astype(np.intp) + self.profundidad, n)
+        nodos = posiciones = None
+
+        for nivel in range(self.profundidad):
+            if nivel in self._compactar:
+                sigue = ~np.take(self._hojas[nivel:], rel, mode='wrap')
+                if nodos is None:
+                    nodos, posiciones = rel + (nivel - self.profundidad), np.flatnonzero(sigue)
+                else:
+                    nodos[posiciones] = rel + (nivel - self.profundidad)
+                    posiciones = posiciones[sigue]
+                rel, base = rel[sigue], base[sigue]
+
+            # mode='wrap' evita la verificación de límites: los índices siempre son válidos
+            nodo = np.take(self._nodos[nivel:], rel, mode='wrap')
+            indice = nodo & 7
+            indice += base
+            derecha = np.take(claves, indice, mode='wrap') > nodo
+            nodo <<= 32
+            nodo >>= 35         # salto con signo
+            nodo *= derecha
+            rel += nodo
+
+        if nodos is None:
+            nodos = rel
+        else:
+            nodos[posiciones] = rel
+        return self.valor[nodos].reshape(self.n_arboles, n).mean(axis=0)
+
+
+def verificar_paridad(model, scaler, bosque, features):
+    """Máxima diferencia absoluta entre scikit-learn y el bosque compilado"""
+    entrada = features
+    # El scaler se ajustó con un DataFrame: con las mismas columnas no advierte por los nombres
+    if getattr(scaler, 'feature_names_in_', None) is not None:
+        import pandas as pd
+        entrada = pd.DataFrame(features, columns=scaler.feature_names_in_)
+    esperado = model.predict(scaler.transform(entrada))
+    obtenido = bosque.predecir(features)
+    return float(np.max(np.abs(esperado - obtenido)))
+
+
+def features_de_prueba(n=2000, semilla=0):
+    """Lotes aleatorios dentro (y un poco fuera) de los rangos del formulario"""
+    rng = np.random.default_rng(semilla)
+    og = rng.uniform(1.040, 1.085, n)
+    return np.column_stack([
+        rng.uniform(0.02, 12, n),          # abv (dataset en fracción, formulario en %)
+        rng.uniform(5, 90, n),             # ibu
+        rng.uniform(5, 40, n),             # srm
+        og,
+        og - rng.uniform(0.005, 0.030, n),  # fg
+        rng.uniform(1, 16, n),             # porcentaje_cacao
+        rng.integers(4, 15, n),            # dias_fermentacion
+        rng.integers(6, 22, n),            # dias_maduracion
+    ])
+
+
+if __name__ == '__main__':
+    import joblib
+
+    model = joblib.load('model/beer_model.pkl')
+    scaler = joblib.load('model/scaler.pkl')
+
+    arrays = aplanar_bosque(model, scaler)
+    guardar_bosque(arrays)
+    bosque = BosqueCompilado.desde_archivo()
+
+    diferencia = verificar_paridad(model, scaler, bosque, features_de_prueba())
+    print(f"🌲 {bosque.n_arboles} árboles, {len(arrays['valor'])} nodos, profundidad {bosque.profundidad}")
+    print(f"✓ Paridad con scikit-learn: diferencia máxima = {diferencia:.2e}")
+    if diferencia > 1e-9:
+        raise SystemExit("❌ El bosque compilado no coincide con scikit-learn")
+    print(f"💾 Bosque compilado guardado en {RUTA_BOSQUE}")
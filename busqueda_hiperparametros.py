@@ -0,0 +1,259 @@
+"""
+Búsqueda de hiperparámetros - CHOCOBREW
+Prueba configuraciones aleatorias del Random Forest en un pool de procesos
+con successive halving: cada ronda entrena a los sobrevivientes con más
+filas y descarta a los peores. Cada trial se mide por R², MAE, latencia
+de una fila en el bosque compilado (lo que sirve la app) y tamaño de los
+arrays publicados, y el reporte marca el frente de Pareto y recomienda
+el modelo más rápido/pequeño que cumple el piso de R².
+
+Uso:
+    python busqueda_hiperparametros.py [--trials 48] [--eta 3] [--rondas 3]
+                                       [--r2-minimo 0.6] [--n-jobs -1]
+                                       [--semilla 42] [--reporte RUTA]
+    python train_chocobrew_model.py --parametros model/busqueda_hiperparametros.json
+"""
+
+import os
+import json
+import math
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from joblib import effective_n_jobs
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import r2_score, mean_absolute_error
+
+from bosque_compilado import aplanar_bosque, BosqueCompilado
+from train_chocobrew_model import (
+    RUTA_DATOS, FEATURE_COLUMNS, OBJETIVO, PARAMETROS_MODELO, cargar_features, hash_archivo
+)
+
+RUTA_REPORTE = 'model/busqueda_hiperparametros.json'
+
+# ==============================
+# ESPACIO DE BÚSQUEDA
+# ==============================
+ESPACIO = {
+    'n_estimators': [10, 25, 50, 100, 200],
+    'max_depth': [4, 6, 8, 10, 12, 14],
+    'min_samples_split': [2, 4, 8, 16],
+    'min_samples_leaf': [1, 2, 4, 8],
+    'max_features': [1.0, 0.6, 0.33],
+}
+
+REPETICIONES_LATENCIA = 300
+
+# ==============================
+# TRIALS (se ejecutan en los procesos del pool)
+# ==============================
+_DATOS = {}
+
+
+def _iniciar_proceso(X_entrenamiento, y_entrenamiento, X_validacion, y_validacion, scaler):
+    """Los datos se envían una vez por proceso, no una vez por trial"""
+    _DATOS.update(
+        X_entrenamiento=scaler.transform(X_entrenamiento), y_entrenamiento=y_entrenamiento,
+        X_validacion=scaler.transform(X_validacion), y_validacion=y_validacion, scaler=scaler,
+    )
+
+
+def _evaluar_trial(parametros, filas, semilla, devolver_bosque):
+    """Entrena con las primeras `filas` filas y mide sobre la validación"""
+    inicio = time.perf_counter()
+    modelo = RandomForestRegressor(**parametros, random_state=semilla, n_jobs=1)
+    modelo.fit(_DATOS['X_entrenamiento'][:filas], _DATOS['y_entrenamiento'][:filas])
+    y_pred = modelo.predict(_DATOS['X_validacion'])
+
+    arrays = aplanar_bosque(modelo, _DATOS['scaler'])
+    resultado = {
+        'filas': filas,
+        'r2': round(float(r2_score(_DATOS['y_validacion'], y_pred)), 4),
+        'mae': round(float(mean_absolute_error(_DATOS['y_validacion'], y_pred)), 4),
+        'tamano_kb': round(sum(array.nbytes for array in arrays.values()) / 1024, 1),
+        'nodos': int(len(arrays['valor'])),
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+    return resultado, arrays if devolver_bosque else None
+
+# ==============================
+# SUCCESSIVE HALVING Y PARETO
+# ==============================
+def muestrear_configuraciones(n, semilla):
+    """n combinaciones distintas del espacio (o todas si hay menos); la
+    primera es la configuración actual, como referencia"""
+    rng = np.random.default_rng(semilla)
+    total = math.prod(len(valores) for valores in ESPACIO.values())
+    actual = {nombre: PARAMETROS_MODELO.get(nombre, 1.0) for nombre in ESPACIO}
+    vistas, configuraciones = {tuple(actual.values())}, [actual]
+    while len(configuraciones) < min(n, total):
+        parametros = {nombre: valores[rng.integers(len(valores))] for nombre, valores in ESPACIO.items()}
+        clave = tuple(parametros.values())
+        if clave not in vistas:
+            vistas.add(clave)
+            configuraciones.append(parametros)
+    return configuraciones
+
+
+def domina(a, b):
+    """a domina a b si no es peor en ningún objetivo y es mejor en alguno (todo se minimiza)"""
+    return all(x <= y for x, y in zip(a, b)) and any(x < y for x, y in zip(a, b))
+
+
+def rangos_pareto(puntos):
+    """Número de frente (0 = no dominado) de cada punto"""
+    rangos = [None] * len(puntos)
+    restantes = set(range(len(puntos)))
+    frente = 0
+    while restantes:
+        actual = {i for i in restantes if not any(domina(puntos[j], puntos[i]) for j in restantes if j != i)}
+        for i in actual:
+            rangos[i] = frente
+        restantes -= actual
+        frente += 1
+    return rangos
+
+
+def presupuestos(total_filas, rondas, eta):
+    """Filas por ronda: total / eta^(rondas-1), ..., total / eta, total"""
+    return [max(50, int(total_filas / eta ** (rondas - 1 - ronda))) for ronda in range(rondas)]
+
+
+def medir_latencia(arrays, fila, repeticiones=REPETICIONES_LATENCIA):
+    """p50 y p99 en ms de predecir una fila con el bosque compilado"""
+    bosque = BosqueCompilado(arrays)
+    for _ in range(20):
+        bosque.predecir(fila)
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        bosque.predecir(fila)
+        tiempos.append(time.perf_counter() - inicio)
+    p50, p99 = np.percentile(tiempos, [50, 99]) * 1000
+    return round(float(p50), 4), round(float(p99), 4)
+
+
+def buscar(args):
+    df = cargar_features(args.datos, args.semilla)
+    X = df[FEATURE_COLUMNS].to_numpy()
+    y = df[OBJETIVO].to_numpy()
+
+    # Misma partición que el entrenamiento: el conjunto de prueba no se toca aquí
+    X_train, _, y_train, _ = train_test_split(X, y, test_size=0.2, random_state=args.semilla)
+    X_ent, X_val, y_ent, y_val = train_test_split(X_train, y_train, test_size=0.25, random_state=args.semilla)
+    scaler = StandardScaler().fit(X_ent)
+
+    configuraciones = muestrear_configuraciones(args.trials, args.semilla)
+    trials = [{'id': i, 'parametros': parametros, 'rondas': []} for i, parametros in enumerate(configuraciones)]
+    vivos = list(trials)
+    filas_por_ronda = presupuestos(len(X_ent), args.rondas, args.eta)
+    procesos = effective_n_jobs(args.n_jobs)
+
+    print(f"🔎 {len(trials)} configuraciones, rondas de {filas_por_ronda} filas, {procesos} procesos")
+
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso,
+                             initargs=(X_ent, y_ent, X_val, y_val, scaler)) as pool:
+        for ronda, filas in enumerate(filas_por_ronda):
+            ultima = ronda == len(filas_por_ronda) - 1
+            inicio = time.perf_counter()
+            futuros = [pool.submit(_evaluar_trial, t['parametros'], filas, args.semilla, ultima) for t in vivos]
+            for trial, futuro in zip(vivos, futuros):
+                resultado, arrays = futuro.result()
+                trial['rondas'].append(resultado)
+                if arrays is not None:
+                    trial['_arrays'] = arrays
+
+            if not ultima:
+                # Se conservan los mejores frentes de (R², tamaño): un modelo
+                # pequeño con R² algo menor no se descarta solo por eso
+                puntos = [(-t['rondas'][-1]['r2'], t['rondas'][-1]['tamano_kb']) for t in vivos]
+                rangos = rangos_pareto(puntos)
+                orden = sorted(range(len(vivos)), key=lambda i: (rangos[i], puntos[i]))
+                vivos = [vivos[i] for i in orden[:max(1, math.ceil(len(vivos) / args.eta))]]
+
+            print(f"  Ronda {ronda + 1}: {len(futuros)} trials con {filas} filas en "
+                  f"{time.perf_counter() - inicio:.1f}s → {len(vivos)} siguen")
+
+    # La latencia se mide en este proceso, uno a la vez, para no medir la contención del pool
+    fila = np.median(X_val, axis=0, keepdims=True)
+    for trial in vivos:
+        final = trial['rondas'][-1]
+        final['latencia_p50_ms'], final['latencia_p99_ms'] = medir_latencia(trial.pop('_arrays'), fila)
+
+    puntos = [(-t['rondas'][-1]['r2'], t['rondas'][-1]['mae'], t['rondas'][-1]['latencia_p50_ms'],
+               t['rondas'][-1]['tamano_kb']) for t in vivos]
+    for trial, rango in zip(vivos, rangos_pareto(puntos)):
+        trial['pareto'] = rango == 0
+
+    aceptables = [t for t in vivos if t['rondas'][-1]['r2'] >= args.r2_minimo]
+    recomendado = min(
+        aceptables, key=lambda t: (t['rondas'][-1]['latencia_p50_ms'], t['rondas'][-1]['tamano_kb']), default=None
+    )
+
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'hash_datos': hash_archivo(args.datos),
+        'semilla': args.semilla,
+        'r2_minimo': args.r2_minimo,
+        'eta': args.eta,
+        'filas_por_ronda': filas_por_ronda,
+        'recomendado': {'id': recomendado['id'], 'parametros': recomendado['parametros'],
+                        **recomendado['rondas'][-1]} if recomendado else None,
+        'trials': trials,
+    }
+
+
+def imprimir_reporte(reporte):
+    finales = [t for t in reporte['trials'] if 'pareto' in t]
+    finales.sort(key=lambda t: (not t['pareto'], -t['rondas'][-1]['r2']))
+
+    print("\n📊 TRIALS EN LA RONDA FINAL (★ = frente de Pareto):")
+    print(f"  {'':2}{'id':>4}{'árboles':>9}{'prof':>6}{'split':>7}{'hoja':>6}{'feat':>6}"
+          f"{'R²':>8}{'MAE':>8}{'p50 ms':>9}{'KB':>9}")
+    for trial in finales:
+        p, r = trial['parametros'], trial['rondas'][-1]
+        print(f"  {'★' if trial['pareto'] else ' ':2}{trial['id']:>4}{p['n_estimators']:>9}{p['max_depth']:>6}"
+              f"{p['min_samples_split']:>7}{p['min_samples_leaf']:>6}{p['max_features']:>6}"
+              f"{r['r2']:>8.3f}{r['mae']:>8.3f}{r['latencia_p50_ms']:>9.3f}{r['tamano_kb']:>9.1f}")
+
+    recomendado = reporte['recomendado']
+    if recomendado is None:
+        print(f"\n⚠️ Ningún trial alcanzó R² ≥ {reporte['r2_minimo']}")
+        return
+    print(f"\n✓ Recomendado (R² ≥ {reporte['r2_minimo']}, menor latencia): trial {recomendado['id']} "
+          f"{recomendado['parametros']}")
+    referencia = reporte['trials'][0]['rondas'][-1]
+    print(f"  Actual (trial 0, {PARAMETROS_MODELO['n_estimators']} árboles, profundidad {PARAMETROS_MODELO['max_depth']}): "
+          f"R² {referencia['r2']:.3f}, {referencia['tamano_kb']:.1f} KB con {referencia['filas']} filas")
+
+
+def leer_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Búsqueda de hiperparámetros CHOCOBREW")
+    parser.add_argument('--datos', default=RUTA_DATOS, help="CSV de origen (por defecto %(default)s)")
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--trials', type=int, default=48, help="configuraciones iniciales")
+    parser.add_argument('--eta', type=int, default=3, help="en cada ronda sigue 1/eta de los trials")
+    parser.add_argument('--rondas', type=int, default=3, help="rondas de successive halving")
+    parser.add_argument('--r2-minimo', type=float, default=0.6, help="piso de R² para recomendar un modelo")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="procesos del pool (-1 = todos los núcleos)")
+    parser.add_argument('--reporte', default=RUTA_REPORTE, help="JSON de salida (por defecto %(default)s)")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = leer_argumentos()
+    reporte = buscar(args)
+
+    os.makedirs(os.path.dirname(args.reporte) or '.', exist_ok=True)
+    with open(args.reporte, 'w', encoding='utf-8') as archivo:
+        json.dump(reporte, archivo, indent=2, ensure_ascii=False)
+
+    imprimir_reporte(reporte)
+    print(f"\n💾 Reporte guardado en {args.reporte}")
+    if reporte['recomendado']:
+        print(f"   Entrenar y publicar: python train_chocobrew_model.py --parametros {args.reporte}")
@@ -0,0 +1,65 @@
+"""
+Caché LRU en memoria - CHOCOBREW
+Tamaño acotado, expiración por TTL y contadores de aciertos/fallos
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+_AUSENTE = object()
+
+
+class CacheLRU:
+    """Diccionario LRU seguro entre hilos; max_entradas=0 lo desactiva"""
+
+    def __init__(self, max_entradas=1024, ttl=None):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+        self._datos = OrderedDict()     # clave -> (valor, expira)
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, defecto=None):
+        if self.max_entradas <= 0:
+            return defecto
+        with self._lock:
+            entrada = self._datos.get(clave, _AUSENTE)
+            if entrada is not _AUSENTE:
+                valor, expira = entrada
+                if expira is None or expira > time.monotonic():
+                    self._datos.move_to_end(clave)
+                    self.aciertos += 1
+                    return valor
+                del self._datos[clave]
+            self.fallos += 1
+            return defecto
+
+    def guardar(self, clave, valor):
+        if self.max_entradas <= 0:
+            return
+        expira = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._datos[clave] = (valor, expira)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def eliminar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        return {
+            'entradas': len(self._datos),
+            'max_entradas': self.max_entradas,
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': round(self.aciertos / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,249 @@
+"""
+Pool de conexiones PostgreSQL - CHOCOBREW
+Reutiliza conexiones a Neon.tech dentro de cada worker de gunicorn
+"""
+
+import os
+import time
+import uuid
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+from metricas import REGISTRO
+
+try:
+    import psycopg2
+    from psycopg2.extras import RealDictCursor, execute_values
+    from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+    from psycopg2 import Error
+    POSTGRES_AVAILABLE = True
+except ImportError as e:
+    POSTGRES_AVAILABLE = False
+    Error = Exception
+    execute_values = None
+    logging.getLogger(__name__).warning(f"PostgreSQL no disponible: {e}")
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# CONFIGURACIÓN
+# =====================================================
+
+POOL_MAX_CONEXIONES = int(os.environ.get('DB_POOL_MAX', 5))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+POOL_VIDA_MAXIMA = float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800))
+POOL_CHEQUEO_INACTIVA = float(os.environ.get('DB_POOL_CHECK_IDLE', 30))
+
+
+class PoolAgotado(Exception):
+    """No hubo conexión libre dentro del tiempo de espera"""
+
+
+class PoolConexiones:
+    """Pool acotado de conexiones con chequeo de salud y reciclaje por edad"""
+
+    def __init__(self, dsn, max_conexiones=POOL_MAX_CONEXIONES, timeout=POOL_TIMEOUT,
+                 vida_maxima=POOL_VIDA_MAXIMA, chequeo_inactiva=POOL_CHEQUEO_INACTIVA):
+        self.dsn = dsn
+        self.max_conexiones = max_conexiones
+        self.timeout = timeout
+        self.vida_maxima = vida_maxima
+        self.chequeo_inactiva = chequeo_inactiva
+        self.pid = os.getpid()
+        self._libres = []        # (conexion, creada, ultimo_uso)
+        self._creada = {}        # conexion -> instante de creación
+        self._en_uso = 0
+        self._cond = threading.Condition()
+        self.creadas = 0
+        self.descartadas = 0
+        self.agotadas = 0
+
+    def _crear(self):
+        connection = psycopg2.connect(self.dsn, cursor_factory=RealDictCursor)
+        self._creada[connection] = time.monotonic()
+        self.creadas += 1
+        return connection
+
+    def _cerrar(self, connection):
+        self._creada.pop(connection, None)
+        self.descartadas += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _es_saludable(self, connection, ultimo_uso):
+        """Descarta conexiones cerradas, viejas o que no responden"""
+        if connection.closed:
+            return False
+        ahora = time.monotonic()
+        if ahora - self._creada.get(connection, ahora) > self.vida_maxima:
+            return False
+        if ahora - ultimo_uso > self.chequeo_inactiva:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                connection.rollback()
+            except Error:
+                return False
+        return True
+
+    def obtener(self):
+        """Toma una conexión libre o crea una nueva sin superar el máximo"""
+        limite = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                if self._libres:
+                    connection, _, ultimo_uso = self._libres.pop()
+                elif self._en_uso < self.max_conexiones:
+                    connection, ultimo_uso = None, None
+                else:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self.agotadas += 1
+                        raise PoolAgotado(f"Sin conexiones libres tras {self.timeout}s")
+                    self._cond.wait(restante)
+                    continue
+                self._en_uso += 1
+
+            if connection is not None:
+                if self._es_saludable(connection, ultimo_uso):
+                    return connection
+                self._cerrar(connection)
+
+            try:
+                return self._crear()
+            except Exception:
+                with self._cond:
+                    self._en_uso -= 1
+                    self._cond.notify()
+                raise
+
+    def devolver(self, connection, descartar=False):
+        """Regresa la conexión al pool dejando la transacción cerrada"""
+        if not descartar and not connection.closed:
+            try:
+                if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except Error:
+                descartar = True
+
+        with self._cond:
+            self._en_uso -= 1
+            if descartar or connection.closed:
+                self._cerrar(connection)
+            else:
+                self._libres.append((connection, self._creada.get(connection), time.monotonic()))
+            self._cond.notify()
+
+    def estadisticas(self):
+        with self._cond:
+            return {
+                'libres': len(self._libres),
+                'en_uso': self._en_uso,
+                'max_conexiones': self.max_conexiones,
+                'creadas': self.creadas,
+                'descartadas': self.descartadas,
+                'agotadas': self.agotadas,
+            }
+
+    def cerrar_todas(self):
+        with self._cond:
+            for connection, _, _ in self._libres:
+                self._cerrar(connection)
+            self._libres.clear()
+
+
+# =====================================================
+# POOL POR PROCESO
+# =====================================================
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# =====================================================
+# MÉTRICAS
+# =====================================================
+
+ESPERA_CONEXION = REGISTRO.histograma(
+    'chocobrew_bd_espera_conexion_segundos', 'Tiempo para obtener una conexión del pool')
+
+
+def _valores_pool(claves):
+    if _pool is None or _pool.pid != os.getpid():
+        return {}
+    estadisticas = _pool.estadisticas()
+    return {clave: estadisticas[clave] for clave in claves}
+
+
+REGISTRO.medidor(
+    'chocobrew_bd_pool_conexiones', 'Conexiones del pool por estado',
+    lambda: _valores_pool(('libres', 'en_uso', 'max_conexiones')),
+    etiquetas=('estado',))
+REGISTRO.medidor(
+    'chocobrew_bd_pool_eventos_total', 'Conexiones creadas, descartadas y esperas agotadas',
+    lambda: _valores_pool(('creadas', 'descartadas', 'agotadas')),
+    etiquetas=('evento',), tipo='counter')
+
+
+def obtener_pool():
+    """Devuelve el pool del proceso actual (se recrea tras un fork de gunicorn)"""
+    global _pool
+    if not POSTGRES_AVAILABLE:
+        return None
+
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        return None
+
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = PoolConexiones(database_url)
+    return _pool
+
+
+@contextmanager
+def conexion_bd():
+    """Presta una conexión del pool; entrega None si la BD no está disponible"""
+    pool = obtener_pool()
+    connection = None
+
+    if pool is not None:
+        try:
+            with ESPERA_CONEXION.medir():
+                connection = pool.obtener()
+        except Exception as e:
+            logger.error(f"Error conectando a PostgreSQL: {e}")
+    elif POSTGRES_AVAILABLE:
+        logger.warning("DATABASE_URL no configurado")
+
+    if connection is None:
+        yield None
+        return
+
+    descartar = False
+    try:
+        yield connection
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        descartar = True
+        raise
+    finally:
+        pool.devolver(connection, descartar)
+
+
+def cursor_servidor(connection, itersize=2000):
+    """Cursor con nombre: las filas se quedan en PostgreSQL y llegan de a itersize"""
+    cursor = connection.cursor(name=f"cursor_{uuid.uuid4().hex}",
+                               cursor_factory=psycopg2.extensions.cursor)
+    cursor.itersize = itersize
+    return cursor
+
+
+@atexit.register
+def cerrar_pool():
+    if _pool is not None and _pool.pid == os.getpid():
+        _pool.cerrar_todas()
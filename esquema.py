@@ -0,0 +1,149 @@
+"""
+Migraciones del esquema PostgreSQL - CHOCOBREW
+Cada archivo migraciones/NNNN_nombre.sql se aplica una sola vez, en orden
+y dentro de su propia transacción; las aplicadas quedan registradas en
+la tabla migraciones_esquema junto con el checksum del archivo. Si una
+migración ya aplicada cambió, aplicar se detiene sin tocar el esquema.
+
+Uso:
+    python esquema.py aplicar
+    python esquema.py estado
+"""
+
+import os
+import re
+import sys
+import hashlib
+
+from db import conexion_bd
+
+RUTA_MIGRACIONES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migraciones')
+PATRON_MIGRACION = re.compile(r'^(\d{4})_(\w+)\.sql$')
+
+# Evita que dos procesos (p. ej. dos deploys) migren a la vez
+CANDADO_MIGRACIONES = 48151623
+
+
+class MigracionModificada(RuntimeError):
+    """Una migración ya aplicada no coincide con el checksum registrado"""
+
+
+def listar_migraciones():
+    """[(version, nombre, sql, checksum)] ordenadas por versión"""
+    migraciones = []
+    for archivo in sorted(os.listdir(RUTA_MIGRACIONES)):
+        coincidencia = PATRON_MIGRACION.match(archivo)
+        if not coincidencia:
+            continue
+        with open(os.path.join(RUTA_MIGRACIONES, archivo), encoding='utf-8') as f:
+            sql = f.read()
+        migraciones.append((int(coincidencia.group(1)), coincidencia.group(2), sql,
+                            hashlib.sha256(sql.encode('utf-8')).hexdigest()))
+    return migraciones
+
+
+def _crear_tabla_registro(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS migraciones_esquema (
+            version INTEGER PRIMARY KEY,
+            nombre VARCHAR(100) NOT NULL,
+            checksum CHAR(64) NOT NULL,
+            aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _aplicadas(cursor):
+    cursor.execute("SELECT version, checksum FROM migraciones_esquema")
+    return {fila['version']: fila['checksum'] for fila in cursor.fetchall()}
+
+
+def aplicar_migraciones():
+    """Aplica las migraciones pendientes; devuelve las versiones aplicadas"""
+    with conexion_bd() as connection:
+        if not connection:
+            raise RuntimeError("No se pudo conectar a la base de datos (revisa DATABASE_URL)")
+
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (CANDADO_MIGRACIONES,))
+            _crear_tabla_registro(cursor)
+            connection.commit()
+
+            aplicadas = _aplicadas(cursor)
+            migraciones = listar_migraciones()
+            # Editar una migración aplicada no cambia las bases donde ya corrió:
+            # el cambio va en un archivo nuevo
+            modificadas = [f'{version:04d}_{nombre}' for version, nombre, _, checksum in migraciones
+                           if version in aplicadas and aplicadas[version] != checksum]
+            if modificadas:
+                raise MigracionModificada(
+                    f"Migraciones aplicadas que cambiaron: {', '.join(modificadas)}. "
+                    "Restaura el archivo y agrega el cambio en una migración nueva."
+                )
+
+            nuevas = []
+            for version, nombre, sql, checksum in migraciones:
+                if version in aplicadas:
+                    continue
+                try:
+                    cursor.execute(sql)
+                    cursor.execute(
+                        "INSERT INTO migraciones_esquema (version, nombre, checksum) VALUES (%s, %s, %s)",
+                        (version, nombre, checksum)
+                    )
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+                nuevas.append(version)
+            return nuevas
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (CANDADO_MIGRACIONES,))
+            connection.commit()
+            cursor.close()
+
+
+def estado_migraciones():
+    """[(version, nombre, estado)] con estado 'aplicada', 'pendiente' o 'modificada'"""
+    with conexion_bd() as connection:
+        if not connection:
+            raise RuntimeError("No se pudo conectar a la base de datos (revisa DATABASE_URL)")
+
+        cursor = connection.cursor()
+        try:
+            _crear_tabla_registro(cursor)
+            connection.commit()
+            aplicadas = _aplicadas(cursor)
+        finally:
+            cursor.close()
+
+    estado = []
+    for version, nombre, _, checksum in listar_migraciones():
+        if version not in aplicadas:
+            estado.append((version, nombre, 'pendiente'))
+        elif aplicadas[version] != checksum:
+            estado.append((version, nombre, 'modificada'))
+        else:
+            estado.append((version, nombre, 'aplicada'))
+    return estado
+
+
+if __name__ == '__main__':
+    comando = sys.argv[1] if len(sys.argv) > 1 else 'estado'
+
+    if comando == 'aplicar':
+        try:
+            nuevas = aplicar_migraciones()
+        except MigracionModificada as e:
+            raise SystemExit(f"❌ {e}")
+        if nuevas:
+            print(f"✓ Migraciones aplicadas: {', '.join(f'{v:04d}' for v in nuevas)}")
+        else:
+            print("✓ El esquema ya está al día")
+    elif comando == 'estado':
+        marcas = {'aplicada': '✓', 'pendiente': '·', 'modificada': '⚠'}
+        for version, nombre, estado in estado_migraciones():
+            print(f"{marcas[estado]} {version:04d}_{nombre} ({estado})")
+    else:
+        raise SystemExit(__doc__)
@@ -0,0 +1,111 @@
+"""
+Exportación de lotes - CHOCOBREW
+Convierte bloques de filas (tuplas en el orden de COLUMNAS_EXPORTACION)
+en trozos de CSV o Parquet a medida que llegan, sin juntar el archivo
+completo en memoria.
+"""
+
+import io
+import csv
+import importlib.util
+
+PARQUET_DISPONIBLE = importlib.util.find_spec('pyarrow') is not None
+
+# (columna, expresión SQL, tipo); los NUMERIC salen como float8 desde la BD
+COLUMNAS_EXPORTACION = [
+    ('id', 'id', 'entero'),
+    ('codigo_lote', 'codigo_lote', 'texto'),
+    ('fecha_elaboracion', 'fecha_elaboracion', 'fecha'),
+    ('fecha_vencimiento', 'fecha_vencimiento', 'fecha'),
+    ('abv', 'abv::float8', 'decimal'),
+    ('ibu', 'ibu', 'entero'),
+    ('srm', 'srm', 'entero'),
+    ('og', 'og::float8', 'decimal'),
+    ('fg', 'fg::float8', 'decimal'),
+    ('porcentaje_cacao', 'porcentaje_cacao::float8', 'decimal'),
+    ('dias_fermentacion', 'dias_fermentacion', 'entero'),
+    ('dias_maduracion', 'dias_maduracion', 'entero'),
+    ('puntuacion', 'puntuacion::float8', 'decimal'),
+    ('categoria', 'categoria', 'texto'),
+    ('calorias', 'calorias', 'entero'),
+    ('carbohidratos', 'carbohidratos::float8', 'decimal'),
+    ('proteinas', 'proteinas::float8', 'decimal'),
+    ('grasas', 'grasas::float8', 'decimal'),
+    ('azucares', 'azucares::float8', 'decimal'),
+    ('version_modelo', 'version_modelo', 'texto'),
+    ('fecha_creacion', 'fecha_creacion', 'marca_tiempo'),
+]
+
+FORMATOS_EXPORTACION = {
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def columnas_sql():
+    return ', '.join(f"{expresion} AS {nombre}" for nombre, expresion, _ in COLUMNAS_EXPORTACION)
+
+
+def csv_por_bloques(bloques):
+    """Encabezado (con BOM para Excel) y luego un trozo de CSV por bloque"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow([nombre for nombre, _, _ in COLUMNAS_EXPORTACION])
+    yield buffer.getvalue().encode('utf-8-sig')
+
+    for filas in bloques:
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(filas)
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _SalidaIncremental(io.RawIOBase):
+    """Archivo de solo escritura que se vacía por partes pero conserva la posición,
+    que Parquet necesita para los offsets del pie"""
+
+    def __init__(self):
+        self._pendiente = []
+        self._posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._pendiente.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def vaciar(self):
+        datos = b''.join(self._pendiente)
+        self._pendiente.clear()
+        return datos
+
+
+def parquet_por_bloques(bloques):
+    """Un row group de Parquet por bloque; el pie se emite al final"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tipos = {
+        'entero': pa.int32(),
+        'decimal': pa.float64(),
+        'texto': pa.string(),
+        'fecha': pa.date32(),
+        'marca_tiempo': pa.timestamp('us'),
+    }
+    esquema = pa.schema([(nombre, tipos[tipo]) for nombre, _, tipo in COLUMNAS_EXPORTACION])
+
+    salida = _SalidaIncremental()
+    with pq.ParquetWriter(salida, esquema, compression='snappy') as escritor:
+        for filas in bloques:
+            columnas = list(zip(*filas))
+            escritor.write_table(pa.Table.from_arrays(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(columnas, esquema)],
+                schema=esquema
+            ))
+            yield salida.vaciar()
+    yield salida.vaciar()
@@ -0,0 +1,153 @@
+"""
+Métricas en formato Prometheus - CHOCOBREW
+Contadores e histogramas en memoria (por proceso) y medidores que se
+calculan solo al leer /metrics. Registrar una observación es una
+búsqueda binaria y una suma bajo un lock: no hay E/S en la ruta caliente.
+"""
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Latencias de 0.5 ms a 10 s
+CUBETAS_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CUBETAS_FILAS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384)
+
+
+def _formatear_etiquetas(nombres, valores, extra=()):
+    pares = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    pares += [f'{nombre}="{valor}"' for nombre, valor in extra]
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, cantidad=1, **etiquetas):
+        clave = tuple(etiquetas.get(nombre, '') for nombre in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            valores = list(self._valores.items())
+        for clave, valor in valores:
+            lineas.append(f"{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {_numero(valor)}")
+        return lineas
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, etiquetas=(), cubetas=CUBETAS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.cubetas = tuple(cubetas)
+        self._series = {}       # etiquetas -> [conteos por cubeta, suma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(etiquetas.get(nombre, '') for nombre in self.etiquetas)
+        indice = bisect.bisect_left(self.cubetas, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * (len(self.cubetas) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        """Observa la duración del bloque en segundos"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = [(clave, list(conteos), suma, total) for clave, (conteos, suma, total) in self._series.items()]
+        for clave, conteos, suma, total in series:
+            acumulado = 0
+            for limite, conteo in zip(self.cubetas + (float('inf'),), conteos):
+                acumulado += conteo
+                etiquetas = _formatear_etiquetas(self.etiquetas, clave, [('le', _numero(limite))])
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+            etiquetas = _formatear_etiquetas(self.etiquetas, clave)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {total}")
+        return lineas
+
+
+class MedidorCalculado:
+    """Valores leídos al momento de exponer; funcion devuelve un número o
+    {(valor_etiqueta, ...): número}"""
+
+    def __init__(self, nombre, ayuda, funcion, etiquetas=(), tipo='gauge'):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.etiquetas = tuple(etiquetas)
+        self.tipo = tipo
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        valores = self.funcion()
+        if not isinstance(valores, dict):
+            valores = {(): valores}
+        for clave, valor in valores.items():
+            if valor is None:
+                continue
+            clave = clave if isinstance(clave, tuple) else (clave,)
+            lineas.append(f"{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {_numero(valor)}")
+        return lineas
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nombre, metrica)
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._registrar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), cubetas=CUBETAS_SEGUNDOS):
+        return self._registrar(Histograma(nombre, ayuda, etiquetas, cubetas))
+
+    def medidor(self, nombre, ayuda, funcion, etiquetas=(), tipo='gauge'):
+        return self._registrar(MedidorCalculado(nombre, ayuda, funcion, etiquetas, tipo))
+
+    def exponer(self):
+        """Texto en formato de exposición de Prometheus (version=0.0.4)"""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            lineas.extend(metrica.exponer())
+        return '\n'.join(lineas) + '\n'
+
+
+REGISTRO = RegistroMetricas()
@@ -0,0 +1,35 @@
+-- Tablas base de CHOCOBREW (IF NOT EXISTS: las bases creadas a mano se
+-- ajustan en las migraciones siguientes)
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id SERIAL PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    email VARCHAR(150) NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    ultimo_acceso TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS lotes_chocobrew (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES usuarios(id),
+    codigo_lote VARCHAR(50) NOT NULL,
+    fecha_elaboracion DATE NOT NULL,
+    fecha_vencimiento DATE NOT NULL,
+    abv NUMERIC(4,2),
+    ibu INTEGER,
+    srm INTEGER,
+    og NUMERIC(5,3),
+    fg NUMERIC(5,3),
+    porcentaje_cacao NUMERIC(4,2),
+    dias_fermentacion INTEGER,
+    dias_maduracion INTEGER,
+    puntuacion NUMERIC(3,2),
+    categoria VARCHAR(20),
+    calorias INTEGER,
+    carbohidratos NUMERIC(5,1),
+    proteinas NUMERIC(5,1),
+    grasas NUMERIC(5,1),
+    azucares NUMERIC(5,1),
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
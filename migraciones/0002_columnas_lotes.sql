@@ -0,0 +1,6 @@
+-- Versión del modelo que produjo la puntuación
+ALTER TABLE lotes_chocobrew ADD COLUMN IF NOT EXISTS version_modelo VARCHAR(40);
+ALTER TABLE lotes_chocobrew ADD COLUMN IF NOT EXISTS fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+-- Los QR se generan bajo demanda en /qr/<id>.png|svg: la tabla no guarda imágenes
+ALTER TABLE lotes_chocobrew DROP COLUMN IF EXISTS qr_code_base64;
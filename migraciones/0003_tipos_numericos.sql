@@ -0,0 +1,11 @@
+-- Tipos exactos para las columnas numéricas (sin reescritura si ya coinciden)
+ALTER TABLE lotes_chocobrew
+    ALTER COLUMN abv TYPE NUMERIC(4,2) USING abv::numeric,
+    ALTER COLUMN og TYPE NUMERIC(5,3) USING og::numeric,
+    ALTER COLUMN fg TYPE NUMERIC(5,3) USING fg::numeric,
+    ALTER COLUMN porcentaje_cacao TYPE NUMERIC(4,2) USING porcentaje_cacao::numeric,
+    ALTER COLUMN puntuacion TYPE NUMERIC(3,2) USING puntuacion::numeric,
+    ALTER COLUMN carbohidratos TYPE NUMERIC(5,1) USING carbohidratos::numeric,
+    ALTER COLUMN proteinas TYPE NUMERIC(5,1) USING proteinas::numeric,
+    ALTER COLUMN grasas TYPE NUMERIC(5,1) USING grasas::numeric,
+    ALTER COLUMN azucares TYPE NUMERIC(5,1) USING azucares::numeric;
@@ -0,0 +1,18 @@
+-- login y register: WHERE email = %s (las bases creadas con UNIQUE ya tienen uno)
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_indexes
+        WHERE tablename = 'usuarios' AND indexdef LIKE 'CREATE UNIQUE INDEX % USING btree (email)'
+    ) THEN
+        CREATE UNIQUE INDEX ux_usuarios_email ON usuarios (email);
+    END IF;
+END $$;
+
+-- Requerido por INSERT ... ON CONFLICT (codigo_lote) en guardar_lote_en_bd
+CREATE UNIQUE INDEX IF NOT EXISTS ux_lotes_codigo_lote ON lotes_chocobrew (codigo_lote);
+
+-- Listado paginado de /mis-lotes: WHERE user_id ORDER BY fecha_elaboracion DESC, id DESC
+-- (ver_lote filtra por id y le basta la clave primaria)
+CREATE INDEX IF NOT EXISTS ix_lotes_usuario_fecha
+    ON lotes_chocobrew (user_id, fecha_elaboracion DESC, id DESC);
@@ -0,0 +1,24 @@
+-- Resumen de lotes por usuario, mes, categoría y tramo de cacao (1 %):
+-- /api/v1/analitica lee O(grupos) filas en lugar de recorrer todos los lotes.
+-- guardar_lote_en_bd y guardar_lotes_en_bd lo actualizan en la misma transacción.
+CREATE TABLE IF NOT EXISTS resumen_lotes (
+    user_id INTEGER NOT NULL REFERENCES usuarios(id),
+    mes DATE NOT NULL,
+    categoria VARCHAR(20) NOT NULL,
+    tramo_cacao SMALLINT NOT NULL,
+    lotes INTEGER NOT NULL,
+    suma_puntuacion NUMERIC(12,2) NOT NULL,
+    PRIMARY KEY (user_id, mes, categoria, tramo_cacao)
+);
+
+-- Lotes ya existentes
+INSERT INTO resumen_lotes (user_id, mes, categoria, tramo_cacao, lotes, suma_puntuacion)
+SELECT user_id,
+       date_trunc('month', fecha_elaboracion)::date,
+       COALESCE(categoria, ''),
+       COALESCE(floor(porcentaje_cacao), 0)::smallint,
+       COUNT(*),
+       COALESCE(SUM(puntuacion), 0)
+FROM lotes_chocobrew
+GROUP BY 1, 2, 3, 4
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,5 @@
+-- Última modificación del lote: nutricion.py recalcular la actualiza y la página
+-- pública la usa como Last-Modified (los lotes ya existentes parten de fecha_creacion)
+ALTER TABLE lotes_chocobrew ADD COLUMN IF NOT EXISTS actualizado_en TIMESTAMP;
+UPDATE lotes_chocobrew SET actualizado_en = COALESCE(fecha_creacion, CURRENT_TIMESTAMP) WHERE actualizado_en IS NULL;
+ALTER TABLE lotes_chocobrew ALTER COLUMN actualizado_en SET DEFAULT CURRENT_TIMESTAMP;
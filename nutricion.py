@@ -0,0 +1,157 @@
+"""
+Tabla nutricional - CHOCOBREW
+Valores aproximados por 100 ml a partir de ABV, % de cacao y OG, para un
+lote (escalar) o para columnas de lotes (NumPy), y el recálculo en bloque
+de las columnas guardadas en lotes_chocobrew cuando cambia la fórmula.
+
+Uso:
+    python nutricion.py recalcular [filas_por_bloque]
+"""
+
+import os
+import sys
+import glob
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS_NUTRICIONALES = ['calorias', 'carbohidratos', 'proteinas', 'grasas', 'azucares']
+
+
+def calcular_tabla_nutricional(abv, porcentaje_cacao, og):
+    """Calcula valores nutricionales aproximados por 100ml"""
+    calorias = (og - 1) * 1000 * 4 + (abv * 7)
+    carbohidratos = (og - 1) * 1000 * 0.8
+    proteinas = 0.3 + (porcentaje_cacao * 0.1)
+    grasas = porcentaje_cacao * 0.15
+    azucares = carbohidratos * 0.6
+    
+    return {
+        'calorias': round(calorias),
+        'carbohidratos': round(carbohidratos, 1),
+        'proteinas': round(proteinas, 1),
+        'grasas': round(grasas, 1),
+        'azucares': round(azucares, 1),
+        'alcohol': round(abv, 1)
+    }
+
+
+def redondear(valores, decimales=1):
+    """np.round con el mismo resultado que round() de Python: np.round multiplica por
+    10^decimales y, cerca de un empate (0.15 es 0.1499... en binario), puede ir al otro lado"""
+    valores = np.asarray(valores, dtype=float)
+    redondeados = np.round(valores, decimales)
+    escalados = valores * 10 ** decimales
+    dudosos = np.abs(escalados - np.floor(escalados) - 0.5) < 1e-6
+    if dudosos.any():
+        redondeados[dudosos] = [round(valor, decimales) for valor in valores[dudosos].tolist()]
+    return redondeados
+
+
+def calcular_tabla_nutricional_columnas(abv, porcentaje_cacao, og):
+    """Misma tabla que calcular_tabla_nutricional, sobre arrays de lotes"""
+    abv = np.asarray(abv, dtype=float)
+    porcentaje_cacao = np.asarray(porcentaje_cacao, dtype=float)
+    og = np.asarray(og, dtype=float)
+    
+    carbohidratos = (og - 1) * 1000 * 0.8
+    
+    return {
+        'calorias': np.round((og - 1) * 1000 * 4 + (abv * 7)).astype(int),
+        'carbohidratos': redondear(carbohidratos),
+        'proteinas': redondear(0.3 + (porcentaje_cacao * 0.1)),
+        'grasas': redondear(porcentaje_cacao * 0.15),
+        'azucares': redondear(carbohidratos * 0.6),
+        'alcohol': redondear(abv)
+    }
+
+
+def recalcular_nutricion(filas_por_bloque=1000):
+    """Recalcula la tabla de todos los lotes por bloques de id; un UPDATE ... FROM (VALUES)
+    y un commit por bloque. Devuelve los ids que cambiaron."""
+    from db import conexion_bd, execute_values
+
+    actualizados = []
+    ultimo_id = 0
+    with conexion_bd() as connection:
+        if not connection:
+            raise RuntimeError("No se pudo conectar a la base de datos (revisa DATABASE_URL)")
+
+        cursor = connection.cursor()
+        try:
+            while True:
+                cursor.execute("""
+                    SELECT id, abv::float8 AS abv, porcentaje_cacao::float8 AS porcentaje_cacao, og::float8 AS og
+                    FROM lotes_chocobrew
+                    WHERE id > %s AND abv IS NOT NULL AND porcentaje_cacao IS NOT NULL AND og IS NOT NULL
+                    ORDER BY id
+                    LIMIT %s
+                """, (ultimo_id, filas_por_bloque))
+                filas = cursor.fetchall()
+                if not filas:
+                    break
+
+                tabla = calcular_tabla_nutricional_columnas(
+                    [fila['abv'] for fila in filas],
+                    [fila['porcentaje_cacao'] for fila in filas],
+                    [fila['og'] for fila in filas],
+                )
+                valores = list(zip(
+                    [fila['id'] for fila in filas],
+                    *[tabla[columna].tolist() for columna in COLUMNAS_NUTRICIONALES]
+                ))
+
+                # Solo se reescriben las filas cuyo valor guardado difiere
+                cambiados = execute_values(cursor, """
+                    UPDATE lotes_chocobrew AS l
+                    SET calorias = v.calorias, carbohidratos = v.carbohidratos, proteinas = v.proteinas,
+                        grasas = v.grasas, azucares = v.azucares, actualizado_en = CURRENT_TIMESTAMP
+                    FROM (VALUES %s) AS v(id, calorias, carbohidratos, proteinas, grasas, azucares)
+                    WHERE l.id = v.id
+                      AND (l.calorias, l.carbohidratos, l.proteinas, l.grasas, l.azucares)
+                          IS DISTINCT FROM (v.calorias, v.carbohidratos, v.proteinas, v.grasas, v.azucares)
+                    RETURNING l.id
+                """, valores, template='(%s, %s::int, %s::numeric, %s::numeric, %s::numeric, %s::numeric)',
+                    page_size=len(valores), fetch=True)
+                connection.commit()
+
+                actualizados.extend(fila['id'] for fila in cambiados)
+                ultimo_id = filas[-1]['id']
+                logger.info(f"Nutrición: {len(cambiados)} de {len(filas)} lotes actualizados (hasta id {ultimo_id})")
+        finally:
+            cursor.close()
+
+    return actualizados
+
+
+def invalidar_paginas_en_disco(lote_ids, directorio=None):
+    """Borra las páginas públicas cacheadas en disco de los lotes recalculados"""
+    directorio = directorio or os.environ.get('PUBLIC_PAGE_CACHE_DIR', '')
+    if not directorio:
+        return 0
+    borradas = 0
+    for lote_id in lote_ids:
+        for ruta in glob.glob(os.path.join(directorio, '*', f"lote-{lote_id}.html")):
+            try:
+                os.remove(ruta)
+                borradas += 1
+            except OSError:
+                pass
+    return borradas
+
+
+if __name__ == '__main__':
+    comando = sys.argv[1] if len(sys.argv) > 1 else ''
+
+    if comando == 'recalcular' and len(sys.argv) <= 3:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+        filas_por_bloque = int(sys.argv[2]) if len(sys.argv) == 3 else 1000
+        ids = recalcular_nutricion(filas_por_bloque)
+        borradas = invalidar_paginas_en_disco(ids)
+        print(f"✓ {len(ids)} lotes con tabla nutricional actualizada ({borradas} páginas públicas en disco invalidadas)")
+        if ids:
+            print("  Las páginas en memoria de cada worker expiran a los PUBLIC_PAGE_CACHE_TTL segundos")
+    else:
+        raise SystemExit(__doc__)
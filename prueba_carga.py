@@ -0,0 +1,377 @@
+"""
+Prueba de carga HTTP - CHOCOBREW
+Levanta la app bajo gunicorn (workers/threads configurables) contra la
+base de DATABASE_URL, opcionalmente la siembra con usuarios y lotes de
+prueba, y reproduce una mezcla de tráfico autenticado (/procesar_lote,
+/mis-lotes) y anónimo (/lote-publico/<id>, /qr/<id>.png). Al final
+reporta peticiones/s y latencias p50/p90/p99 por ruta.
+
+Usa una base PostgreSQL local y desechable: la siembra y /procesar_lote
+escriben en ella. Los usuarios sembrados son carga<N>@chocobrew.test.
+
+Uso:
+    python prueba_carga.py --sembrar --usuarios 20 --lotes-por-usuario 5000
+    python prueba_carga.py --workers 2 --threads 4 --clientes 16 --duracion 30
+    python prueba_carga.py --mezcla lote_publico=6,mis_lotes=3,procesar_lote=1
+    python prueba_carga.py --url http://127.0.0.1:5000     # servidor ya levantado
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+CORREO_USUARIO = 'carga{}@chocobrew.test'
+CLAVE_USUARIOS = 'carga-chocobrew'
+MEZCLA = 'lote_publico=6,mis_lotes=3,procesar_lote=1'
+
+# ==============================
+# SIEMBRA DE DATOS
+# ==============================
+def sembrar(usuarios, lotes_por_usuario, bloque=2000, semilla=0):
+    """Crea los usuarios de carga y completa sus lotes hasta lotes_por_usuario"""
+    os.environ.setdefault('PUBLIC_BASE_URL', 'http://localhost:5000')
+    import app as aplicacion
+    from werkzeug.security import generate_password_hash
+    from bosque_compilado import features_de_prueba
+    from nutricion import calcular_tabla_nutricional_columnas
+
+    rng = np.random.default_rng(semilla)
+    clave = generate_password_hash(CLAVE_USUARIOS)
+    vida_util = timedelta(days=aplicacion.PROJECT_INFO['vida_util_dias'])
+    hoy = date.today()
+
+    for numero in range(usuarios):
+        correo = CORREO_USUARIO.format(numero)
+        with aplicacion.conexion_bd() as connection:
+            if not connection:
+                raise SystemExit("❌ No hay conexión a la base de datos (revisa DATABASE_URL)")
+            cursor = connection.cursor()
+            cursor.execute("SELECT id FROM usuarios WHERE email = %s", (correo,))
+            fila = cursor.fetchone()
+            if fila is None:
+                cursor.execute(
+                    "INSERT INTO usuarios (nombre, email, password) VALUES (%s, %s, %s) RETURNING id",
+                    (f"Carga {numero}", correo, clave)
+                )
+                fila = cursor.fetchone()
+            user_id = fila['id']
+            cursor.execute("SELECT COUNT(*) AS total FROM lotes_chocobrew WHERE user_id = %s", (user_id,))
+            existentes = cursor.fetchone()['total']
+            connection.commit()
+            cursor.close()
+
+        faltan = lotes_por_usuario - existentes
+        for inicio in range(0, max(0, faltan), bloque):
+            n = min(bloque, faltan - inicio)
+            features = features_de_prueba(n, semilla=int(rng.integers(1 << 31)))
+            predicciones, version = aplicacion.predecir_puntuaciones(features)
+            tabla = calcular_tabla_nutricional_columnas(features[:, 0], features[:, 5], features[:, 3])
+            # Tres años de historial para que la paginación y la analítica tengan volumen
+            dias = rng.integers(0, 3 * 365, n)
+
+            lotes = []
+            for i in range(n):
+                elaboracion = hoy - timedelta(days=int(dias[i]))
+                datos = dict(zip(aplicacion.FEATURES_MODELO, features[i].tolist()))
+                datos.update(
+                    codigo_lote=f"CARGA-{user_id}-{uuid.uuid4().hex[:12]}",
+                    fecha_elaboracion=elaboracion.isoformat(),
+                    fecha_vencimiento=(elaboracion + vida_util).isoformat(),
+                )
+                nutricional = {campo: valores[i].item() for campo, valores in tabla.items()}
+                lotes.append(aplicacion.armar_datos_lote(datos, float(predicciones[i]), nutricional, version))
+
+            if aplicacion.guardar_lotes_en_bd(lotes, user_id) is None:
+                raise SystemExit("❌ No se pudieron guardar los lotes de carga")
+
+        print(f"🌱 {correo}: {max(existentes, lotes_por_usuario)} lotes ({max(0, faltan)} nuevos)")
+
+
+def ids_publicos(muestra=10000):
+    """Ids de lotes existentes para las páginas públicas"""
+    from db import conexion_bd
+
+    with conexion_bd() as connection:
+        if not connection:
+            raise SystemExit("❌ No hay conexión a la base de datos (revisa DATABASE_URL)")
+        cursor = connection.cursor()
+        cursor.execute("SELECT id FROM lotes_chocobrew ORDER BY random() LIMIT %s", (muestra,))
+        ids = [fila['id'] for fila in cursor.fetchall()]
+        cursor.close()
+    return ids
+
+# ==============================
+# SERVIDOR
+# ==============================
+def puerto_libre():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def levantar_gunicorn(workers, threads, puerto, espera=60):
+    """Arranca gunicorn app:app en 127.0.0.1:puerto y espera a que acepte conexiones"""
+    entorno = dict(os.environ)
+    entorno.setdefault('LOG_LEVEL', 'WARNING')
+    entorno.setdefault('PUBLIC_BASE_URL', f'http://127.0.0.1:{puerto}')
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app',
+         '--workers', str(workers), '--threads', str(threads),
+         '--bind', f'127.0.0.1:{puerto}', '--log-level', 'warning'],
+        env=entorno,
+    )
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise SystemExit(f"❌ gunicorn terminó al arrancar (código {proceso.returncode})")
+        try:
+            socket.create_connection(('127.0.0.1', puerto), timeout=1).close()
+            return proceso
+        except OSError:
+            time.sleep(0.2)
+    proceso.terminate()
+    raise SystemExit(f"❌ gunicorn no respondió en {espera}s")
+
+# ==============================
+# CLIENTES
+# ==============================
+class Cliente:
+    """Conexión keep-alive con su propia cookie de sesión"""
+
+    def __init__(self, host, puerto):
+        self.conexion = http.client.HTTPConnection(host, puerto, timeout=30)
+        self.cookie = None
+
+    def pedir(self, metodo, ruta, formulario=None):
+        cabeceras = {}
+        cuerpo = None
+        if formulario is not None:
+            cuerpo = urlencode(formulario)
+            cabeceras['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookie:
+            cabeceras['Cookie'] = self.cookie
+        try:
+            self.conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+            respuesta = self.conexion.getresponse()
+            respuesta.read()
+        except (http.client.HTTPException, OSError):
+            self.conexion.close()
+            raise
+        cookie = respuesta.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return respuesta.status
+
+    def iniciar_sesion(self, correo):
+        estado = self.pedir('POST', '/login', {'email': correo, 'password': CLAVE_USUARIOS})
+        if estado != 302:
+            raise SystemExit(f"❌ No se pudo iniciar sesión como {correo} (HTTP {estado}); ¿falta --sembrar?")
+
+
+def formulario_lote(rng):
+    og = round(rng.uniform(1.050, 1.075), 3)
+    return {
+        'codigo_lote': f"CARGA-{uuid.uuid4().hex[:16]}",
+        'fecha_elaboracion': date.today().isoformat(),
+        'abv': round(rng.uniform(4, 9), 1),
+        'ibu': rng.randint(15, 60),
+        'srm': rng.randint(15, 35),
+        'og': og,
+        'fg': round(og - rng.uniform(0.010, 0.020), 3),
+        'porcentaje_cacao': round(rng.uniform(2, 15), 1),
+        'dias_fermentacion': rng.randint(5, 11),
+        'dias_maduracion': rng.randint(8, 17),
+    }
+
+
+class Carga:
+    """Hilos cliente en lazo cerrado que registran (ruta, estado, segundos)"""
+
+    def __init__(self, url, mezcla, ids, usuarios, sesgo, semilla):
+        partes = urlsplit(url)
+        self.host, self.puerto = partes.hostname, partes.port or 80
+        self.rutas = list(mezcla)
+        self.pesos = list(mezcla.values())
+        self.ids = ids
+        self.usuarios = usuarios
+        self.semilla = semilla
+        # Popularidad tipo Zipf: pocas páginas públicas concentran las visitas
+        pesos = 1 / np.arange(1, len(ids) + 1) ** sesgo if ids else np.ones(0)
+        self.acumulado_ids = list(np.cumsum(pesos / pesos.sum())) if ids else []
+        self.registros = []
+        self._lock = threading.Lock()
+        self._medir_desde = None
+        self._detener = threading.Event()
+
+    def _peticion(self, ruta, autenticado, anonimo, rng):
+        if ruta == 'procesar_lote':
+            return autenticado.pedir('POST', '/procesar_lote', formulario_lote(rng))
+        if ruta == 'mis_lotes':
+            return autenticado.pedir('GET', '/mis-lotes')
+        lote_id = self.ids[min(len(self.ids) - 1, np.searchsorted(self.acumulado_ids, rng.random()))]
+        if ruta == 'lote_publico':
+            return anonimo.pedir('GET', f'/lote-publico/{lote_id}')
+        return anonimo.pedir('GET', f'/qr/{lote_id}.png')
+
+    def _cliente(self, numero, autenticado):
+        rng = random.Random(self.semilla + numero)
+        anonimo = Cliente(self.host, self.puerto)
+
+        while not self._detener.is_set():
+            ruta = rng.choices(self.rutas, self.pesos)[0]
+            inicio = time.perf_counter()
+            try:
+                estado = self._peticion(ruta, autenticado, anonimo, rng)
+            except (http.client.HTTPException, OSError):
+                estado = 0
+            duracion = time.perf_counter() - inicio
+            if self._medir_desde is not None and inicio >= self._medir_desde:
+                with self._lock:
+                    self.registros.append((ruta, estado, duracion))
+
+    def ejecutar(self, clientes, duracion, calentamiento):
+        # Las sesiones se abren antes de arrancar: un login fallido corta la prueba
+        sesiones = []
+        for numero in range(clientes):
+            sesiones.append(Cliente(self.host, self.puerto))
+            sesiones[-1].iniciar_sesion(CORREO_USUARIO.format(numero % self.usuarios))
+
+        hilos = [threading.Thread(target=self._cliente, args=(numero, sesion), daemon=True)
+                 for numero, sesion in enumerate(sesiones)]
+        for hilo in hilos:
+            hilo.start()
+        time.sleep(calentamiento)
+        self._medir_desde = time.perf_counter()
+        time.sleep(duracion)
+        self._detener.set()
+        for hilo in hilos:
+            hilo.join(timeout=35)
+        return time.perf_counter() - self._medir_desde
+
+# ==============================
+# REPORTE
+# ==============================
+def resumir(registros, segundos):
+    """Peticiones/s, errores y percentiles por ruta (y el total)"""
+    por_ruta = {}
+    for ruta, estado, duracion in registros:
+        por_ruta.setdefault(ruta, []).append((estado, duracion))
+    por_ruta['total'] = [(estado, duracion) for _, estado, duracion in registros]
+
+    resumen = {}
+    for ruta, filas in por_ruta.items():
+        if not filas:
+            continue
+        estados = [estado for estado, _ in filas]
+        tiempos = np.array([duracion for _, duracion in filas]) * 1000
+        p50, p90, p99 = np.percentile(tiempos, [50, 90, 99])
+        resumen[ruta] = {
+            'peticiones': len(filas),
+            'errores': sum(1 for estado in estados if estado == 0 or estado >= 400),
+            'rps': round(len(filas) / segundos, 1),
+            'p50_ms': round(float(p50), 2),
+            'p90_ms': round(float(p90), 2),
+            'p99_ms': round(float(p99), 2),
+            'max_ms': round(float(tiempos.max()), 2),
+            'estados': {str(estado): estados.count(estado) for estado in sorted(set(estados))},
+        }
+    return resumen
+
+
+def imprimir_resumen(resumen, segundos):
+    print(f"\n📊 RESULTADOS ({segundos:.1f}s medidos):")
+    print(f"  {'Ruta':<16}{'Peticiones':>11}{'Errores':>9}{'RPS':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'máx ms':>9}  Estados")
+    for ruta, r in resumen.items():
+        estados = ' '.join(f"{estado}×{n}" for estado, n in r['estados'].items())
+        print(f"  {ruta:<16}{r['peticiones']:>11}{r['errores']:>9}{r['rps']:>9.1f}{r['p50_ms']:>9.2f}"
+              f"{r['p90_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['max_ms']:>9.2f}  {estados}")
+
+
+def leer_mezcla(texto):
+    mezcla = {}
+    for parte in texto.split(','):
+        ruta, _, peso = parte.partition('=')
+        ruta = ruta.strip()
+        if ruta not in ('procesar_lote', 'mis_lotes', 'lote_publico', 'qr'):
+            raise SystemExit(f"❌ Ruta desconocida en --mezcla: {ruta}")
+        mezcla[ruta] = float(peso or 1)
+    return mezcla
+
+
+def leer_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga HTTP de CHOCOBREW")
+    parser.add_argument('--sembrar', action='store_true', help="crear usuarios y lotes de carga antes de medir")
+    parser.add_argument('--solo-sembrar', action='store_true', help="sembrar y salir")
+    parser.add_argument('--usuarios', type=int, default=10, help="usuarios de carga (por defecto %(default)s)")
+    parser.add_argument('--lotes-por-usuario', type=int, default=2000)
+    parser.add_argument('--url', help="medir un servidor ya levantado en vez de arrancar gunicorn")
+    parser.add_argument('--workers', type=int, default=2, help="workers de gunicorn")
+    parser.add_argument('--threads', type=int, default=4, help="hilos por worker de gunicorn")
+    parser.add_argument('--clientes', type=int, default=16, help="clientes concurrentes")
+    parser.add_argument('--duracion', type=float, default=30, help="segundos medidos")
+    parser.add_argument('--calentamiento', type=float, default=5, help="segundos iniciales sin medir")
+    parser.add_argument('--mezcla', default=MEZCLA, help="pesos por ruta (por defecto %(default)s)")
+    parser.add_argument('--sesgo', type=float, default=1.1, help="sesgo Zipf de las páginas públicas (0 = uniforme)")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--reporte', metavar='JSON', help="guardar el resumen en un archivo JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = leer_argumentos(argv)
+    if not os.environ.get('DATABASE_URL'):
+        raise SystemExit("❌ Define DATABASE_URL con una base PostgreSQL local de pruebas")
+
+    if args.sembrar or args.solo_sembrar:
+        sembrar(args.usuarios, args.lotes_por_usuario, semilla=args.semilla)
+        if args.solo_sembrar:
+            return
+
+    mezcla = leer_mezcla(args.mezcla)
+    ids = ids_publicos() if {'lote_publico', 'qr'} & set(mezcla) else []
+    if ({'lote_publico', 'qr'} & set(mezcla)) and not ids:
+        raise SystemExit("❌ No hay lotes para las páginas públicas; usa --sembrar")
+
+    proceso = None
+    url = args.url
+    if url is None:
+        puerto = puerto_libre()
+        proceso = levantar_gunicorn(args.workers, args.threads, puerto)
+        url = f'http://127.0.0.1:{puerto}'
+        print(f"🚀 gunicorn en {url}: {args.workers} workers × {args.threads} threads")
+
+    try:
+        print(f"🔥 {args.clientes} clientes, mezcla {mezcla}, {args.calentamiento:.0f}s de calentamiento + {args.duracion:.0f}s")
+        carga = Carga(url, mezcla, ids, args.usuarios, args.sesgo, args.semilla)
+        segundos = carga.ejecutar(args.clientes, args.duracion, args.calentamiento)
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait(timeout=30)
+
+    resumen = resumir(carga.registros, segundos)
+    imprimir_resumen(resumen, segundos)
+
+    if args.reporte:
+        with open(args.reporte, 'w', encoding='utf-8') as archivo:
+            json.dump({
+                'url': url, 'workers': args.workers, 'threads': args.threads, 'clientes': args.clientes,
+                'mezcla': mezcla, 'segundos': round(segundos, 2), 'rutas': resumen,
+            }, archivo, indent=2, ensure_ascii=False)
+        print(f"\n💾 Reporte guardado en {args.reporte}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Registro de modelos versionados - CHOCOBREW
+Cada versión vive en model/versiones/<version>/ (modelo, scaler, bosque
+compilado, sustituto destilado, tabla de predicciones opcional y metadata.json) y model/ACTUAL apunta a la versión activa.
+Ambos se publican con rename/replace, así un worker nunca ve una
+versión a medio escribir. El sustituto y la tabla se pueden agregar después
+a una versión ya publicada: firma_version cambia y los workers la recargan.
+
+Uso:
+    python registro_modelos.py listar
+    python registro_modelos.py activar <version>
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+from datetime import datetime
+
+from bosque_compilado import BosqueCompilado, aplanar_bosque, guardar_bosque
+from sustituto import Sustituto, guardar_sustituto, aceptable, CONCORDANCIA_MINIMA
+from tabla_prediccion import TablaPrediccion, error_aceptable, hay_tabla, ERROR_MAXIMO
+
+RUTA_VERSIONES = 'model/versiones'
+RUTA_ACTUAL = 'model/ACTUAL'
+
+logger = logging.getLogger(__name__)
+
+
+def ruta_version(version):
+    return os.path.join(RUTA_VERSIONES, version)
+
+
+def version_actual():
+    """Versión activa según model/ACTUAL (None si no hay registro)"""
+    try:
+        with open(RUTA_ACTUAL, encoding='utf-8') as archivo:
+            return archivo.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def firma_version(version):
+    """mtime del directorio de la versión: cambia cuando se agrega o reemplaza
+    sustituto/ o tabla/ (se publican con rename), aunque model/ACTUAL no cambie"""
+    try:
+        return os.stat(ruta_version(version)).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+def activar_version(version):
+    """Cambia la versión activa reemplazando el puntero de forma atómica"""
+    if not os.path.isfile(os.path.join(ruta_version(version), 'metadata.json')):
+        raise ValueError(f"La versión {version} no existe")
+    temporal = f"{RUTA_ACTUAL}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        archivo.write(version)
+    os.replace(temporal, RUTA_ACTUAL)
+
+
+def publicar_version(model, scaler, metadata, activar=True, sustituto=None, fidelidad=None):
+    """Guarda modelo + scaler + bosque compilado (+ arrays del sustituto) + metadata
+    como una nueva versión"""
+    import joblib
+
+    version = datetime.now().strftime('v%Y%m%d-%H%M%S')
+    destino = ruta_version(version)
+    temporal = f"{destino}.tmp"
+
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+    joblib.dump(model, os.path.join(temporal, 'beer_model.pkl'))
+    joblib.dump(scaler, os.path.join(temporal, 'scaler.pkl'))
+    guardar_bosque(aplanar_bosque(model, scaler), os.path.join(temporal, 'bosque'))
+    if sustituto is not None:
+        guardar_sustituto(sustituto, os.path.join(temporal, 'sustituto'), fidelidad)
+
+    metadata = dict(metadata, version=version, fecha=datetime.now().isoformat(timespec='seconds'))
+    with open(os.path.join(temporal, 'metadata.json'), 'w', encoding='utf-8') as archivo:
+        json.dump(metadata, archivo, indent=2, ensure_ascii=False)
+
+    os.rename(temporal, destino)
+    if activar:
+        activar_version(version)
+    return version
+
+
+def cargar_version(version):
+    """Abre el bosque compilado de una versión (mmap), su sustituto y su tabla
+    de predicciones (mmap) si los tiene, y su metadata"""
+    destino = ruta_version(version)
+    # Antes de leer: si algo cambia durante la carga, la próxima verificación recarga
+    firma = firma_version(version)
+    with open(os.path.join(destino, 'metadata.json'), encoding='utf-8') as archivo:
+        metadata = json.load(archivo)
+    ruta_sustituto = os.path.join(destino, 'sustituto')
+    ruta_tabla = os.path.join(destino, 'tabla')
+    bosque = BosqueCompilado.desde_archivo(os.path.join(destino, 'bosque'))
+
+    sustituto = Sustituto.desde_archivo(ruta_sustituto) if os.path.isdir(ruta_sustituto) else None
+    if sustituto is not None and not aceptable(sustituto.fidelidad):
+        concordancia = (sustituto.fidelidad.get('muestreo_denso') or {}).get('misma_categoria')
+        logger.warning(f"Sustituto de {version} descartado: misma categoría {concordancia} "
+                       f"< {CONCORDANCIA_MINIMA} (MODEL_SURROGATE_MIN_AGREEMENT); se sirve el bosque")
+        sustituto = None
+
+    # Fuera de la rejilla la tabla predice con el bosque
+    tabla = TablaPrediccion.desde_archivo(ruta_tabla, respaldo=bosque.predecir) if hay_tabla(ruta_tabla) else None
+    if tabla is not None and not error_aceptable(tabla.fidelidad):
+        logger.warning(f"Tabla de {version} descartada: error máximo {tabla.fidelidad.get('maxima')} "
+                       f"> {ERROR_MAXIMO} (MODEL_TABLE_MAX_ERROR); se sirve el bosque")
+        tabla = None
+
+    return {
+        'version': version,
+        'firma': firma,
+        'bosque': bosque,
+        'sustituto': sustituto,
+        'tabla': tabla,
+        'model': None,
+        'scaler': None,
+        'metadata': metadata,
+    }
+
+
+def listar_versiones():
+    if not os.path.isdir(RUTA_VERSIONES):
+        return []
+    return sorted(nombre for nombre in os.listdir(RUTA_VERSIONES)
+                  if os.path.isfile(os.path.join(ruta_version(nombre), 'metadata.json')))
+
+
+if __name__ == '__main__':
+    comando = sys.argv[1] if len(sys.argv) > 1 else 'listar'
+
+    if comando == 'listar':
+        activa = version_actual()
+        for version in listar_versiones():
+            marca = '→' if version == activa else ' '
+            print(f"{marca} {version}")
+    elif comando == 'activar' and len(sys.argv) == 3:
+        activar_version(sys.argv[2])
+        print(f"✓ Versión activa: {sys.argv[2]} (los workers la cargan en su próxima verificación)")
+    else:
+        raise SystemExit(__doc__)
@@ -0,0 +1,184 @@
+"""
+Modelo sustituto - CHOCOBREW
+Destila el bosque en un modelo aditivo lineal por tramos: por cada
+variable, un término lineal más funciones bisagra max(0, z - nudo) en
+los cuantiles de la muestra. Se ajusta por mínimos cuadrados sobre las
+predicciones del bosque en un muestreo denso del espacio de entrada.
+Predecir son unas pocas operaciones sobre arrays de (8, nudos): no
+recorre árboles y ocupa unos KB en lugar de MB.
+
+La app lo sirve con MODEL_SERVING=sustituto y solo si coincide en categoría
+con el bosque en al menos MODEL_SURROGATE_MIN_AGREEMENT (0.99) del muestreo
+denso; si no, usa el bosque.
+
+Uso (destilar una versión ya publicada, por defecto la activa):
+    python sustituto.py destilar [version]
+"""
+
+import os
+import sys
+import json
+import shutil
+
+import numpy as np
+
+from bosque_compilado import features_de_prueba
+
+ARRAYS_SUSTITUTO = ['media', 'escala', 'nudos', 'pesos_lineales', 'pesos_bisagra', 'sesgo']
+NUDOS_POR_VARIABLE = 12
+MUESTRAS_DESTILACION = 60000
+
+# Mismos cortes que clasificar_calidad en app.py
+CORTES_CATEGORIA = [3.0, 3.5, 4.0, 4.5]
+# Fracción mínima de lotes con la misma categoría que el bosque para servir el sustituto
+CONCORDANCIA_MINIMA = float(os.environ.get('MODEL_SURROGATE_MIN_AGREEMENT', 0.99))
+
+
+def _matriz_diseno(Z, nudos):
+    """[z, max(0, z - nudo)...] por variable, aplanado a (n, 8 * (1 + nudos))"""
+    bisagras = np.maximum(Z[:, :, None] - nudos[None, :, :], 0.0)
+    return np.concatenate([Z, bisagras.reshape(len(Z), -1)], axis=1)
+
+
+def ajustar_sustituto(X, y, media, escala, nudos_por_variable=NUDOS_POR_VARIABLE, ridge=1e-6, bloque=20000):
+    """Mínimos cuadrados (con una regularización mínima) de y sobre la base de bisagras.
+    Acumula las ecuaciones normales por bloques para no armar la matriz completa."""
+    Z = (np.asarray(X, dtype=np.float64) - media) / escala
+    cuantiles = np.linspace(0, 1, nudos_por_variable + 2)[1:-1]
+    nudos = np.quantile(Z, cuantiles, axis=0).T        # (8, nudos)
+
+    columnas = Z.shape[1] * (1 + nudos_por_variable) + 1
+    AtA = np.zeros((columnas, columnas))
+    Atb = np.zeros(columnas)
+    for inicio in range(0, len(Z), bloque):
+        A = _matriz_diseno(Z[inicio:inicio + bloque], nudos)
+        A = np.concatenate([A, np.ones((len(A), 1))], axis=1)
+        AtA += A.T @ A
+        Atb += A.T @ y[inicio:inicio + bloque]
+    # Variables discretas (días) repiten nudos y dejan columnas duplicadas: lstsq lo tolera
+    pesos = np.linalg.lstsq(AtA + ridge * np.eye(columnas), Atb, rcond=None)[0]
+
+    n = Z.shape[1]
+    return {
+        'media': np.asarray(media, dtype=np.float64),
+        'escala': np.asarray(escala, dtype=np.float64),
+        'nudos': nudos,
+        'pesos_lineales': pesos[:n],
+        'pesos_bisagra': pesos[n:-1].reshape(n, nudos_por_variable),
+        'sesgo': pesos[-1:],
+    }
+
+
+def muestras_destilacion(n=MUESTRAS_DESTILACION, semilla=0, extra=None):
+    """Muestreo denso de los rangos del formulario (y un poco fuera), más filas reales si hay"""
+    X = features_de_prueba(n, semilla=semilla)
+    if extra is not None and len(extra):
+        X = np.concatenate([X, np.asarray(extra, dtype=np.float64)])
+    return X
+
+
+def predecir_por_bloques(modelo, X, bloque=5000):
+    """El sustituto arma bisagras (filas, 8, nudos): por bloques la memoria no crece con X"""
+    return np.concatenate([modelo.predecir(X[inicio:inicio + bloque]) for inicio in range(0, len(X), bloque)])
+
+
+def destilar(bosque, extra=None, n=MUESTRAS_DESTILACION, semilla=0):
+    """Arrays del sustituto ajustado a las predicciones del bosque compilado"""
+    X = muestras_destilacion(n, semilla, extra)
+    return ajustar_sustituto(X, bosque.predecir(X), bosque.media, bosque.escala)
+
+
+def informe_fidelidad(sustituto, bosque, X):
+    """Qué tanto se aparta el sustituto del bosque sobre las filas X"""
+    esperado = bosque.predecir(X)
+    obtenido = predecir_por_bloques(sustituto, X)
+    diferencia = np.abs(esperado - obtenido)
+    varianza = np.sum((esperado - esperado.mean()) ** 2)
+    return {
+        'filas': int(len(X)),
+        'mae': round(float(diferencia.mean()), 4),
+        'p99': round(float(np.percentile(diferencia, 99)), 4),
+        'maxima': round(float(diferencia.max()), 4),
+        'r2_vs_bosque': round(float(1 - np.sum((esperado - obtenido) ** 2) / varianza), 4) if varianza else None,
+        'misma_categoria': round(float(np.mean(
+            np.searchsorted(CORTES_CATEGORIA, esperado, side='right') ==
+            np.searchsorted(CORTES_CATEGORIA, obtenido, side='right')
+        )), 4),
+    }
+
+
+def aceptable(fidelidad, minimo=None):
+    """True si el informe del muestreo denso alcanza la concordancia mínima de categoría"""
+    minimo = CONCORDANCIA_MINIMA if minimo is None else minimo
+    concordancia = ((fidelidad or {}).get('muestreo_denso') or {}).get('misma_categoria')
+    return concordancia is not None and concordancia >= minimo
+
+
+def guardar_sustituto(arrays, ruta, fidelidad=None):
+    """Un .npy por array (y fidelidad.json) en un directorio temporal que luego se renombra"""
+    temporal = f"{ruta}.tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+    for clave in ARRAYS_SUSTITUTO:
+        np.save(os.path.join(temporal, f"{clave}.npy"), np.ascontiguousarray(arrays[clave]))
+    if fidelidad is not None:
+        with open(os.path.join(temporal, 'fidelidad.json'), 'w', encoding='utf-8') as archivo:
+            json.dump(fidelidad, archivo, indent=2, ensure_ascii=False)
+    shutil.rmtree(ruta, ignore_errors=True)
+    os.rename(temporal, ruta)
+
+
+class Sustituto:
+    """Predictor aditivo por tramos con la misma entrada que BosqueCompilado"""
+
+    def __init__(self, arrays, fidelidad=None):
+        self.media = arrays['media']
+        self.escala = arrays['escala']
+        self.nudos = arrays['nudos']
+        self.pesos_lineales = arrays['pesos_lineales']
+        self.pesos_bisagra = arrays['pesos_bisagra']
+        self.sesgo = float(arrays['sesgo'][0])
+        self.fidelidad = fidelidad or {}
+
+    @classmethod
+    def desde_archivo(cls, ruta):
+        """Los arrays ocupan unos KB: se leen completos, sin mmap"""
+        arrays = {clave: np.load(os.path.join(ruta, f"{clave}.npy")) for clave in ARRAYS_SUSTITUTO}
+        fidelidad = None
+        if os.path.isfile(os.path.join(ruta, 'fidelidad.json')):
+            with open(os.path.join(ruta, 'fidelidad.json'), encoding='utf-8') as archivo:
+                fidelidad = json.load(archivo)
+        return cls(arrays, fidelidad)
+
+    def predecir(self, features):
+        """Predice una matriz (n, 8) de features sin escalar"""
+        Z = (np.asarray(features, dtype=np.float64) - self.media) / self.escala
+        bisagras = np.maximum(Z[:, :, None] - self.nudos, 0.0)
+        prediccion = self.sesgo + Z @ self.pesos_lineales + np.einsum('njk,jk->n', bisagras, self.pesos_bisagra)
+        return np.clip(prediccion, 0, 5)
+
+
+if __name__ == '__main__':
+    from registro_modelos import version_actual, ruta_version, cargar_version
+
+    if len(sys.argv) not in (2, 3) or sys.argv[1] != 'destilar':
+        raise SystemExit(__doc__)
+
+    version = sys.argv[2] if len(sys.argv) == 3 else version_actual()
+    if not version:
+        raise SystemExit("❌ No hay una versión activa (python train_chocobrew_model.py)")
+    bosque = cargar_version(version)['bosque']
+
+    arrays = destilar(bosque)
+    fidelidad = informe_fidelidad(Sustituto(arrays), bosque, features_de_prueba(20000, semilla=1))
+    guardar_sustituto(arrays, os.path.join(ruta_version(version), 'sustituto'), {'muestreo_denso': fidelidad})
+
+    print(f"🧪 Sustituto de {version}: {sum(a.nbytes for a in arrays.values()) / 1024:.1f} KB "
+          f"(bosque: {bosque.n_arboles} árboles)")
+    print(f"  Diferencia con el bosque: MAE {fidelidad['mae']}, p99 {fidelidad['p99']}, máx {fidelidad['maxima']}")
+    print(f"  R² vs bosque {fidelidad['r2_vs_bosque']}, misma categoría {fidelidad['misma_categoria']:.1%}")
+    if not aceptable({'muestreo_denso': fidelidad}):
+        print(f"⚠️ Misma categoría por debajo de {CONCORDANCIA_MINIMA:.0%} (MODEL_SURROGATE_MIN_AGREEMENT): "
+              f"la app seguirá sirviendo el bosque")
+    print("✓ Guardado; con MODEL_SERVING=sustituto los workers lo cargan en su próxima "
+          "verificación (MODEL_RELOAD_INTERVAL)")
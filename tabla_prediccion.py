@@ -0,0 +1,304 @@
+"""
+Tabla de predicciones - CHOCOBREW
+Precalcula el bosque de una versión sobre una rejilla de las 8 variables
+con los rangos y pasos del formulario y la guarda como un único array
+N-dimensional (.npy, float32) que los workers abren con mmap. Predecir
+es ubicar la celda de cada variable y leer un valor: un costo fijo que no
+depende del número de árboles. Las filas fuera de la rejilla (fuera de
+rango o de los pasos del formulario) se predicen con el bosque.
+
+Las celdas de cada eje salen de los umbrales del propio bosque: dos
+valores del formulario entre los mismos umbrales dan siempre la misma
+predicción, así que basta un punto por celda y la tabla no interpola a
+través de los saltos del bosque. Las fronteras que menos cambian la
+predicción se fusionan hasta que el error medido sobre una muestra de
+selección llega a la mitad de MODEL_TABLE_MAX_ERROR (o al tope de puntos).
+
+El error contra el bosque se mide sobre otra muestra de lotes del
+formulario y se guarda en <version>/tabla/fidelidad.json. Es una cota
+empírica, no garantizada. Solo se publica (y la app solo sirve) una tabla
+cuyo error máximo medido no pase de MODEL_TABLE_MAX_ERROR (0.25).
+
+Uso (por defecto la versión activa):
+    python tabla_prediccion.py construir [version]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import warnings
+
+import numpy as np
+
+from sustituto import CORTES_CATEGORIA
+
+# Variable: (mínimo, máximo, paso del formulario)
+EJES_TABLA = {
+    'abv': (4.0, 10.0, 0.1),
+    'ibu': (15, 70, 1),
+    'srm': (10, 40, 1),
+    'og': (1.045, 1.080, 0.001),
+    'fg': (1.008, 1.020, 0.001),
+    'porcentaje_cacao': (2.0, 15.0, 0.5),
+    'dias_fermentacion': (5, 14, 1),
+    'dias_maduracion': (7, 21, 1),
+}
+MUESTRAS_ERROR = 20000
+MUESTRAS_EFECTO = 3000
+# Tope del array (float32): 20 millones de puntos son 80 MB
+PUNTOS_MAXIMOS = 20_000_000
+# Error máximo medido contra el bosque con el que se publica y se sirve la tabla
+# (0.25: la mitad del ancho de una categoría)
+ERROR_MAXIMO = float(os.environ.get('MODEL_TABLE_MAX_ERROR', 0.25))
+
+
+def valores_formulario(ejes=EJES_TABLA):
+    """Todos los valores que acepta el formulario en cada eje"""
+    return [minimo + np.arange(int(round((maximo - minimo) / paso)) + 1) * paso
+            for minimo, maximo, paso in ejes.values()]
+
+
+def muestras_formulario(n=MUESTRAS_ERROR, semilla=0, ejes=EJES_TABLA):
+    """Lotes aleatorios con los rangos y pasos del formulario"""
+    rng = np.random.default_rng(semilla)
+    return np.column_stack([rng.choice(valores, n) for valores in valores_formulario(ejes)])
+
+
+def celdas_del_bosque(bosque, ejes=EJES_TABLA, semilla=2):
+    """Por eje: valores del formulario, inicio de cada celda del bosque entre ellos y
+    cuánto cambia la predicción (máximo sobre lotes de muestra) al cruzar cada frontera"""
+    base = muestras_formulario(MUESTRAS_EFECTO, semilla, ejes)
+    valores, inicios, efectos = valores_formulario(ejes), [], []
+    for j, eje in enumerate(valores):
+        celda = bosque.celdas(j, eje)
+        inicio = np.flatnonzero(np.r_[True, celda[1:] != celda[:-1]])
+        predicciones = []
+        for i in inicio:
+            X = base.copy()
+            X[:, j] = eje[i]
+            predicciones.append(bosque.predecir(X))
+        inicios.append(inicio)
+        efectos.append(np.array([np.abs(b - a).max() for a, b in zip(predicciones, predicciones[1:])]))
+    return valores, inicios, efectos
+
+
+def agrupar_celdas(valores, inicios, efectos, tolerancia):
+    """Fusiona las fronteras con efecto menor que la tolerancia. Devuelve por eje el
+    punto de cada grupo (el valor del medio) y los cortes entre grupos consecutivos"""
+    puntos, cortes = [], []
+    for eje, inicio, efecto in zip(valores, inicios, efectos):
+        grupos = np.r_[inicio[:1], inicio[1:][efecto >= tolerancia]]
+        fin = np.r_[grupos[1:], len(eje)]
+        puntos.append(eje[(grupos + fin - 1) // 2])
+        # Corte a mitad de camino entre el último valor de un grupo y el primero del siguiente
+        cortes.append((eje[grupos[1:] - 1] + eje[grupos[1:]]) / 2)
+    return puntos, cortes
+
+
+def ubicar(X, puntos, cortes):
+    """Lleva cada variable al punto de su grupo"""
+    return np.column_stack([p[np.searchsorted(c, X[:, j], side='right')]
+                            for j, (p, c) in enumerate(zip(puntos, cortes))])
+
+
+def elegir_tolerancia(bosque, valores, inicios, efectos, objetivo, X):
+    """Mayor tolerancia cuyo error máximo sobre X no pasa del objetivo, dentro del
+    tope de puntos (búsqueda binaria sobre los efectos medidos)"""
+    esperado = bosque.predecir(X)
+    candidatas = np.unique(np.concatenate([[0.0], *efectos]))
+    tamanos = [np.prod([len(p) for p in agrupar_celdas(valores, inicios, efectos, t)[0]]) for t in candidatas]
+    bajo, alto = int(np.argmax(np.array(tamanos) <= PUNTOS_MAXIMOS)), len(candidatas) - 1
+    while bajo < alto:
+        medio = (bajo + alto + 1) // 2
+        puntos, cortes = agrupar_celdas(valores, inicios, efectos, candidatas[medio])
+        if np.abs(bosque.predecir(ubicar(X, puntos, cortes)) - esperado).max() <= objetivo:
+            bajo = medio
+        else:
+            alto = medio - 1
+    return candidatas[bajo]
+
+
+def construir_tabla(predecir, ejes, ruta, bloque=200000):
+    """Evalúa predecir() en cada punto de la rejilla y escribe el array por bloques en disco"""
+    forma = tuple(len(eje) for eje in ejes)
+    valores = np.lib.format.open_memmap(ruta, mode='w+', dtype=np.float32, shape=forma)
+    plano = valores.reshape(-1)
+    for inicio in range(0, plano.size, bloque):
+        indices = np.unravel_index(np.arange(inicio, min(inicio + bloque, plano.size)), forma)
+        X = np.column_stack([eje[i] for eje, i in zip(ejes, indices)])
+        plano[inicio:inicio + len(X)] = predecir(X)
+    valores.flush()
+    del valores
+
+
+def medir_error(tabla, predecir, X, bloque=5000):
+    """Diferencia entre la tabla y el modelo vivo sobre las filas X"""
+    esperado = np.concatenate([predecir(X[inicio:inicio + bloque]) for inicio in range(0, len(X), bloque)])
+    obtenido = np.concatenate([tabla.predecir(X[inicio:inicio + bloque]) for inicio in range(0, len(X), bloque)])
+    diferencia = np.abs(esperado - obtenido)
+    return {
+        'filas': int(len(X)),
+        'mae': round(float(diferencia.mean()), 5),
+        'p99': round(float(np.percentile(diferencia, 99)), 5),
+        'maxima': round(float(diferencia.max()), 5),
+        'misma_categoria': round(float(np.mean(
+            np.searchsorted(CORTES_CATEGORIA, esperado, side='right') ==
+            np.searchsorted(CORTES_CATEGORIA, obtenido, side='right')
+        )), 4),
+    }
+
+
+def error_aceptable(fidelidad, maximo=None):
+    """True si el error máximo medido contra el bosque no pasa de la cota configurada"""
+    maximo = ERROR_MAXIMO if maximo is None else maximo
+    medido = (fidelidad or {}).get('maxima')
+    return medido is not None and medido <= maximo
+
+
+def hay_tabla(ruta):
+    """True si la carpeta tiene una tabla con el formato actual (celdas.npz)"""
+    return os.path.isfile(os.path.join(ruta, 'celdas.npz'))
+
+
+class TablaPrediccion:
+    """Búsqueda de la celda en la rejilla; fuera de ella, la función de respaldo"""
+
+    def __init__(self, valores, puntos, cortes, formulario, respaldo=None, fidelidad=None):
+        self.valores = valores.reshape(-1)
+        self.puntos = puntos
+        self.cortes = cortes
+        self.respaldo = respaldo
+        self.fidelidad = fidelidad or {}
+        # (mínimo, máximo, paso) de cada eje: la tabla solo es válida en los valores del formulario
+        self.minimos, self.maximos, self.pasos = np.asarray(formulario, dtype=np.float64).T
+        # Paso en el array plano al avanzar un punto en cada eje
+        self.saltos = np.array(valores.strides, dtype=np.int64) // valores.itemsize
+
+    @classmethod
+    def desde_archivo(cls, ruta, respaldo=None, mmap=True):
+        valores = np.load(os.path.join(ruta, 'valores.npy'), mmap_mode='r' if mmap else None).view(np.ndarray)
+        with np.load(os.path.join(ruta, 'celdas.npz')) as archivo:
+            formulario = archivo['formulario']
+            puntos = [archivo[f'puntos_{j}'] for j in range(len(formulario))]
+            cortes = [archivo[f'cortes_{j}'] for j in range(len(formulario))]
+        fidelidad = None
+        if os.path.isfile(os.path.join(ruta, 'fidelidad.json')):
+            with open(os.path.join(ruta, 'fidelidad.json'), encoding='utf-8') as archivo:
+                fidelidad = json.load(archivo)
+        return cls(valores, puntos, cortes, formulario, respaldo, fidelidad)
+
+    def guardar(self, ruta):
+        np.savez(os.path.join(ruta, 'celdas.npz'),
+                 formulario=np.column_stack([self.minimos, self.maximos, self.pasos]),
+                 **{f'puntos_{j}': p for j, p in enumerate(self.puntos)},
+                 **{f'cortes_{j}': c for j, c in enumerate(self.cortes)})
+
+    def dentro(self, X):
+        """Filas dentro del rango y sobre los pasos del formulario"""
+        pasos = (X - self.minimos) / self.pasos
+        return np.all((X >= self.minimos) & (X <= self.maximos) & (np.abs(pasos - np.rint(pasos)) < 1e-6), axis=1)
+
+    def buscar(self, X):
+        """Valor de la celda de cada fila (filas dentro de la rejilla)"""
+        X = np.asarray(X, dtype=np.float64)
+        posiciones = np.zeros(len(X), dtype=np.int64)
+        for j, (cortes, salto) in enumerate(zip(self.cortes, self.saltos)):
+            posiciones += np.searchsorted(cortes, X[:, j], side='right') * salto
+        return self.valores[posiciones].astype(np.float64)
+
+    def predecir(self, features):
+        """Predice una matriz (n, 8) de features sin escalar"""
+        X = np.asarray(features, dtype=np.float64)
+        adentro = self.dentro(X)
+        if adentro.all() or self.respaldo is None:
+            return self.buscar(X)
+        prediccion = np.empty(len(X))
+        if adentro.any():
+            prediccion[adentro] = self.buscar(X[adentro])
+        prediccion[~adentro] = self.respaldo(X[~adentro])
+        return prediccion
+
+
+def construir_version(version, bloque=200000):
+    """Arma <version>/tabla/ con la rejilla del bosque de esa versión y su informe de error.
+    Si el error máximo medido pasa de ERROR_MAXIMO, la tabla no se publica."""
+    import joblib
+    from registro_modelos import ruta_version, cargar_version
+
+    destino = ruta_version(version)
+    bosque = cargar_version(version)['bosque']
+    try:
+        # scikit-learn en paralelo es varias veces más rápido que el bosque NumPy para lotes grandes
+        model = joblib.load(os.path.join(destino, 'beer_model.pkl'))
+        scaler = joblib.load(os.path.join(destino, 'scaler.pkl'))
+        model.set_params(n_jobs=-1)
+
+        def predecir(X):
+            with warnings.catch_warnings():
+                warnings.filterwarnings('ignore', message='X does not have valid feature names')
+                return model.predict(scaler.transform(X))
+    except FileNotFoundError:
+        predecir = bosque.predecir
+
+    inicio = time.perf_counter()
+    valores, inicios, efectos = celdas_del_bosque(bosque)
+    # La resolución se elige sobre una muestra y el error se informa sobre otra
+    tolerancia = elegir_tolerancia(bosque, valores, inicios, efectos, ERROR_MAXIMO / 2,
+                                   muestras_formulario(semilla=1))
+    puntos, cortes = agrupar_celdas(valores, inicios, efectos, tolerancia)
+
+    temporal = os.path.join(destino, 'tabla.tmp')
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+    construir_tabla(predecir, puntos, os.path.join(temporal, 'valores.npy'), bloque)
+    segundos = time.perf_counter() - inicio
+
+    formulario = np.array(list(EJES_TABLA.values()), dtype=np.float64)
+    tabla = TablaPrediccion(np.load(os.path.join(temporal, 'valores.npy'), mmap_mode='r').view(np.ndarray),
+                            puntos, cortes, formulario)
+    tabla.guardar(temporal)
+    fidelidad = dict(
+        medir_error(tabla, bosque.predecir, muestras_formulario()),
+        tolerancia=round(float(tolerancia), 5),
+        puntos=int(tabla.valores.size),
+        puntos_por_eje=dict(zip(EJES_TABLA, (len(p) for p in puntos))),
+        megabytes=round(tabla.valores.nbytes / 1024 / 1024, 2),
+        segundos_construccion=round(segundos, 1),
+    )
+    del tabla
+    if not error_aceptable(fidelidad):
+        shutil.rmtree(temporal, ignore_errors=True)
+        return dict(fidelidad, publicada=False)
+    with open(os.path.join(temporal, 'fidelidad.json'), 'w', encoding='utf-8') as archivo:
+        json.dump(fidelidad, archivo, indent=2, ensure_ascii=False)
+
+    ruta = os.path.join(destino, 'tabla')
+    shutil.rmtree(ruta, ignore_errors=True)
+    os.rename(temporal, ruta)
+    return dict(fidelidad, publicada=True)
+
+
+if __name__ == '__main__':
+    from registro_modelos import version_actual
+
+    if len(sys.argv) not in (2, 3) or sys.argv[1] != 'construir':
+        raise SystemExit(__doc__)
+
+    version = sys.argv[2] if len(sys.argv) == 3 else version_actual()
+    if not version:
+        raise SystemExit("❌ No hay una versión activa (python train_chocobrew_model.py)")
+
+    fidelidad = construir_version(version)
+    print(f"🧮 Tabla de {version}: {fidelidad['puntos']:,} puntos, {fidelidad['megabytes']} MB "
+          f"en {fidelidad['segundos_construccion']}s (tolerancia por frontera {fidelidad['tolerancia']})")
+    print(f"  Puntos por eje: {fidelidad['puntos_por_eje']}")
+    print(f"  Error contra el bosque ({fidelidad['filas']:,} lotes del formulario): "
+          f"MAE {fidelidad['mae']}, p99 {fidelidad['p99']}, máx {fidelidad['maxima']}, "
+          f"misma categoría {fidelidad['misma_categoria']:.1%}")
+    if not fidelidad['publicada']:
+        print(f"⚠️ Error máximo por encima de {ERROR_MAXIMO} (MODEL_TABLE_MAX_ERROR): no se publica")
+    else:
+        print("✓ Publicada; con MODEL_SERVING=tabla los workers la cargan en su próxima verificación "
+              "(MODEL_RELOAD_INTERVAL)")
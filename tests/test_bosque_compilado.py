@@ -0,0 +1,81 @@
+"""Paridad del bosque compilado con scikit-learn"""
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import StandardScaler
+
+from bosque_compilado import BosqueCompilado, aplanar_bosque, verificar_paridad, features_de_prueba
+
+
+def entrenar(X, y, **parametros):
+    scaler = StandardScaler().fit(X)
+    model = RandomForestRegressor(n_estimators=20, random_state=0, **parametros).fit(scaler.transform(X), y)
+    return model, scaler
+
+
+@pytest.fixture(scope='module')
+def datos():
+    rng = np.random.default_rng(0)
+    X = features_de_prueba(800, semilla=1)
+    y = np.clip(2.5 + 0.1 * X[:, 5] - 0.01 * X[:, 1] + 0.05 * X[:, 7] + rng.normal(0, 0.3, len(X)), 0, 5)
+    return X, y
+
+
+@pytest.mark.parametrize('parametros', [{}, {'max_depth': 3}, {'max_depth': 8, 'min_samples_leaf': 5}])
+def test_paridad_con_sklearn(datos, parametros):
+    X, y = datos
+    model, scaler = entrenar(X, y, **parametros)
+    bosque = BosqueCompilado(aplanar_bosque(model, scaler))
+    assert verificar_paridad(model, scaler, bosque, features_de_prueba(3000, semilla=2)) == 0.0
+
+
+def test_paridad_justo_sobre_los_umbrales(datos):
+    X, y = datos
+    model, scaler = entrenar(X, y)
+    # Sin escalado, la entrada puede caer exactamente sobre cada umbral
+    scaler.mean_[:] = 0.0
+    scaler.scale_[:] = 1.0
+    bosque = BosqueCompilado(aplanar_bosque(model, scaler))
+
+    internos = bosque.threshold != np.inf
+    umbrales, variables = bosque.threshold[internos], bosque.feature[internos]
+    redondeados = umbrales.astype(np.float32)
+    filas = []
+    for valores in (umbrales, redondeados.astype(np.float64),
+                    np.nextafter(redondeados, np.float32(np.inf)).astype(np.float64),
+                    np.nextafter(redondeados, np.float32(-np.inf)).astype(np.float64)):
+        F = np.tile(X.mean(axis=0), (len(valores), 1))
+        F[np.arange(len(valores)), variables] = valores
+        filas.append(F)
+    F = np.concatenate(filas)
+
+    esperado = model.predict(scaler.transform(F))
+    np.testing.assert_array_equal(bosque.predecir(F), esperado)
+
+
+def test_lote_vacio_y_bloques(datos):
+    X, y = datos
+    model, scaler = entrenar(X, y)
+    bosque = BosqueCompilado(aplanar_bosque(model, scaler))
+    assert bosque.predecir(np.empty((0, 8))).shape == (0,)
+    # Más de un bloque de filas, con un bloque final incompleto
+    F = features_de_prueba(1000, semilla=3)
+    np.testing.assert_array_equal(bosque.predecir(F), np.concatenate([bosque.predecir(F[:300]), bosque.predecir(F[300:])]))
+
+
+def test_celdas_agrupan_valores_con_la_misma_prediccion(datos):
+    X, y = datos
+    model, scaler = entrenar(X, y)
+    bosque = BosqueCompilado(aplanar_bosque(model, scaler))
+    base = features_de_prueba(50, semilla=4)
+    valores = np.linspace(5, 90, 400)
+    celdas = bosque.celdas(1, valores)
+    for celda in np.unique(celdas)[:20]:
+        mismos = valores[celdas == celda]
+        predicciones = []
+        for valor in mismos[[0, -1]]:
+            F = base.copy()
+            F[:, 1] = valor
+            predicciones.append(bosque.predecir(F))
+        np.testing.assert_array_equal(*predicciones)
@@ -0,0 +1,68 @@
+"""Caché LRU: expulsión por tamaño, expiración por TTL y contadores"""
+
+import cache_lru
+from cache_lru import CacheLRU
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def monotonic(self):
+        return self.ahora
+
+
+def test_expulsa_la_menos_usada():
+    cache = CacheLRU(max_entradas=2)
+    cache.guardar('a', 1)
+    cache.guardar('b', 2)
+    assert cache.obtener('a') == 1          # 'b' pasa a ser la menos usada
+    cache.guardar('c', 3)
+    assert cache.obtener('b') is None
+    assert (cache.obtener('a'), cache.obtener('c')) == (1, 3)
+    assert cache.estadisticas()['entradas'] == 2
+
+
+def test_guardar_de_nuevo_actualiza_sin_crecer():
+    cache = CacheLRU(max_entradas=2)
+    cache.guardar('a', 1)
+    cache.guardar('a', 2)
+    assert cache.obtener('a') == 2
+    assert cache.estadisticas()['entradas'] == 1
+
+
+def test_expira_por_ttl(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(cache_lru.time, 'monotonic', reloj.monotonic)
+    cache = CacheLRU(max_entradas=10, ttl=5)
+    cache.guardar('a', 1)
+    reloj.ahora += 4.9
+    assert cache.obtener('a') == 1
+    # Un acierto no renueva la expiración
+    reloj.ahora += 0.2
+    assert cache.obtener('a', 'nada') == 'nada'
+    assert cache.estadisticas()['entradas'] == 0
+
+
+def test_guardar_renueva_el_ttl(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(cache_lru.time, 'monotonic', reloj.monotonic)
+    cache = CacheLRU(max_entradas=10, ttl=5)
+    cache.guardar('a', 1)
+    reloj.ahora += 4
+    cache.guardar('a', 1)
+    reloj.ahora += 4
+    assert cache.obtener('a') == 1
+
+
+def test_contadores_y_desactivada():
+    cache = CacheLRU(max_entradas=4)
+    cache.obtener('a')
+    cache.guardar('a', 1)
+    cache.obtener('a')
+    assert cache.estadisticas()['tasa_aciertos'] == 0.5
+
+    apagada = CacheLRU(max_entradas=0)
+    apagada.guardar('a', 1)
+    assert apagada.obtener('a') is None
+    assert apagada.estadisticas()['entradas'] == 0
@@ -0,0 +1,101 @@
+"""Pool de conexiones: límite de tamaño, reutilización y recreación tras un fork"""
+
+import os
+
+import pytest
+
+import db
+from db import PoolConexiones, PoolAgotado
+
+pytestmark = pytest.mark.skipif(not db.POSTGRES_AVAILABLE, reason="psycopg2 no instalado")
+
+
+class ConexionFalsa:
+    """Lo que el pool usa de una conexión psycopg2"""
+
+    class Info:
+        transaction_status = 0      # TRANSACTION_STATUS_IDLE
+
+    def __init__(self):
+        self.closed = 0
+        self.info = self.Info()
+        self.rollbacks = 0
+
+    def close(self):
+        self.closed = 1
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = 0
+
+
+@pytest.fixture
+def conexiones(monkeypatch):
+    creadas = []
+
+    def conectar(dsn, cursor_factory=None):
+        creadas.append(ConexionFalsa())
+        return creadas[-1]
+
+    monkeypatch.setattr(db.psycopg2, 'connect', conectar)
+    return creadas
+
+
+def test_no_supera_el_maximo(conexiones):
+    pool = PoolConexiones('postgresql://prueba', max_conexiones=2, timeout=0.05)
+    primera, segunda = pool.obtener(), pool.obtener()
+    with pytest.raises(PoolAgotado):
+        pool.obtener()
+    assert pool.estadisticas()['en_uso'] == 2
+    assert pool.agotadas == 1
+
+    pool.devolver(primera)
+    assert pool.obtener() is primera
+    assert len(conexiones) == 2
+    pool.devolver(segunda)
+    assert pool.estadisticas()['libres'] == 1
+
+
+def test_devolver_cierra_la_transaccion_y_descarta(conexiones):
+    pool = PoolConexiones('postgresql://prueba', max_conexiones=1, timeout=0.05)
+    connection = pool.obtener()
+    connection.info.transaction_status = 2      # INTRANS
+    pool.devolver(connection)
+    assert connection.rollbacks == 1
+
+    connection = pool.obtener()
+    pool.devolver(connection, descartar=True)
+    assert connection.closed
+    estadisticas = pool.estadisticas()
+    assert (estadisticas['libres'], estadisticas['en_uso'], estadisticas['descartadas']) == (0, 0, 1)
+    # La conexión descartada libera su lugar
+    assert pool.obtener() is not connection
+
+
+def test_descarta_conexiones_viejas(conexiones):
+    pool = PoolConexiones('postgresql://prueba', max_conexiones=1, timeout=0.05, vida_maxima=0)
+    connection = pool.obtener()
+    pool.devolver(connection)
+    assert pool.obtener() is not connection
+    assert connection.closed
+
+
+def test_un_pool_por_proceso(conexiones, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'postgresql://prueba')
+    monkeypatch.setattr(db, '_pool', None)
+    pool = db.obtener_pool()
+    assert db.obtener_pool() is pool
+    pool.devolver(pool.obtener())
+
+    lectura, escritura = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Proceso hijo (worker de gunicorn): pool nuevo, sin las conexiones del padre
+        hijo = db.obtener_pool()
+        correcto = hijo is not pool and hijo.pid == os.getpid() and not hijo.estadisticas()['libres']
+        os.write(escritura, b'1' if correcto else b'0')
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(lectura, 1) == b'1'
+    assert db.obtener_pool() is pool
+    assert pool.estadisticas()['libres'] == 1
@@ -0,0 +1,95 @@
+"""Contrato de /importar-lotes: las filas inválidas vuelven en "errores" con su
+número de fila y las válidas se importan igual"""
+
+import io
+import os
+import uuid
+
+import pytest
+
+import app as aplicacion
+
+BASE = dict(fecha_elaboracion='2025-01-10', abv=6.5, ibu=30, srm=22, og=1.060, fg=1.012,
+            porcentaje_cacao=8, dias_fermentacion=7, dias_maduracion=12)
+
+
+@pytest.fixture
+def guardados(monkeypatch):
+    """Reemplaza el INSERT: guarda en una lista y simula ON CONFLICT con 'EXISTE'"""
+    filas = []
+
+    def guardar_lotes_en_bd(lotes, user_id):
+        filas.extend(lotes)
+        return {lote['codigo_lote']: 100 + i for i, lote in enumerate(lotes) if lote['codigo_lote'] != 'EXISTE'}
+
+    monkeypatch.setattr(aplicacion, 'guardar_lotes_en_bd', guardar_lotes_en_bd)
+    return filas
+
+
+@pytest.fixture
+def cliente():
+    cliente = aplicacion.app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['user_id'] = 1
+    return cliente
+
+
+def test_filas_invalidas_con_su_numero(cliente, guardados):
+    filas = [
+        dict(BASE, codigo_lote='OK-1'),
+        dict(BASE, codigo_lote='X' * 60),
+        dict(BASE, codigo_lote='ABV', abv=150),
+        dict(BASE, codigo_lote='NAN', abv='nan'),
+        dict(BASE, codigo_lote='DIAS', dias_maduracion=10 ** 12),
+        dict(BASE, codigo_lote='OG', og=50, fg=1.0),
+        dict(BASE, codigo_lote='FG', fg=1.070),
+        dict(BASE, codigo_lote='FECHA', fecha_elaboracion='2025-13-01'),
+        dict(BASE, codigo_lote='OK-1'),
+        dict(BASE, codigo_lote='EXISTE'),
+        dict(BASE, codigo_lote='OK-2'),
+        'no es un lote',
+    ]
+    respuesta = cliente.post('/importar-lotes', json=filas)
+    assert respuesta.status_code == 200
+    cuerpo = respuesta.get_json()
+
+    assert cuerpo['total'] == len(filas)
+    assert [(lote['fila'], lote['codigo_lote']) for lote in cuerpo['lotes']] == [(1, 'OK-1'), (11, 'OK-2')]
+    assert cuerpo['importados'] == 2
+    assert [error['fila'] for error in cuerpo['errores']] == [2, 3, 4, 5, 6, 7, 8, 9, 10, 12]
+    assert all(error['error'] for error in cuerpo['errores'])
+    # Al INSERT solo llegan filas válidas
+    assert [lote['codigo_lote'] for lote in guardados] == ['OK-1', 'EXISTE', 'OK-2']
+
+
+def test_csv_y_ninguna_valida(cliente, guardados):
+    csv = "codigo_lote,fecha_elaboracion,abv,ibu,srm,og,fg,porcentaje_cacao,dias_fermentacion,dias_maduracion\n" \
+          "A,2025-01-10,inf,30,22,1.060,1.012,8,7,12\n"
+    respuesta = cliente.post('/importar-lotes', data={'archivo': (io.BytesIO(csv.encode()), 'lotes.csv')},
+                             content_type='multipart/form-data')
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()['errores'] == [{'fila': 1, 'codigo_lote': 'A', 'error': 'abv debe ser un número finito'}]
+    assert guardados == []
+
+
+@pytest.mark.skipif(not os.environ.get('TEST_DATABASE_URL'),
+                    reason="TEST_DATABASE_URL no configurado (PostgreSQL con las migraciones aplicadas)")
+def test_contra_postgresql(monkeypatch):
+    import db
+    monkeypatch.setenv('DATABASE_URL', os.environ['TEST_DATABASE_URL'])
+    monkeypatch.setattr(db, '_pool', None)
+    cliente = aplicacion.app.test_client()
+    email = f"prueba-{uuid.uuid4().hex[:8]}@chocobrew.test"
+    cliente.post('/register', data=dict(nombre='Prueba', email=email, password='secreta1', confirm_password='secreta1'))
+    cliente.post('/login', data=dict(email=email, password='secreta1'))
+
+    codigo = f"T-{uuid.uuid4().hex[:8]}"
+    filas = [dict(BASE, codigo_lote=codigo), dict(BASE, codigo_lote='X' * 60),
+             dict(BASE, codigo_lote=f"{codigo}-A", abv=150), dict(BASE, codigo_lote=f"{codigo}-N", abv='nan')]
+    cuerpo = cliente.post('/importar-lotes', json=filas).get_json()
+    assert [lote['codigo_lote'] for lote in cuerpo['lotes']] == [codigo]
+    assert [error['fila'] for error in cuerpo['errores']] == [2, 3, 4]
+
+    # Repetir el archivo: la fila válida ya existe y vuelve como error, no como 503
+    cuerpo = cliente.post('/importar-lotes', json=filas[:1]).get_json()
+    assert cuerpo['errores'] == [{'fila': 1, 'codigo_lote': codigo, 'error': 'El código de lote ya existe'}]
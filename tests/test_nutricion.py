@@ -0,0 +1,25 @@
+"""La tabla nutricional por columnas coincide con la escalar"""
+
+import numpy as np
+import pytest
+
+from nutricion import calcular_tabla_nutricional, calcular_tabla_nutricional_columnas
+
+
+@pytest.mark.parametrize('semilla', range(3))
+def test_columnas_igual_a_escalar(semilla):
+    rng = np.random.default_rng(semilla)
+    n = 2000
+    abv = np.round(rng.uniform(0, 15, n), 1)
+    porcentaje_cacao = np.round(rng.uniform(0, 20, n) * 2) / 2
+    og = np.round(rng.uniform(1.0, 1.12, n), 3)
+
+    columnas = calcular_tabla_nutricional_columnas(abv, porcentaje_cacao, og)
+    for i in range(n):
+        escalar = calcular_tabla_nutricional(float(abv[i]), float(porcentaje_cacao[i]), float(og[i]))
+        assert {clave: valores[i].item() for clave, valores in columnas.items()} == escalar
+
+
+def test_columnas_vacias():
+    columnas = calcular_tabla_nutricional_columnas([], [], [])
+    assert all(len(valores) == 0 for valores in columnas.values())
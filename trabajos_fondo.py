@@ -0,0 +1,74 @@
+"""
+Trabajos en segundo plano - CHOCOBREW
+Pool local de hilos (sin broker externo) con una clave por trabajo: si
+alguien pide un resultado que ya está en cola o en curso, espera ese mismo
+Future en lugar de repetir el trabajo.
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ColaTrabajos:
+    """Trabajos deduplicados por clave sobre un ThreadPoolExecutor por proceso"""
+
+    def __init__(self, max_hilos=2, nombre='trabajos'):
+        self.max_hilos = max_hilos
+        self.nombre = nombre
+        self.encolados = 0
+        self.fallidos = 0
+        self._pendientes = {}       # clave -> Future
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def activa(self):
+        return self.max_hilos > 0
+
+    def _obtener_executor(self):
+        """Crea el pool en el proceso actual (los hilos no sobreviven al fork)"""
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_hilos, thread_name_prefix=self.nombre)
+            self._pendientes = {}
+            self._pid = os.getpid()
+        return self._executor
+
+    def encolar(self, clave, funcion, *args):
+        """Programa funcion(*args) si no hay un trabajo pendiente con la misma clave"""
+        with self._lock:
+            futuro = self._pendientes.get(clave) if self._pid == os.getpid() else None
+            if futuro is not None:
+                return futuro
+            futuro = self._obtener_executor().submit(funcion, *args)
+            self._pendientes[clave] = futuro
+            self.encolados += 1
+        futuro.add_done_callback(lambda f: self._terminar(clave, f))
+        return futuro
+
+    def pendiente(self, clave):
+        """Future del trabajo en cola o en curso (None si no hay)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return None
+            return self._pendientes.get(clave)
+
+    def _terminar(self, clave, futuro):
+        with self._lock:
+            if self._pendientes.get(clave) is futuro:
+                del self._pendientes[clave]
+        if not futuro.cancelled() and futuro.exception() is not None:
+            self.fallidos += 1
+            logger.error(f"Error en trabajo {self.nombre} {clave}: {futuro.exception()}")
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'pendientes': len(self._pendientes) if self._pid == os.getpid() else 0,
+                'encolados': self.encolados,
+                'fallidos': self.fallidos,
+            }
@@ -2,159 +2,410 @@
 Modelo ML para predecir calidad de cerveza artesanal de cacao (CHOCOBREW)
 Adaptado para dataset beers.csv de Kaggle
 Autor: Juan Sebastián Bustos Ruiz
+
+Uso:
+    python train_chocobrew_model.py [--datos Datasets/beers.csv] [--semilla 42]
+                                    [--n-jobs -1] [--folds 5] [--sin-cache]
+                                    [--sin-graficos | --guardar-grafico RUTA]
+                                    [--no-publicar] [--parametros JSON]
+                                    [--sin-sustituto]
+
+Las variables derivadas se guardan en FEATURE_CACHE_DIR (un .npz con un
+arreglo por columna) bajo una clave hecha con el hash del CSV, la semilla
+y VERSION_FEATURES: con el mismo dataset y semilla la siguiente corrida
+no vuelve a leer el CSV ni a generar las columnas sintéticas.
 """
 
-import pandas as pd
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tracemalloc
+from contextlib import contextmanager
+
 import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import train_test_split, KFold
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import r2_score, mean_absolute_error, mean_squared_error
-import joblib
-import os
+
+from bosque_compilado import aplanar_bosque, BosqueCompilado, verificar_paridad
+from registro_modelos import publicar_version
+from sustituto import Sustituto, destilar, informe_fidelidad, muestras_destilacion, aceptable, CONCORDANCIA_MINIMA
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
 
 # ==============================
 # CONFIGURACIÓN INICIAL
 # ==============================
-os.makedirs('model', exist_ok=True)
-print("=" * 70)
-print("ENTRENAMIENTO MODELO ML - CHOCOBREW (Adaptado a beers.csv)")
-print("=" * 70)
+RUTA_DATOS = "Datasets/beers.csv"
+FEATURE_CACHE_DIR = os.environ.get('FEATURE_CACHE_DIR', 'Datasets/.cache')
 
-# ==============================
-# 1️⃣ CARGA DE DATOS
-# ==============================
-# Ruta actualizada según tu estructura de carpetas
-file_path = "Datasets/beers.csv"
-df = pd.read_csv(file_path)
+# Cambiar si cambia la forma de generar las variables (invalida el caché)
+VERSION_FEATURES = '1'
 
-# Limpieza de nombres de columnas por si hay caracteres ocultos
-df.columns = df.columns.str.strip().str.lower()
+FEATURE_COLUMNS = [
+    "abv", "ibu", "SRM", "OG", "FG",
+    "Porcentaje_Cacao", "Dias_Fermentacion", "Dias_Maduracion"
+]
+OBJETIVO = "Puntuacion"
 
-print(f"\n📊 Dataset cargado desde: {file_path}")
-print(f"📋 Total filas: {df.shape[0]} | Columnas: {list(df.columns)}")
+PARAMETROS_MODELO = {
+    'n_estimators': 200,
+    'max_depth': 14,
+    'min_samples_split': 4,
+    'min_samples_leaf': 2,
+}
 
 # ==============================
-# 2️⃣ LIMPIEZA Y VARIABLES ÚTILES
+# ⏱️ TIEMPO Y MEMORIA POR ETAPA
 # ==============================
-# Eliminamos filas sin datos críticos
-df = df.dropna(subset=['abv', 'ibu'])
-df = df[df['ibu'] > 0]
+ETAPAS = []
 
-# ==============================
-# 3️⃣ CREACIÓN DE VARIABLES SINTÉTICAS
-# ==============================
-np.random.seed(42)
 
-# SRM (color) — simulación basada en estilos de cerveza
-df["SRM"] = np.clip(np.random.normal(22, 4, len(df)), 10, 35)
+def _rss_maximo_mb():
+    """Pico de memoria residente del proceso (y de sus hijos) en MB"""
+    if resource is None:
+        return None
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024     # bytes en macOS, KB en Linux
+    propio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    hijos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(propio, hijos) / divisor, 1)
 
-# OG y FG — densidades
-df["OG"] = np.round(np.random.uniform(1.050, 1.075, len(df)), 3)
-df["FG"] = np.round(df["OG"] - np.random.uniform(0.010, 0.020, len(df)), 3)
 
-# Porcentaje de Cacao — variable sintética clave
-df["Porcentaje_Cacao"] = np.clip(np.random.beta(5, 2, len(df)) * 13 + 2, 2, 15)
+@contextmanager
+def etapa(nombre):
+    """Registra duración y pico de memoria asignada (tracemalloc) de un bloque"""
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        pico = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+        ETAPAS.append({
+            'etapa': nombre,
+            'segundos': round(time.perf_counter() - inicio, 3),
+            'pico_mb': round(pico / (1024 * 1024), 1),
+            'rss_max_mb': _rss_maximo_mb(),
+        })
 
-# Fermentación y maduración
-df["Dias_Fermentacion"] = np.random.randint(5, 12, len(df))
-df["Dias_Maduracion"] = np.random.randint(8, 18, len(df))
 
-# ==============================
-# 4️⃣ VARIABLE OBJETIVO (PUNTUACIÓN)
-# ==============================
-df["Puntuacion"] = (
-    2.2 +
-    (df["Porcentaje_Cacao"] - 5) * 0.20 +
-    (df["abv"] * 100 - 6) * 0.10 +
-    -abs(df["ibu"] - 35) * 0.012 +
-    (df["Dias_Maduracion"] - 8) * 0.08 +
-    (df["Dias_Fermentacion"] - 5) * 0.05 +
-    -abs(df["SRM"] - 22) * 0.03 +
-    np.random.normal(0, 0.35, len(df))
-)
-df["Puntuacion"] = np.clip(df["Puntuacion"], 0, 5)
+def imprimir_etapas():
+    print("\n⏱️ TIEMPO Y MEMORIA POR ETAPA:")
+    print(f"  {'Etapa':<22}{'Segundos':>10}{'Pico MB':>10}{'RSS máx MB':>12}")
+    for registro in ETAPAS:
+        rss = registro['rss_max_mb'] if registro['rss_max_mb'] is not None else '-'
+        print(f"  {registro['etapa']:<22}{registro['segundos']:>10.3f}{registro['pico_mb']:>10.1f}{rss:>12}")
+    print(f"  {'Total':<22}{sum(r['segundos'] for r in ETAPAS):>10.3f}")
 
 # ==============================
-# 5️⃣ SELECCIÓN DE VARIABLES
+# 1️⃣ CARGA DE DATOS Y VARIABLES (con caché)
 # ==============================
-feature_columns = [
-    "abv", "ibu", "SRM", "OG", "FG",
-    "Porcentaje_Cacao", "Dias_Fermentacion", "Dias_Maduracion"
-]
-X = df[feature_columns]
-y = df["Puntuacion"]
+def hash_archivo(ruta):
+    resumen = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 20), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
 
-# ==============================
-# 6️⃣ DIVISIÓN DE DATOS
-# ==============================
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
 
-# Normalización
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
+def ruta_cache_features(ruta_datos, semilla):
+    clave = hashlib.sha256(f"{hash_archivo(ruta_datos)}:{semilla}:{VERSION_FEATURES}".encode()).hexdigest()[:16]
+    return os.path.join(FEATURE_CACHE_DIR, f"features_{clave}.npz")
 
-# ==============================
-# 7️⃣ ENTRENAMIENTO DEL MODELO
-# ==============================
-print("\n🧠 Entrenando modelo Random Forest...")
-model = RandomForestRegressor(
-    n_estimators=200,
-    max_depth=14,
-    min_samples_split=4,
-    min_samples_leaf=2,
-    random_state=42,
-    n_jobs=-1
-)
-model.fit(X_train_scaled, y_train)
-print("✓ Modelo entrenado con éxito")
 
-# ==============================
-# 8️⃣ EVALUACIÓN
-# ==============================
-y_pred = model.predict(X_test_scaled)
+def construir_features(ruta_datos, semilla):
+    """Lee el CSV, limpia y genera las variables sintéticas y la puntuación"""
+    df = pd.read_csv(ruta_datos)
 
-r2 = r2_score(y_test, y_pred)
-mae = mean_absolute_error(y_test, y_pred)
-rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+    # Limpieza de nombres de columnas por si hay caracteres ocultos
+    df.columns = df.columns.str.strip().str.lower()
+    print(f"📋 Total filas: {df.shape[0]} | Columnas: {list(df.columns)}")
 
-print("\n📊 RESULTADOS DE EVALUACIÓN:")
-print(f"  R² Score: {r2:.3f}")
-print(f"  MAE: {mae:.3f}")
-print(f"  RMSE: {rmse:.3f}")
+    # Eliminamos filas sin datos críticos
+    df = df.dropna(subset=['abv', 'ibu'])
+    df = df[df['ibu'] > 0]
 
-# Validación cruzada
-cv_scores = cross_val_score(model, X_train_scaled, y_train, cv=5, scoring='r2', n_jobs=-1)
-print(f"\n🔄 Validación cruzada (5-fold): R² promedio = {cv_scores.mean():.3f} (+/- {cv_scores.std() * 2:.3f})")
+    # Generador propio: mismo orden de sorteos que np.random.seed(semilla)
+    rng = np.random.RandomState(semilla)
 
-# ==============================
-# 9️⃣ IMPORTANCIA DE VARIABLES
-# ==============================
-feature_importance = pd.DataFrame({
-    'Feature': feature_columns,
-    'Importance': model.feature_importances_
-}).sort_values('Importance', ascending=False)
-print("\n⭐ IMPORTANCIA DE VARIABLES:")
-print(feature_importance)
+    # SRM (color) — simulación basada en estilos de cerveza
+    df["SRM"] = np.clip(rng.normal(22, 4, len(df)), 10, 35)
+
+    # OG y FG — densidades
+    df["OG"] = np.round(rng.uniform(1.050, 1.075, len(df)), 3)
+    df["FG"] = np.round(df["OG"] - rng.uniform(0.010, 0.020, len(df)), 3)
+
+    # Porcentaje de Cacao — variable sintética clave
+    df["Porcentaje_Cacao"] = np.clip(rng.beta(5, 2, len(df)) * 13 + 2, 2, 15)
+
+    # Fermentación y maduración
+    df["Dias_Fermentacion"] = rng.randint(5, 12, len(df))
+    df["Dias_Maduracion"] = rng.randint(8, 18, len(df))
+
+    # Variable objetivo (puntuación)
+    df[OBJETIVO] = (
+        2.2 +
+        (df["Porcentaje_Cacao"] - 5) * 0.20 +
+        (df["abv"] * 100 - 6) * 0.10 +
+        -abs(df["ibu"] - 35) * 0.012 +
+        (df["Dias_Maduracion"] - 8) * 0.08 +
+        (df["Dias_Fermentacion"] - 5) * 0.05 +
+        -abs(df["SRM"] - 22) * 0.03 +
+        rng.normal(0, 0.35, len(df))
+    )
+    df[OBJETIVO] = np.clip(df[OBJETIVO], 0, 5)
+
+    return df[FEATURE_COLUMNS + [OBJETIVO]].reset_index(drop=True)
+
+
+def guardar_features(df, ruta):
+    """Un arreglo por columna en un .npz (escritura atómica)"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'wb') as archivo:
+        np.savez(archivo, **{columna: df[columna].to_numpy() for columna in df.columns})
+    os.replace(temporal, ruta)
+
+
+def leer_features(ruta):
+    with np.load(ruta) as columnas:
+        return pd.DataFrame({columna: columnas[columna] for columna in FEATURE_COLUMNS + [OBJETIVO]})
+
+
+def cargar_features(ruta_datos=RUTA_DATOS, semilla=42, usar_cache=True):
+    """DataFrame de variables + objetivo, desde el caché si existe para este CSV y semilla"""
+    ruta = ruta_cache_features(ruta_datos, semilla)
+    if usar_cache and os.path.isfile(ruta):
+        print(f"\n📦 Variables leídas del caché: {ruta}")
+        return leer_features(ruta)
+
+    print(f"\n📊 Dataset cargado desde: {ruta_datos}")
+    df = construir_features(ruta_datos, semilla)
+    if usar_cache:
+        guardar_features(df, ruta)
+        print(f"💾 Variables guardadas en caché: {ruta}")
+    return df
 
 # ==============================
-# 🔟 GUARDAR MODELO
+# 2️⃣ ENTRENAMIENTO Y VALIDACIÓN EN PARALELO
 # ==============================
-joblib.dump(model, 'model/beer_model.pkl')
-joblib.dump(scaler, 'model/scaler.pkl')
-print("\n💾 Modelo y scaler guardados correctamente en la carpeta 'model/'")
+def _ajustar(modelo, X, y, entrenamiento=None, validacion=None):
+    """Entrena un clon; con validación devuelve su R², si no el modelo entrenado"""
+    modelo = clone(modelo)
+    if entrenamiento is None:
+        return modelo.fit(X, y)
+    modelo.fit(X[entrenamiento], y[entrenamiento])
+    return r2_score(y[validacion], modelo.predict(X[validacion]))
+
+
+def entrenar_con_validacion(modelo, X, y, folds=5, n_jobs=-1):
+    """Folds de validación cruzada y ajuste final en el mismo pool de hilos
+
+    Los árboles de scikit-learn liberan el GIL, así que los hilos bastan y
+    el modelo final no se copia entre procesos. Los núcleos se reparten
+    entre las tareas para no sobresuscribir la máquina.
+    """
+    nucleos = effective_n_jobs(n_jobs)
+    tareas = [(None, None)] + list(KFold(n_splits=folds).split(X)) if folds > 1 else [(None, None)]
+    modelo = clone(modelo).set_params(n_jobs=max(1, nucleos // len(tareas)))
+
+    resultados = Parallel(n_jobs=min(nucleos, len(tareas)), prefer='threads')(
+        delayed(_ajustar)(modelo, X, y, entrenamiento, validacion)
+        for entrenamiento, validacion in tareas
+    )
+    return resultados[0], np.array(resultados[1:])
+
+def leer_parametros(ruta):
+    """Hiperparámetros desde un JSON: el reporte de busqueda_hiperparametros.py
+    (usa su 'recomendado') o un objeto con los parámetros a cambiar"""
+    with open(ruta, encoding='utf-8') as archivo:
+        datos = json.load(archivo)
+    if 'recomendado' in datos:
+        if datos['recomendado'] is None:
+            raise SystemExit(f"❌ El reporte {ruta} no tiene un modelo recomendado")
+        datos = datos['recomendado']['parametros']
+    return dict(PARAMETROS_MODELO, **datos)
 
 # ==============================
 # 🔍 OPCIONAL: VISUALIZAR RESULTADOS
 # ==============================
-import matplotlib.pyplot as plt
-
-plt.scatter(y_test, y_pred, alpha=0.6)
-plt.xlabel("Puntuación Real")
-plt.ylabel("Puntuación Predicha")
-plt.title("Comparación Real vs Predicho - CHOCOBREW Adaptado")
-plt.grid(True)
-plt.show()
+def graficar(y_test, y_pred, guardar_en=None):
+    """Real vs predicho; con guardar_en se escribe un PNG sin abrir ventana"""
+    try:
+        import matplotlib
+        if guardar_en:
+            matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("\n⚠️ matplotlib no está instalado, se omite el gráfico (usa --sin-graficos)")
+        return
+
+    plt.scatter(y_test, y_pred, alpha=0.6)
+    plt.xlabel("Puntuación Real")
+    plt.ylabel("Puntuación Predicha")
+    plt.title("Comparación Real vs Predicho - CHOCOBREW Adaptado")
+    plt.grid(True)
+    if guardar_en:
+        plt.savefig(guardar_en, dpi=120)
+        print(f"\n🖼️ Gráfico guardado en {guardar_en}")
+    else:
+        plt.show()
+
+
+def leer_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Entrenamiento del modelo CHOCOBREW")
+    parser.add_argument('--datos', default=RUTA_DATOS, help="CSV de origen (por defecto %(default)s)")
+    parser.add_argument('--semilla', type=int, default=42, help="semilla de datos sintéticos, división y modelo")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="núcleos para validación y ajuste (-1 = todos)")
+    parser.add_argument('--folds', type=int, default=5, help="folds de validación cruzada (0 para omitirla)")
+    parser.add_argument('--sin-cache', action='store_true', help="regenerar las variables aunque estén en caché")
+    parser.add_argument('--sin-graficos', action='store_true', help="modo headless: no importa matplotlib")
+    parser.add_argument('--guardar-grafico', metavar='RUTA', help="guardar el gráfico en un PNG en vez de mostrarlo")
+    parser.add_argument('--no-publicar', action='store_true', help="entrenar y evaluar sin publicar una versión")
+    parser.add_argument('--parametros', metavar='JSON', help="hiperparámetros (p. ej. el reporte de la búsqueda)")
+    parser.add_argument('--sin-sustituto', action='store_true', help="no destilar el modelo sustituto")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = leer_argumentos(argv)
+    parametros = leer_parametros(args.parametros) if args.parametros else PARAMETROS_MODELO
+    os.makedirs('model', exist_ok=True)
+    tracemalloc.start()
+
+    print("=" * 70)
+    print("ENTRENAMIENTO MODELO ML - CHOCOBREW (Adaptado a beers.csv)")
+    print("=" * 70)
+
+    with etapa('variables'):
+        df = cargar_features(args.datos, args.semilla, usar_cache=not args.sin_cache)
+    print(f"📋 Filas para entrenamiento: {len(df)}")
+
+    # ==============================
+    # 3️⃣ DIVISIÓN DE DATOS Y NORMALIZACIÓN
+    # ==============================
+    with etapa('division'):
+        X = df[FEATURE_COLUMNS]
+        y = df[OBJETIVO]
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=args.semilla
+        )
+        scaler = StandardScaler()
+        X_train_scaled = scaler.fit_transform(X_train)
+        X_test_scaled = scaler.transform(X_test)
+
+    # ==============================
+    # 4️⃣ ENTRENAMIENTO + VALIDACIÓN CRUZADA
+    # ==============================
+    print(f"\n🧠 Entrenando modelo Random Forest ({effective_n_jobs(args.n_jobs)} núcleos, {args.folds} folds en paralelo)...")
+    with etapa('entrenamiento_cv'):
+        model, cv_scores = entrenar_con_validacion(
+            RandomForestRegressor(**parametros, random_state=args.semilla),
+            X_train_scaled, y_train.to_numpy(), folds=args.folds, n_jobs=args.n_jobs
+        )
+        # El modelo publicado predice con todos los núcleos
+        model.set_params(n_jobs=-1)
+    print("✓ Modelo entrenado con éxito")
+
+    # ==============================
+    # 5️⃣ EVALUACIÓN
+    # ==============================
+    with etapa('evaluacion'):
+        y_pred = model.predict(X_test_scaled)
+        r2 = r2_score(y_test, y_pred)
+        mae = mean_absolute_error(y_test, y_pred)
+        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+
+    print("\n📊 RESULTADOS DE EVALUACIÓN:")
+    print(f"  R² Score: {r2:.3f}")
+    print(f"  MAE: {mae:.3f}")
+    print(f"  RMSE: {rmse:.3f}")
+    if len(cv_scores):
+        print(f"\n🔄 Validación cruzada ({len(cv_scores)}-fold): R² promedio = {cv_scores.mean():.3f} (+/- {cv_scores.std() * 2:.3f})")
+
+    # ==============================
+    # 6️⃣ IMPORTANCIA DE VARIABLES
+    # ==============================
+    feature_importance = pd.DataFrame({
+        'Feature': FEATURE_COLUMNS,
+        'Importance': model.feature_importances_
+    }).sort_values('Importance', ascending=False)
+    print("\n⭐ IMPORTANCIA DE VARIABLES:")
+    print(feature_importance)
+
+    # ==============================
+    # 7️⃣ COMPILAR BOSQUE
+    # ==============================
+    with etapa('compilacion'):
+        # Verificar el bosque compilado antes de publicar la versión
+        bosque = BosqueCompilado(aplanar_bosque(model, scaler))
+        diferencia = verificar_paridad(model, scaler, bosque, X_test.to_numpy())
+    print(f"\n🌲 Bosque compilado: {bosque.n_arboles} árboles, paridad con scikit-learn = {diferencia:.2e}")
+    if diferencia > 1e-9:
+        raise SystemExit("❌ El bosque compilado no coincide con scikit-learn")
+
+    # ==============================
+    # 8️⃣ DESTILAR SUSTITUTO
+    # ==============================
+    arrays_sustituto = fidelidad = None
+    if not args.sin_sustituto:
+        with etapa('destilacion'):
+            # Muestreo denso del formulario + filas de entrenamiento, etiquetadas por el bosque
+            arrays_sustituto = destilar(bosque, extra=X_train.to_numpy(), semilla=args.semilla)
+            sustituto = Sustituto(arrays_sustituto)
+            y_sustituto = sustituto.predecir(X_test.to_numpy())
+            fidelidad = {
+                'muestreo_denso': informe_fidelidad(sustituto, bosque, muestras_destilacion(20000, args.semilla + 1)),
+                'prueba': informe_fidelidad(sustituto, bosque, X_test.to_numpy()),
+                'r2': round(r2_score(y_test, y_sustituto), 4),
+                'mae': round(mean_absolute_error(y_test, y_sustituto), 4),
+            }
+        denso = fidelidad['muestreo_denso']
+        print(f"\n🧪 Sustituto: {sum(a.nbytes for a in arrays_sustituto.values()) / 1024:.1f} KB, "
+              f"R² {fidelidad['r2']:.3f} / MAE {fidelidad['mae']:.3f} en prueba")
+        print(f"  Diferencia con el bosque (muestreo denso): MAE {denso['mae']}, p99 {denso['p99']}, "
+              f"máx {denso['maxima']}, misma categoría {denso['misma_categoria']:.1%}")
+        if not aceptable(fidelidad):
+            print(f"  ⚠️ Por debajo de {CONCORDANCIA_MINIMA:.0%} de misma categoría "
+                  f"(MODEL_SURROGATE_MIN_AGREEMENT): la app servirá el bosque")
+
+    # ==============================
+    # 9️⃣ PUBLICAR VERSIÓN DEL MODELO
+    # ==============================
+    if not args.no_publicar:
+        with etapa('publicacion'):
+            # Modelo + scaler + bosque + sustituto + metadata se publican juntos como una versión
+            version = publicar_version(model, scaler, {
+                'features': FEATURE_COLUMNS,
+                'parametros': model.get_params(),
+                'semilla': args.semilla,
+                'hash_datos': hash_archivo(args.datos),
+                'r2': round(r2, 4),
+                'mae': round(mae, 4),
+                'rmse': round(rmse, 4),
+                'cv_r2': round(cv_scores.mean(), 4) if len(cv_scores) else None,
+                'filas_entrenamiento': len(X_train),
+                'etapas': ETAPAS,
+                'sustituto': fidelidad,
+            }, sustituto=arrays_sustituto, fidelidad=fidelidad)
+        print(f"💾 Versión {version} publicada en model/versiones/ y marcada como activa")
+
+    tracemalloc.stop()
+    imprimir_etapas()
+
+    if not args.sin_graficos:
+        graficar(y_test, y_pred, args.guardar_grafico)
+
+
+if __name__ == '__main__':
+    main()
@@ -105,7 +105,7 @@ try:
             check('lotes_chocobrew' in tablas, "Tabla 'lotes_chocobrew'")
             check('predicciones' in tablas, "Tabla 'predicciones'")
         else:
-            print(f"{YELLOW}Ejecuta: mysql -u root -p < database.sql{RESET}")
+            print(f"{YELLOW}Ejecuta: python esquema.py aplicar{RESET}")
         
         cursor.close()
         connection.close()
@@ -125,7 +125,8 @@ print("\n[4] VERIFICANDO ESTRUCTURA DE ARCHIVOS")
 archivos_requeridos = [
     'app.py',
     'train_chocobrew_model.py',
-    'database.sql',
+    'esquema.py',
+    'migraciones/0001_esquema_inicial.sql',
     'requirements.txt',
     'templates/base.html',
     'templates/index.html',